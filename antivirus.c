@@ -1,40 +1,548 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <ctype.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <time.h>
 #include <dirent.h>
+#include <sys/mman.h>
 #include <sys/types.h>
 #include <sys/stat.h>
 #include <unistd.h>
+#if defined(__SSE2__)
+#include <emmintrin.h>
+#endif
 
-#define MAX_SIGNATURES 3
 #define MAX_FILENAME 1024  // Increased buffer size to handle long paths and filenames
+#define MAX_NAME 64
+#define MAX_JUMP (64 * 1024)
+#define ATOM_LEN 4
+#define SCAN_WINDOW (4L * 1024 * 1024)      // Bytes per read block where a file is not mapped
+#define MAX_FIRST_BYTES 8                   // Vector prefilter compares up to this many bytes
 
-// Example malware signatures (just simple patterns)
-unsigned char *signatures[MAX_SIGNATURES] = {
-    (unsigned char *)"\x4D\x5A\x90\x00", // Example signature 1: MZ header (Windows executable)
-    (unsigned char *)"\x7F\x45\x4C\x46", // Example signature 2: ELF header (Linux executable)
-    (unsigned char *)"\x50\x4B\x03\x04", // Example signature 3: ZIP header
-};
+/*
+ * Byte-pattern rules, in the syntax byte_rules.py reads:
+ *
+ *     name: 4D 5A ?? 0? [4-16] ( 0d 0a | 0a ) @0-1024
+ *
+ * Each rule compiles to a small program for a backtracking matcher.  The
+ * rule's best literal run of up to ATOM_LEN bytes (its atom) goes into a
+ * 64K-entry bitmap indexed by its first two bytes; a file is scanned once
+ * for bitmap hits and only the rules whose atom is really there are run.
+ * The bitmap is only consulted where a byte that starts some atom occurs;
+ * those are found with memchr when there is one such byte and 16 bytes at
+ * a time with SSE2 when there are a few.
+ *
+ * Regular files are mapped (no copy through a read buffer); pipes, devices
+ * and files that cannot be mapped are read instead, in SCAN_WINDOW blocks
+ * that overlap by the longest match a rule allows, so memory stays fixed
+ * and every byte of a stream is scanned.
+ */
+enum { OP_BYTE, OP_RANGE, OP_SPLIT, OP_JMP, OP_MATCH };
 
-// Function to scan a file for malicious signatures
-int scan_file(FILE *file) {
-    unsigned char buffer[1024];
-    size_t bytesRead;
-    int found = 0;
+typedef struct {
+    int op;
+    unsigned char value, mask;  // OP_BYTE: (byte & mask) == value
+    long x, y;                  // OP_RANGE: skip x..y bytes; OP_SPLIT: try x then y; OP_JMP: x
+} Inst;
+
+typedef struct {
+    char name[MAX_NAME];
+    Inst *prog;
+    int len, cap;
+    unsigned char atom[ATOM_LEN];
+    int atomLen;
+    long atomAt;                // instruction index of the atom's first byte
+    long beforeMin, beforeMax;  // bytes a match can span before the atom
+    long maxLen;                // longest possible match
+    long lo, hi;                // match start offsets, lo < 0 if anywhere
+} Rule;
+
+typedef struct AtomEntry {
+    int rule;
+    struct AtomEntry *next;
+} AtomEntry;
+
+static Rule *rules;
+static int ruleCount, ruleCap;
+static unsigned char prefixBitmap[65536];
+static AtomEntry *prefixRules[65536];
+static int *unanchored, unanchoredCount;
+static unsigned *foundIn;       // per rule: number of the file it last matched
+static long maxSpan = 1;        // longest match of any rule
+static unsigned fileNumber;
+static unsigned char firstBytes[256];   // bytes that start an atom
+static unsigned char firstList[MAX_FIRST_BYTES];
+static int firstCount;                  // distinct first bytes, MAX_FIRST_BYTES + 1 if more
+#if defined(__SSE2__)
+static __m128i firstVec[MAX_FIRST_BYTES];
+#endif
+
+static int useMmap = 1;
+static unsigned long long filesScanned, bytesScanned;
+
+// The original built-in signatures, now rules anchored at the file start
+static const char *defaultRules =
+    "mz_header: 4D 5A 90 00 @0\n"
+    "elf_header: 7F 45 4C 46 @0\n"
+    "zip_header: 50 4B 03 04 @0\n";
+
+// ---------------- Rule parsing ----------------
+static int emit(Rule *r, int op, int value, int mask, long x, long y) {
+    if (r->len == r->cap) {
+        r->cap = r->cap ? r->cap * 2 : 16;
+        r->prog = realloc(r->prog, r->cap * sizeof(Inst));
+        if (r->prog == NULL) {
+            perror("realloc");
+            exit(2);
+        }
+    }
+    r->prog[r->len] = (Inst){op, (unsigned char)value, (unsigned char)mask, x, y};
+    return r->len++;
+}
+
+static void skip_space(const char **p) {
+    while (isspace((unsigned char)**p)) (*p)++;
+}
+
+// An @offset bound as byte_rules.py reads it: decimal without leading
+// zeros, or 0x hex; returns 0, or -1 if *p does not start with one
+static int parse_offset(const char **p, long *value) {
+    const char *s = *p;
+    char *end;
+    skip_space(&s);
+    if (s[0] == '0' && (s[1] == 'x' || s[1] == 'X')) {
+        if (!isxdigit((unsigned char)s[2])) return -1;
+        *value = strtol(s + 2, &end, 16);
+    } else if (isdigit((unsigned char)s[0]) && !(s[0] == '0' && isdigit((unsigned char)s[1]))) {
+        *value = strtol(s, &end, 10);
+    } else {
+        return -1;
+    }
+    *p = end;
+    skip_space(p);
+    return 0;
+}
+
+static int hex_nibble(char c, int *value) {
+    if (c == '?') return 0;
+    if (!isxdigit((unsigned char)c)) return -1;
+    *value = isdigit((unsigned char)c) ? c - '0' : tolower((unsigned char)c) - 'a' + 10;
+    return 1;
+}
+
+// Parses a sequence up to '|', ')' or the end; returns 0 or -1 on error
+static int parse_seq(Rule *r, const char **p, int depth) {
+    for (;;) {
+        skip_space(p);
+        char c = **p;
+        if (c == '\0' || c == '@') return depth ? -1 : 0;
+        if (c == '|' || c == ')') return depth ? 0 : -1;
+        if (c == '[') {
+            char *end;
+            long lo = strtol(*p + 1, &end, 10), hi = lo;
+            if (end == *p + 1) return -1;
+            if (*end == '-') hi = strtol(end + 1, &end, 10);
+            if (*end != ']' || lo < 0 || hi < lo || hi > MAX_JUMP) return -1;
+            emit(r, OP_RANGE, 0, 0, lo, hi);
+            *p = end + 1;
+        } else if (c == '(') {
+            // SPLIT a, b / a: alt1 JMP end / b: SPLIT ... / last alt / end:
+            int jumps[256], jumpCount = 0;
+            (*p)++;
+            for (;;) {
+                int split = emit(r, OP_SPLIT, 0, 0, 0, 0);
+                r->prog[split].x = r->len;
+                int start = r->len;
+                if (parse_seq(r, p, depth + 1) < 0 || r->len == start) return -1;
+                if (**p == ')') {
+                    // The last alternative needs no split: turn it into a no-op jump
+                    r->prog[split] = (Inst){OP_JMP, 0, 0, split + 1, 0};
+                    (*p)++;
+                    break;
+                }
+                if (jumpCount == 256) return -1;
+                jumps[jumpCount++] = emit(r, OP_JMP, 0, 0, 0, 0);
+                r->prog[split].y = r->len;
+                (*p)++;     // '|'
+            }
+            for (int i = 0; i < jumpCount; i++) r->prog[jumps[i]].x = r->len;
+        } else {
+            int high = 0, low = 0;
+            int h = hex_nibble((*p)[0], &high), l = (*p)[0] ? hex_nibble((*p)[1], &low) : -1;
+            if (h < 0 || l < 0) return -1;
+            emit(r, OP_BYTE, high << 4 | low, (h ? 0xF0 : 0) | (l ? 0x0F : 0), 0, 0);
+            *p += 2;
+        }
+    }
+}
+
+static int common_byte(unsigned char b) {
+    return b == 0x00 || b == 0x20 || b == 0x90 || b == 0xCC || b == 0xFF;
+}
+
+static int atom_quality(const unsigned char *atom, int len) {
+    int q = 0;
+    for (int i = 0; i < len; i++) {
+        int repeated = 0;
+        for (int j = 0; j < i; j++) repeated |= atom[j] == atom[i];
+        q += (common_byte(atom[i]) ? 1 : 2) + !repeated;
+    }
+    return len * 1000 + q;
+}
+
+// Atom: best window of literal bytes at the top level of the program,
+// i.e. before any alternation; min/max distance from the match start
+static void pick_atom(Rule *r) {
+    long minOff = 0, maxOff = 0;
+    int best = -1, i = 0;
+    r->atomLen = 0;
+    while (i < r->len) {
+        Inst *in = &r->prog[i];
+        if (in->op == OP_RANGE) {
+            minOff += in->x;
+            maxOff += in->y;
+            i++;
+            continue;
+        }
+        if (in->op != OP_BYTE) break;   // alternation: variable length from here on
+        int run = 0;
+        while (i + run < r->len && r->prog[i + run].op == OP_BYTE && r->prog[i + run].mask == 0xFF) run++;
+        for (int k = 0; k + 2 <= run; k++) {
+            unsigned char atom[ATOM_LEN];
+            int len = run - k < ATOM_LEN ? run - k : ATOM_LEN;
+            for (int j = 0; j < len; j++) atom[j] = r->prog[i + k + j].value;
+            int q = atom_quality(atom, len);
+            if (q > best) {
+                best = q;
+                memcpy(r->atom, atom, len);
+                r->atomLen = len;
+                r->atomAt = i + k;
+                r->beforeMin = minOff + k;
+                r->beforeMax = maxOff + k;
+            }
+        }
+        int step = run ? run : 1;
+        minOff += step;
+        maxOff += step;
+        i += step;
+    }
+}
+
+// Longest match of a program: jumps and splits only go forward, so one
+// backward pass covers every path
+static long max_length(const Rule *r) {
+    long *from = malloc(r->len * sizeof(long));
+    if (from == NULL) {
+        perror("malloc");
+        exit(2);
+    }
+    for (long pc = r->len - 1; pc >= 0; pc--) {
+        const Inst *in = &r->prog[pc];
+        if (in->op == OP_BYTE) from[pc] = 1 + from[pc + 1];
+        else if (in->op == OP_RANGE) from[pc] = in->y + from[pc + 1];
+        else if (in->op == OP_SPLIT) from[pc] = from[in->x] > from[in->y] ? from[in->x] : from[in->y];
+        else if (in->op == OP_JMP) from[pc] = from[in->x];
+        else from[pc] = 0;
+    }
+    long len = from[0];
+    free(from);
+    return len;
+}
+
+static int add_rule(const char *line, int lineNo) {
+    const char *colon = strchr(line, ':');
+    if (colon == NULL || colon == line || colon - line >= MAX_NAME) {
+        fprintf(stderr, "Rule line %d: expected 'name: pattern'\n", lineNo);
+        return -1;
+    }
+    if (ruleCount == ruleCap) {
+        ruleCap = ruleCap ? ruleCap * 2 : 64;
+        rules = realloc(rules, ruleCap * sizeof(Rule));
+        if (rules == NULL) {
+            perror("realloc");
+            exit(2);
+        }
+    }
+    Rule *r = &rules[ruleCount];
+    memset(r, 0, sizeof(*r));
+    int nameLen = colon - line;
+    while (nameLen > 0 && isspace((unsigned char)line[nameLen - 1])) nameLen--;
+    memcpy(r->name, line, nameLen);
+    r->lo = -1;
+
+    const char *p = colon + 1;
+    if (parse_seq(r, &p, 0) < 0 || r->len == 0) {
+        fprintf(stderr, "Rule line %d: bad pattern near '%.10s'\n", lineNo, p);
+        free(r->prog);
+        return -1;
+    }
+    if (*p == '@') {
+        p++;
+        int bad = parse_offset(&p, &r->lo) < 0;
+        r->hi = r->lo;
+        if (!bad && *p == '-') {
+            p++;
+            bad = parse_offset(&p, &r->hi) < 0;
+        }
+        if (bad || *p != '\0' || r->hi < r->lo) {
+            fprintf(stderr, "Rule line %d: bad offset\n", lineNo);
+            free(r->prog);
+            return -1;
+        }
+    }
+    emit(r, OP_MATCH, 0, 0, 0, 0);
+    r->maxLen = max_length(r);
+    if (r->lo < 0) pick_atom(r);
+    ruleCount++;
+    return 0;
+}
 
-    while ((bytesRead = fread(buffer, 1, sizeof(buffer), file)) > 0) {
-        for (int i = 0; i < MAX_SIGNATURES; i++) {
-            if (memcmp(buffer, signatures[i], strlen((char *)signatures[i])) == 0) {
-                found = 1;
+static int load_rules(const char *text) {
+    int lineNo = 0, errors = 0;
+    while (*text) {
+        const char *eol = strchr(text, '\n');
+        size_t len = eol ? (size_t)(eol - text) : strlen(text);
+        char line[4096];
+        lineNo++;
+        if (len >= sizeof(line)) {
+            fprintf(stderr, "Rule line %d: too long\n", lineNo);
+            errors++;
+        } else {
+            memcpy(line, text, len);
+            line[len] = '\0';
+            char *hash = strchr(line, '#');
+            if (hash) *hash = '\0';
+            const char *start = line;
+            skip_space(&start);
+            if (*start && add_rule(start, lineNo) < 0) errors++;
+        }
+        text += len + (eol != NULL);
+    }
+    return errors ? -1 : 0;
+}
+
+static char *read_text(const char *path) {
+    FILE *f = fopen(path, "rb");
+    if (f == NULL) return NULL;
+    size_t len = 0, cap = 4096;
+    char *text = malloc(cap);
+    size_t n;
+    while (text && (n = fread(text + len, 1, cap - len - 1, f)) > 0) {
+        len += n;
+        if (cap - len - 1 == 0) text = realloc(text, cap *= 2);
+    }
+    fclose(f);
+    if (text) text[len] = '\0';
+    return text;
+}
+
+static void index_rules(void) {
+    unanchored = malloc((ruleCount + 1) * sizeof(int));
+    foundIn = calloc(ruleCount + 1, sizeof(unsigned));
+    for (int i = 0; i < ruleCount; i++) {
+        Rule *r = &rules[i];
+        if (r->maxLen > maxSpan) maxSpan = r->maxLen;
+        if (r->lo >= 0) continue;
+        if (r->atomLen == 0) {
+            unanchored[unanchoredCount++] = i;
+            continue;
+        }
+        int key = r->atom[0] << 8 | r->atom[1];
+        AtomEntry *e = malloc(sizeof(*e));
+        e->rule = i;
+        e->next = prefixRules[key];
+        prefixRules[key] = e;
+        prefixBitmap[key] = 1;
+        if (!firstBytes[r->atom[0]]) {
+            firstBytes[r->atom[0]] = 1;
+            if (firstCount < MAX_FIRST_BYTES) firstList[firstCount] = r->atom[0];
+            if (firstCount <= MAX_FIRST_BYTES) firstCount++;
+        }
+    }
+#if defined(__SSE2__)
+    for (int i = 0; i < firstCount && i < MAX_FIRST_BYTES; i++) firstVec[i] = _mm_set1_epi8((char)firstList[i]);
+#endif
+}
+
+// ---------------- Matching ----------------
+// Does the rule's program match at p?  Backtracks over jumps and alternatives.
+static int run_prog(const Rule *r, long pc, const unsigned char *p, const unsigned char *end) {
+    for (;;) {
+        const Inst *in = &r->prog[pc];
+        switch (in->op) {
+        case OP_BYTE:
+            if (p >= end || (*p & in->mask) != in->value) return 0;
+            p++;
+            pc++;
+            break;
+        case OP_RANGE:
+            for (long k = in->x; k <= in->y && k <= end - p; k++)
+                if (run_prog(r, pc + 1, p + k, end)) return 1;
+            return 0;
+        case OP_SPLIT:
+            if (run_prog(r, in->x, p, end)) return 1;
+            pc = in->y;
+            break;
+        case OP_JMP:
+            pc = in->x;
+            break;
+        default:
+            return 1;
+        }
+    }
+}
+
+// Next position >= pos holding a byte that starts some atom, or size
+static long next_first_byte(const unsigned char *data, long pos, long size) {
+    if (firstCount == 0) return size;
+    if (firstCount == 1) {
+        const unsigned char *p = memchr(data + pos, firstList[0], size - pos);
+        return p ? p - data : size;
+    }
+#if defined(__SSE2__)
+    if (firstCount <= MAX_FIRST_BYTES) {
+        for (; pos + 16 <= size; pos += 16) {
+            __m128i block = _mm_loadu_si128((const __m128i *)(data + pos));
+            __m128i hit = _mm_cmpeq_epi8(block, firstVec[0]);
+            for (int i = 1; i < firstCount; i++) hit = _mm_or_si128(hit, _mm_cmpeq_epi8(block, firstVec[i]));
+            int mask = _mm_movemask_epi8(hit);
+            if (mask) return pos + __builtin_ctz(mask);
+        }
+    }
+#endif
+    while (pos < size && !firstBytes[data[pos]]) pos++;
+    return pos;
+}
+
+static void report(const char *path, int rule, int *found) {
+    if (foundIn[rule] == fileNumber) return;
+    foundIn[rule] = fileNumber;
+    if (!*found) printf("Malware found: %s (%s)\n", path, rules[rule].name);
+    *found = 1;
+}
+
+// Matches starting at file offsets from..limit-1 (atoms for the prefilter)
+// in data, which holds size bytes from file offset base
+static void match_window(const char *path, const unsigned char *data, long base, long size,
+                         long from, long limit, int *found) {
+    long start = from - base, stop = limit - base;
+    for (int i = 0; !*found && i < ruleCount; i++) {
+        const Rule *r = &rules[i];
+        if (r->lo < 0) continue;
+        for (long s = r->lo > from ? r->lo : from; s <= r->hi && s < limit; s++)
+            if (run_prog(r, 0, data + s - base, data + size)) {
+                report(path, i, found);
                 break;
             }
+    }
+    for (long pos = next_first_byte(data, start, stop); !*found && pos < stop && pos + 1 < size;
+         pos = next_first_byte(data, pos + 1, stop)) {
+        if (!prefixBitmap[data[pos] << 8 | data[pos + 1]]) continue;
+        for (AtomEntry *e = prefixRules[data[pos] << 8 | data[pos + 1]]; e; e = e->next) {
+            const Rule *r = &rules[e->rule];
+            if (foundIn[e->rule] == fileNumber || pos + r->atomLen > size ||
+                memcmp(data + pos, r->atom, r->atomLen) != 0)
+                continue;
+            // Verify from every start the atom's position allows
+            for (long s = pos - r->beforeMax; s <= pos - r->beforeMin; s++) {
+                if (s >= 0 && run_prog(r, 0, data + s, data + size)) {
+                    report(path, e->rule, found);
+                    break;
+                }
+            }
         }
-        if (found) break;
     }
+    for (int i = 0; !*found && i < unanchoredCount; i++)
+        for (long s = start; s < stop; s++)
+            if (run_prog(&rules[unanchored[i]], 0, data + s, data + size)) {
+                report(path, unanchored[i], found);
+                break;
+            }
+}
 
+// A mapped file is matched in the same SCAN_WINDOW steps as a read one,
+// so both report the same first rule
+static int match_buffer(const char *path, const unsigned char *data, long size) {
+    int found = 0;
+    fileNumber++;
+    filesScanned++;
+    bytesScanned += size;
+    for (long from = 0; !found && from < size; from += SCAN_WINDOW)
+        match_window(path, data, 0, size, from, size - from > SCAN_WINDOW ? from + SCAN_WINDOW : size, &found);
     return found;
 }
 
+// Buffered reads for whatever cannot be mapped.  Each SCAN_WINDOW block
+// is matched with maxSpan bytes before it, which an atom's match may
+// reach back into, and maxSpan after it, which a match from the block may
+// reach into; those are kept for the next block.
+static int scan_stream(const char *path, int fd) {
+    long cap = SCAN_WINDOW + 2 * maxSpan;
+    unsigned char *buffer = malloc(cap);
+    if (buffer == NULL) {
+        perror("malloc");
+        return 0;
+    }
+    long base = 0, size = 0, done = 0;
+    int found = 0, eof = 0;
+    fileNumber++;
+    filesScanned++;
+    while (!found) {
+        while (!eof && size < cap) {
+            ssize_t bytesRead = read(fd, buffer + size, cap - size);
+            if (bytesRead < 0 && errno == EINTR) continue;
+            if (bytesRead <= 0) {
+                eof = 1;
+                break;
+            }
+            size += bytesRead;
+            bytesScanned += bytesRead;
+        }
+        long limit = done + SCAN_WINDOW;
+        if (eof && limit > base + size) limit = base + size;
+        if (limit <= done) break;
+        match_window(path, buffer, base, size, done, limit, &found);
+        done = limit;
+        long drop = done - maxSpan - base;
+        if (drop > 0) {
+            memmove(buffer, buffer + drop, size - drop);
+            base += drop;
+            size -= drop;
+        }
+    }
+    free(buffer);
+    return found;
+}
+
+// Function to scan a file for malicious signatures
+int scan_file(const char *path, int fd) {
+    struct stat st;
+    int regular = fstat(fd, &st) == 0 && S_ISREG(st.st_mode);
+
+    if (useMmap && regular && st.st_size > 0) {
+        void *map = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+        if (map != MAP_FAILED) {
+            madvise(map, st.st_size, MADV_SEQUENTIAL);
+            int found = match_buffer(path, map, st.st_size);
+            munmap(map, st.st_size);
+            return found;
+        }
+    }
+    return scan_stream(path, fd);
+}
+
+static void scan_path(const char *path) {
+    int fd = strcmp(path, "-") == 0 ? STDIN_FILENO : open(path, O_RDONLY);
+    if (fd < 0) {
+        perror("Failed to open file");
+        return;
+    }
+    scan_file(path, fd);
+    if (fd != STDIN_FILENO) close(fd);
+}
+
 // Function to scan a directory for files
 void scan_directory(const char *dirPath) {
     DIR *dir = opendir(dirPath);
@@ -56,17 +564,7 @@ void scan_directory(const char *dirPath) {
                 continue;  // Skip file if path is too long
             }
 
-            FILE *file = fopen(filePath, "rb");
-            if (file == NULL) {
-                perror("Failed to open file");
-                continue;
-            }
-
-            if (scan_file(file)) {
-                printf("Malware found: %s\n", filePath);
-            }
-
-            fclose(file);
+            scan_path(filePath);
         } else if (entry->d_type == DT_DIR && strcmp(entry->d_name, ".") != 0 && strcmp(entry->d_name, "..") != 0) {
             char subDirPath[MAX_FILENAME];  // Increased buffer size for subdirectory paths
 
@@ -83,12 +581,53 @@ void scan_directory(const char *dirPath) {
     closedir(dir);
 }
 
-int main() {
+// Usage: antivirus [-r RULES] [-R] [-s] [PATH]
+//   -R  read files instead of mapping them (for comparison)
+//   -s  print files, bytes and throughput to stderr
+// PATH is a directory (default: current), a file, or - for stdin.
+int main(int argc, char **argv) {
     const char *dirToScan = ".";  // Current directory
+    const char *rulesPath = NULL;
+    int opt, showStats = 0;
 
+    while ((opt = getopt(argc, argv, "r:Rs")) != -1) {
+        if (opt == 'r') {
+            rulesPath = optarg;
+        } else if (opt == 'R') {
+            useMmap = 0;
+        } else if (opt == 's') {
+            showStats = 1;
+        } else {
+            fprintf(stderr, "Usage: %s [-r RULES] [-R] [-s] [PATH]\n", argv[0]);
+            return 2;
+        }
+    }
+    if (optind < argc) dirToScan = argv[optind];
+
+    char *text = rulesPath ? read_text(rulesPath) : (char *)defaultRules;
+    if (text == NULL) {
+        perror(rulesPath);
+        return 2;
+    }
+    if (load_rules(text) < 0) return 2;
+    index_rules();
+
+    struct stat st;
+    struct timespec start, end;
+    clock_gettime(CLOCK_MONOTONIC, &start);
     printf("Starting antivirus scan...\n");
-    scan_directory(dirToScan);
+    if (strcmp(dirToScan, "-") != 0 && stat(dirToScan, &st) == 0 && S_ISDIR(st.st_mode)) {
+        scan_directory(dirToScan);
+    } else {
+        scan_path(dirToScan);
+    }
     printf("Scan completed.\n");
+    clock_gettime(CLOCK_MONOTONIC, &end);
 
+    if (showStats) {
+        double seconds = (end.tv_sec - start.tv_sec) + (end.tv_nsec - start.tv_nsec) / 1e9;
+        fprintf(stderr, "%llu files, %llu bytes in %.3f s (%.1f MB/s, %s)\n", filesScanned, bytesScanned,
+                seconds, seconds > 0 ? bytesScanned / seconds / 1e6 : 0.0, useMmap ? "mmap" : "read");
+    }
     return 0;
 }
@@ -1,6 +1,146 @@
+import io
 import os
+import re
+import sys
+import time
 import hashlib
-from virus_signatures import malware_hashes
+import importlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+from file_types import HEADER_SIZE, ARCHIVE_KINDS, sniff, sniff_file, route, has_archive_extension
+from archive_scanner import scan_archive
+from byte_rules import RuleSet, load_rules
+import fuzzy_hash
+from fuzzy_hash import FuzzyHasher, FuzzyIndex
+import tree_hash
+from tree_hash import TreeIndex, hash_tree
+from signature_db import SignatureDB, Signature, raw_digest
+from signature_update import SignatureStore
+from scan_metrics import NULL_METRICS
+from prefetch import Prefetcher, inode_order
+
+# The feed module, virus_signatures, is read without importing its
+# malware_hashes literal: compiling it would intern every hex string, and
+# the interpreter's intern table never shrinks again.  The rest of the
+# module runs as usual.
+_FEED_START = re.compile(rb"malware_hashes\s*=\s*\{")
+_FEED_ITEMS = re.compile(rb"""(?:\s+|,|"[0-9a-fA-F]{32}"|'[0-9a-fA-F]{32}')*""")
+_FEED_DIGEST = re.compile(rb"[0-9a-fA-F]{32}")
+
+def _split_feed(f):
+    # -> (source with an empty malware_hashes, raw digests of the literal),
+    # or None if it is not a plain literal of MD5 strings.  Read by line,
+    # so no copy of the whole feed is ever held.
+    rest, raw, state, lines = [], bytearray(), "before", 0
+    for line in f:
+        if state != "inside":
+            m = _FEED_START.match(line) if state == "before" else None
+            if m is None:
+                rest.append(line)
+                continue
+            rest.append(b"malware_hashes = set()")
+            state, line = "inside", line[m.end():]
+        lines += 1
+        # No digest contains "#", so the comment is whatever follows one
+        items, brace, tail = line.partition(b"#")[0].partition(b"}")
+        if not _FEED_ITEMS.fullmatch(items) or tail.strip():
+            return None
+        raw += bytes.fromhex(b"".join(_FEED_DIGEST.findall(items)).decode())
+        if brace:
+            # Line numbers of the rest stay those of the file
+            rest.append(b"\n" * lines)
+            state = "after"
+    return (b"".join(rest), raw) if state == "after" else None
+
+def read_feed():
+    """(virus_signatures namespace, its digests as one buffer of raw MD5s).
+
+    A feed whose malware_hashes is not a plain literal is imported
+    instead; entries that are not MD5s could never match and are dropped.
+    """
+    spec = importlib.util.find_spec("virus_signatures")
+    if spec is None:
+        raise ImportError("No module named 'virus_signatures'", name="virus_signatures")
+    split = None
+    if spec.origin and spec.origin.endswith(".py"):
+        with open(spec.origin, "rb") as f:
+            split = _split_feed(f)
+    if split is None:
+        module = importlib.import_module("virus_signatures")
+        sys.modules.pop("virus_signatures", None)
+        return vars(module), b"".join(filter(None, map(raw_digest, module.malware_hashes)))
+    rest, raw = split
+    namespace = {"__name__": "virus_signatures", "__file__": spec.origin}
+    exec(compile(rest, spec.origin, "exec"), namespace)
+    return namespace, raw
+
+_feed = read_feed()      # its digests are consumed by the first load_signatures
+
+# Optional byte patterns, also matched inside archive members
+malware_patterns = _feed[0].get("malware_patterns", ())
+
+# Byte-pattern rules (see byte_rules.py) plus the literal patterns above
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.txt")
+
+def use_rules(rules_path=RULES_PATH):
+    global malware_rules
+    rules = load_rules(rules_path) if os.path.exists(rules_path) else RuleSet()
+    malware_rules = rules + RuleSet.from_literals(malware_patterns)
+    return malware_rules
+
+use_rules()
+
+# Fuzzy hashes of reference samples (see fuzzy_hash.py); files similar to
+# one of them are reported even when their MD5 is new
+FUZZY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fuzzy.txt")
+# Fuzzy hashing is slower than MD5; larger files only get the exact checks
+FUZZY_MAX_SIZE = 32 * 1024 * 1024
+
+def use_fuzzy(index_path=FUZZY_PATH):
+    global fuzzy_index
+    fuzzy_index = FuzzyIndex.load(index_path) if os.path.exists(index_path) else None
+    return fuzzy_index
+
+use_fuzzy()
+
+# Tree roots and infected-chunk fingerprints (see tree_hash.py); files of
+# tree_hash.MIN_SIZE and up are hashed in parallel chunks when it exists
+TREES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trees.txt")
+
+def use_trees(index_path=TREES_PATH):
+    global tree_index
+    tree_index = TreeIndex.load(index_path) if os.path.exists(index_path) else None
+    return tree_index
+
+use_trees()
+
+# Signatures with sizes and partial digests; virus_signatures entries that
+# are not in the file are added as plain (size-less) MD5s
+SIGNATURE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "signatures.db")
+
+def load_signatures(db_path=SIGNATURE_DB_PATH):
+    # Nothing of the feed is kept once its digests are packed
+    global _feed
+    (_, digests), _feed = _feed or read_feed(), None
+    db = SignatureDB.load(db_path) if os.path.exists(db_path) else SignatureDB()
+    db.add_plain(digests)
+    return db
+
+def _swap_signatures(db):
+    global signature_db
+    signature_db = db
+
+def use_signatures(db_path):
+    # The store follows updates to db_path and rebinds signature_db
+    global signature_store
+    signature_store = SignatureStore(db_path, load_signatures, _swap_signatures)
+    _swap_signatures(signature_store.db)
+
+def refresh_signatures():
+    """Pick up signature updates applied since the last check."""
+    return signature_store.refresh()
+
+use_signatures(SIGNATURE_DB_PATH)
 
 def compute_md5(file_path):
     try:
@@ -13,12 +153,324 @@ def compute_md5(file_path):
         print(f"Error reading {file_path}: {e}")
         return None
 
-def scan_directory(directory):
+def _bump(stats, metrics, key, n=1):
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + n
+    metrics.count(key, n)
+
+def _hash_rest(f, file_hash, metrics, checks=()):
+    # Returns the bytes read; timed per chunk only when metrics are on.
+    # checks, (stage, heuristic check or rule matcher) pairs, are fed the
+    # same buffers.
+    read = 0
+    if not metrics.enabled:
+        while chunk := f.read(4096):
+            file_hash.update(chunk)
+            for _, check in checks:
+                check.feed(chunk)
+            read += len(chunk)
+        return read
+    while True:
+        with metrics.stage("read"):
+            chunk = f.read(4096)
+        if not chunk:
+            return read
+        with metrics.stage("hash"):
+            file_hash.update(chunk)
+        for stage, check in checks:
+            with metrics.stage(stage):
+                check.feed(chunk)
+        read += len(chunk)
+
+def _check_rest(f, checks, metrics):
+    # Reads only as far as the heuristics or byte rules still want data
+    read = 0
+    while any(check.wants_more() for _, check in checks):
+        with metrics.stage("read"):
+            chunk = f.read(64 * 1024)
+        if not chunk:
+            break
+        for stage, check in checks:
+            if check.wants_more():
+                with metrics.stage(stage):
+                    check.feed(chunk)
+        read += len(chunk)
+    return read
+
+def digest_file(file_path, db, stats=None, metrics=NULL_METRICS, cache=None, heuristics=None,
+                prefetched=None):
+    """Everything scan_file does except the lookup of the file's own digest.
+
+    Returns (digest, hits): hits are tree/chunk, byte-rule, fuzzy,
+    heuristic and archive member hits; digest is None when the file was
+    skipped, rejected or unreadable.  Callers can then look up many
+    digests at once with db.lookup_many().  prefetched is (stat, contents)
+    of a small file already read by a prefetch.Prefetcher.
+    """
+    # Sniff the header first so skipped files are never read in full;
+    # the header bytes are fed into the digest so nothing is read twice
+    digest = None
+    hits = []
+    try:
+        if prefetched is not None:
+            st, contents = prefetched
+            f = io.BytesIO(contents)
+        else:
+            with metrics.stage("open"):
+                f = open(file_path, 'rb')
+        with f:
+            with metrics.stage("sniff"):
+                header = f.read(HEADER_SIZE)
+                if prefetched is None:
+                    st = os.fstat(f.fileno())
+                kind = sniff(header, file_path)
+                action = route(kind, st.st_size)
+            if action == "skip":
+                _bump(stats, metrics, "skipped")
+                return None, []
+            check = matcher = None
+            hashed = False
+            checks = []
+            if heuristics is not None:
+                check = heuristics.start(file_path, kind)
+                checks.append(("heuristics", check))
+            if len(malware_rules):
+                matcher = malware_rules.matcher()
+                checks.append(("rules", matcher))
+            index = fuzzy_index
+            fuzzy = None
+            if index is not None and fuzzy_hash.MIN_SIZE <= st.st_size <= FUZZY_MAX_SIZE:
+                fuzzy = FuzzyHasher(st.st_size)
+                checks.append(("fuzzy", fuzzy))
+            trees = tree_index
+            tree_mode = trees is not None and st.st_size >= tree_hash.MIN_SIZE
+            if not tree_mode:
+                for _, c in checks:
+                    c.feed(header)
+            # Files whose size or head/tail digest match no signature are
+            # rejected without reading the rest of them
+            with metrics.stage("prefilter"):
+                candidate = db.might_match(st.st_size, f)
+            if tree_mode:
+                # Huge file: chunks are hashed on all cores; the classic
+                # digest (if a signature may match) and the checks get the
+                # same buffers in file order
+                hashed = True
+                if candidate and cache is not None:
+                    digest = cache.get(file_path, st)
+                file_hash = hashlib.md5() if candidate and digest is None else None
+                feeds = [c.feed for _, c in checks] + ([file_hash.update] if file_hash else [])
+
+                def consume(chunk):
+                    for feed in feeds:
+                        feed(chunk)
+
+                with metrics.stage("tree"):
+                    tree = hash_tree(f.fileno(), st.st_size, trees.chunk_size,
+                                     consume=consume if feeds else None)
+                _bump(stats, metrics, "bytes_read", st.st_size)
+                _bump(stats, metrics, "tree_hashed")
+                if file_hash is not None:
+                    digest = file_hash.hexdigest()
+                    if cache is not None:
+                        cache.put(file_path, st, digest)
+                hits.extend(trees.hits(file_path, tree))
+            elif not candidate:
+                _bump(stats, metrics, "rejected")
+            elif cache is not None and (digest := cache.get(file_path, st)):
+                _bump(stats, metrics, "cached")
+            else:
+                hashed = True
+                f.seek(len(header))
+                file_hash = hashlib.md5(header)
+                _bump(stats, metrics, "bytes_read", len(header) + _hash_rest(f, file_hash, metrics, checks))
+                digest = file_hash.hexdigest()
+                if cache is not None:
+                    cache.put(file_path, st, digest)
+            if not hashed and checks:
+                # Not hashed (rejected or cached): read for the rules alone
+                f.seek(len(header))
+                _bump(stats, metrics, "bytes_read", _check_rest(f, checks, metrics))
+            if matcher is not None:
+                with metrics.stage("rules"):
+                    names = matcher.finish()
+                if names:
+                    hits.extend(f"{file_path} (rule {name})" for name in names)
+                    _bump(stats, metrics, "rule_hits")
+            if fuzzy is not None:
+                with metrics.stage("fuzzy"):
+                    similar = index.query(fuzzy.hexdigest())
+                if similar:
+                    score, name = similar[0]
+                    hits.append(f"{file_path} (similar {score}%: {name})")
+                    _bump(stats, metrics, "fuzzy_hits")
+            if check is not None:
+                heuristic_hits = check.hits(file_path)
+                if heuristic_hits:
+                    hits.extend(heuristic_hits)
+                    _bump(stats, metrics, "heuristic_hits")
+        if action == "archive":
+            with metrics.stage("archive"):
+                hits.extend(scan_archive(file_path, db, malware_rules, kind, stats))
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}", file=sys.stderr)
+        metrics.error(e)
+        _bump(stats, metrics, "errors")
+        return None, []
+    return digest, hits
+
+def scan_file(file_path, stats=None, metrics=NULL_METRICS, cache=None, heuristics=None):
+    """Signature hits for one file, plus heuristic hits when given a
+    heuristics.HeuristicEngine (scored in the same read pass)."""
+    # One DB for the whole file even if an update is swapped in meanwhile
+    db = signature_db
+    digest, hits = digest_file(file_path, db, stats, metrics, cache, heuristics)
+    with metrics.stage("lookup"):
+        infected = [file_path] if digest in db else []
+    return infected + hits
+
+def iter_files(directory):
+    # os.scandir walk: the DirEntry carries the stat for the size index
+    stack = [directory]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            yield entry
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+def size_skippable(path, size):
+    # A size no signature has means clean, unless the file is an archive
+    # whose members still need scanning (by its header, whatever its
+    # name), or rules or fuzzy hashes need to see it
+    if len(malware_rules) or fuzzy_index is not None:
+        return False
+    if tree_index is not None and size >= tree_hash.MIN_SIZE:
+        return False
+    if not signature_db.size_rejects(size) or has_archive_extension(path):
+        return False
+    try:
+        return sniff_file(path) not in ARCHIVE_KINDS
+    except OSError:
+        return False            # let the scan report it
+
+def _scan_one(path, db, metrics, cache, heuristics, ahead=None):
+    # Worker body: per-file stats are merged by the caller, so pool threads
+    # never update a shared dict.  The digest is looked up by the caller,
+    # batched with the other files that finished at the same time.
+    # ahead is the file's prefetch future, if any.
+    local = {}
+    start = time.perf_counter() if metrics.enabled else 0
+    prefetched = None
+    if ahead is not None:
+        with metrics.stage("prefetch_wait"):
+            prefetched = ahead.result()
+        if prefetched is not None:
+            _bump(local, metrics, "prefetched")
+    digest, hits = digest_file(path, db, local, metrics, cache, heuristics, prefetched)
+    if metrics.enabled:
+        metrics.file_done(path, time.perf_counter() - start)
+    return digest, hits, local
+
+def iter_scan(directory, stats=None, metrics=NULL_METRICS, jobs=1, cache=None, heuristics=None,
+              prefetch=0):
+    """Yield (path, infected, error) for each file under directory.
+
+    Results come out as soon as each file is done - in completion order,
+    not walk order, when jobs > 1 or prefetch is on.  `infected` lists the
+    path itself and/or "path!member" hits; `error` is True if the file was
+    unreadable.  prefetch > 0 keeps that many opens and reads in flight
+    ahead of the hashers and walks each window of files in inode order.
+    """
+    # (st_dev, st_ino) -> suffixes of the hits found under the first path,
+    # so hardlinks and symlinks to one inode are read once per scan
+    seen_inodes = {}
+    waiting = {}                # key -> duplicate paths while the first is in flight
+    in_flight = {}              # future -> (path, key)
+    prefetcher = Prefetcher(prefetch) if prefetch > 0 else None
+    pool = ThreadPoolExecutor(jobs) if jobs > 1 or prefetcher is not None else None
+    # Files queued ahead of the hashers; prefetching needs a longer queue
+    max_in_flight = jobs * 4 + prefetch
+    db = signature_db
+
+    def finish(path, key, hits, local):
+        for name, n in local.items():
+            if stats is not None:
+                stats[name] = stats.get(name, 0) + n
+        error = bool(local.get("errors"))
+        suffixes = [hit[len(path):] for hit in hits]
+        seen_inodes[key] = suffixes or ()
+        yield path, hits, error
+        for dup in waiting.pop(key, ()):
+            yield dup, [dup + suffix for suffix in suffixes], error
+
+    def finish_batch(batch):
+        # batch: [((path, key), (digest, hits, local))]
+        with metrics.stage("lookup"):
+            found = db.lookup_many([digest for _, (digest, _, _) in batch])
+        for ((path, key), (_, hits, local)), hit in zip(batch, found):
+            yield from finish(path, key, [path] + hits if hit else hits, local)
+
+    def drain(return_when):
+        done, _ = wait(in_flight, return_when=return_when)
+        yield from finish_batch([(in_flight.pop(future), future.result()) for future in done])
+
+    try:
+        files = iter_files(directory)
+        if prefetcher is not None:
+            files = inode_order(files)
+        while True:
+            with metrics.stage("walk"):
+                entry = next(files, None)
+                if entry is None:
+                    break
+                try:
+                    st = entry.stat()
+                except OSError as e:
+                    metrics.error(e)
+                    continue
+            _bump(stats, metrics, "files")
+            # Heuristics score files whatever their size
+            if heuristics is None and size_skippable(entry.path, st.st_size):
+                _bump(stats, metrics, "size_skipped")
+                _bump(stats, metrics, "bytes_skipped", st.st_size)
+                yield entry.path, [], False
+                continue
+            key = (st.st_dev, st.st_ino)
+            if key in seen_inodes:
+                _bump(stats, metrics, "deduplicated")
+                yield entry.path, [entry.path + suffix for suffix in seen_inodes[key]], False
+                continue
+            if key in waiting:
+                _bump(stats, metrics, "deduplicated")
+                waiting[key].append(entry.path)
+                continue
+            if pool is None:
+                yield from finish_batch([((entry.path, key), _scan_one(entry.path, db, metrics, cache, heuristics))])
+                continue
+            waiting[key] = []
+            ahead = prefetcher.submit(entry.path) if prefetcher is not None else None
+            in_flight[pool.submit(_scan_one, entry.path, db, metrics, cache, heuristics, ahead)] = (entry.path, key)
+            if len(in_flight) >= max_in_flight:
+                yield from drain(FIRST_COMPLETED)
+        if in_flight:
+            yield from drain(ALL_COMPLETED)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if prefetcher is not None:
+            prefetcher.close()
+
+def scan_directory(directory, stats=None, metrics=NULL_METRICS, jobs=1, cache=None, heuristics=None,
+                   prefetch=0):
     infected_files = []
-    for root, _, files in os.walk(directory):
-        for name in files:
-            file_path = os.path.join(root, name)
-            file_hash = compute_md5(file_path)
-            if file_hash in malware_hashes:
-                infected_files.append(file_path)
+    for _, hits, _ in iter_scan(directory, stats, metrics, jobs, cache, heuristics, prefetch):
+        infected_files.extend(hits)
     return infected_files
@@ -0,0 +1,395 @@
+"""Verified, parallel app installs from a local package mirror.
+
+    python app_installer.py [--repo DIR_OR_URL] list
+    python app_installer.py [--repo DIR_OR_URL] install KEY [KEY...]
+
+A mirror is a directory or an http(s) URL holding index.json:
+
+    {"packages": {"vscode": {"name": "Visual Studio Code", "version": "1.90",
+                             "file": "vscode-1.90.tar.gz", "sha256": "...",
+                             "size": 104857600, "depends": ["libsecret"]}}}
+
+Every package is fetched at once on a thread pool, through a pool of
+keep-alive connections for an http mirror.  Each chunk is fed to
+SHA-256 and to the scan engine (MD5 signature lookup and byte rules) as
+it arrives, so a package is verified when its last byte is in.
+Downloads land in <cache>/<sha256>.part; an interrupted one continues
+with a Range request, and one that does not verify once resumed is
+fetched again from the start.  Verified packages stay in the cache under their
+digest, so a re-install never downloads again.  A package is unpacked
+as soon as it is verified and everything it depends on is installed.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import argparse
+import threading
+import http.client
+from queue import Queue, Empty
+from collections import namedtuple
+from contextlib import contextmanager
+from urllib.parse import urlsplit, quote
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import antivirus_scanner
+except ImportError:
+    antivirus_scanner = None
+from memory_scanner import default_rules
+
+REPO_ENV = "LIAN_PACKAGE_REPO"
+DEFAULT_REPO = os.environ.get(REPO_ENV, os.path.join(os.path.expanduser("~"), ".local", "share", "lian", "repo"))
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "lian", "packages")
+INSTALL_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "lian", "apps")
+JOBS = 4
+CHUNK = 256 * 1024
+TIMEOUT = 30
+# Per-package fetch progress is reported at most this often
+PROGRESS_INTERVAL = 0.1
+MANIFEST = ".lian-package.json"
+
+Package = namedtuple("Package", "key name version file sha256 size depends")
+
+
+class InstallError(Exception):
+    pass
+
+
+# What a failed fetch or unpack raises; zipfile raises RuntimeError for
+# encrypted members and NotImplementedError for unsupported compression
+PACKAGE_ERRORS = (OSError, InstallError, tarfile.TarError, zipfile.BadZipFile, http.client.HTTPException,
+                  RuntimeError, NotImplementedError)
+
+
+# ---------------- Mirrors ----------------
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one host, at most size open."""
+
+    def __init__(self, base_url, size=JOBS, timeout=TIMEOUT):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == "https"
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.idle = Queue()
+        self.slots = threading.Semaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self.slots.acquire()
+        try:
+            conn = self.idle.get_nowait()
+        except Empty:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, timeout=self.timeout)
+        try:
+            yield conn
+        except BaseException:
+            conn.close()        # the response may be half read
+            raise
+        else:
+            self.idle.put(conn)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                return
+
+
+class Mirror:
+    """A package directory or http(s) base URL."""
+
+    def __init__(self, location, jobs=JOBS):
+        self.location = location
+        self.pool = ConnectionPool(location, jobs) if location.startswith(("http://", "https://")) else None
+
+    @contextmanager
+    def open(self, name, offset=0):
+        """Yield (stream, offset it starts at): offset if the mirror could
+        resume there, else 0.  The stream is empty if the file ends at
+        or before offset."""
+        if self.pool is None:
+            with open(os.path.join(self.location, name), "rb") as f:
+                f.seek(offset)
+                yield f, offset
+            return
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.pool.connection() as conn:
+            conn.request("GET", f"{self.pool.prefix}/{quote(name)}", headers=headers)
+            response = conn.getresponse()
+            if response.status == 416 and offset:
+                # Nothing past offset: the part on disk may be complete
+                response.read()
+                yield io.BytesIO(), offset
+                return
+            if response.status not in (200, 206):
+                response.read()
+                raise InstallError(f"{name}: HTTP {response.status} {response.reason}")
+            yield response, offset if response.status == 206 else 0
+            response.read()     # drain so the connection can be reused
+
+    def index(self):
+        with self.open("index.json") as (f, _):
+            data = json.loads(f.read())
+        return {key: Package(key, p.get("name", key), p.get("version", ""), p["file"], p["sha256"].lower(),
+                             p.get("size"), tuple(p.get("depends", ())))
+                for key, p in data["packages"].items()}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+
+# ---------------- Verification ----------------
+class StreamCheck:
+    """SHA-256 plus the scan engine's checks over a package as it streams."""
+
+    def __init__(self, rules):
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self.matcher = rules.matcher() if len(rules) else None
+
+    def feed(self, chunk):
+        self.sha256.update(chunk)
+        self.md5.update(chunk)
+        if self.matcher is not None and self.matcher.wants_more():
+            self.matcher.feed(chunk)
+
+    def finish(self):
+        """(sha256 hex digest, threat names)."""
+        hits = [f"rule {name}" for name in self.matcher.finish()] if self.matcher is not None else []
+        if antivirus_scanner is not None and self.md5.hexdigest() in antivirus_scanner.signature_db:
+            hits.insert(0, "known malware")
+        return self.sha256.hexdigest(), hits
+
+
+def _check_file(path, rules, check=None, end=None):
+    # Feeds the first end bytes of path (all by default) into check
+    check = check or StreamCheck(rules)
+    remaining = os.path.getsize(path) if end is None else end
+    with open(path, "rb") as f:
+        while remaining > 0 and (chunk := f.read(min(CHUNK, remaining))):
+            check.feed(chunk)
+            remaining -= len(chunk)
+    return check
+
+
+# ---------------- Unpacking ----------------
+def _unpack(archive, dest, file_name):
+    if tarfile.is_tarfile(archive):
+        with tarfile.open(archive) as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(dest, filter="data")
+            else:
+                for member in tar.getmembers():
+                    if not _inside(dest, member.name) or member.issym() or member.islnk() or member.isdev():
+                        raise InstallError(f"{file_name}: unsafe member {member.name}")
+                tar.extractall(dest)
+    elif zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for name in zf.namelist():
+                if not _inside(dest, name):
+                    raise InstallError(f"{file_name}: unsafe member {name}")
+            zf.extractall(dest)
+    else:
+        # a single program (AppImage, script): copied as is
+        target = os.path.join(dest, file_name)
+        shutil.copyfile(archive, target)
+        os.chmod(target, 0o755)
+
+
+def _inside(dest, name):
+    dest = os.path.realpath(dest)
+    return os.path.realpath(os.path.join(dest, name)).startswith(dest + os.sep)
+
+
+# ---------------- Installing ----------------
+class Installer:
+    """Usage:
+        installer = Installer(Mirror(repo), progress=callback)
+        results = installer.run(["vscode", "vlc"])   # key -> (ok, message)
+
+    progress(key, stage, done, total) is called from worker threads with
+    stage "fetch" (bytes), "cached", "verified", "installed", "skipped"
+    or "failed".
+    """
+
+    def __init__(self, mirror, cache_dir=CACHE_DIR, install_dir=INSTALL_DIR, jobs=JOBS, progress=None):
+        self.mirror = mirror
+        self.cache_dir = cache_dir
+        self.install_dir = install_dir
+        self.jobs = jobs
+        self.progress = progress or (lambda key, stage, done, total: None)
+        self.rules = antivirus_scanner.malware_rules if antivirus_scanner is not None else default_rules()
+        os.makedirs(cache_dir, exist_ok=True)
+        os.makedirs(install_dir, exist_ok=True)
+
+    def resolve(self, keys, index):
+        """keys plus their dependencies, dependencies first."""
+        order, state = [], {}
+
+        def visit(key, path):
+            if key not in index:
+                raise InstallError(f"unknown package {key}" + (f" (needed by {path[-1]})" if path else ""))
+            if state.get(key) == "done":
+                return
+            if state.get(key) == "visiting":
+                raise InstallError("dependency cycle: " + " -> ".join(path + [key]))
+            state[key] = "visiting"
+            for dep in index[key].depends:
+                visit(dep, path + [key])
+            state[key] = "done"
+            order.append(index[key])
+
+        for key in keys:
+            visit(key, [])
+        return order
+
+    def installed(self, pkg):
+        try:
+            with open(os.path.join(self.install_dir, pkg.key, MANIFEST), encoding="utf-8") as f:
+                return json.load(f).get("sha256") == pkg.sha256
+        except (OSError, ValueError):
+            return False
+
+    def fetch(self, pkg):
+        """Path of the verified package in the cache."""
+        cached = os.path.join(self.cache_dir, pkg.sha256)
+        if os.path.exists(cached):
+            # no download; still checked against the current signatures
+            _, hits = _check_file(cached, self.rules).finish()
+            if hits:
+                raise InstallError(f"{pkg.file}: {', '.join(hits)}")
+            self.progress(pkg.key, "cached", 1, 1)
+            return cached
+        part = f"{cached}.part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        digest, hits, done = self._download(pkg, part, offset)
+        if offset and not hits and (digest != pkg.sha256 or (pkg.size is not None and done != pkg.size)):
+            # A stale part, or the mirror's file changed since: start over
+            digest, hits, done = self._download(pkg, part, 0)
+        if hits or digest != pkg.sha256 or (pkg.size is not None and done != pkg.size):
+            os.remove(part)
+            reason = ", ".join(hits) if hits else f"digest {digest[:16]}... expected {pkg.sha256[:16]}..."
+            raise InstallError(f"{pkg.file}: {reason}")
+        os.replace(part, cached)
+        self.progress(pkg.key, "verified", done, done)
+        return cached
+
+    def _download(self, pkg, part, offset):
+        # -> (sha256, hits, bytes in part)
+        with self.mirror.open(pkg.file, offset) as (stream, start):
+            # bytes already on disk go through the same checks first
+            check = _check_file(part, self.rules, end=start) if start else StreamCheck(self.rules)
+            done, last = start, 0.0
+            with open(part, "r+b" if start else "wb") as out:
+                out.seek(start)
+                out.truncate()
+                while chunk := stream.read(CHUNK):
+                    out.write(chunk)
+                    check.feed(chunk)
+                    done += len(chunk)
+                    if time.monotonic() - last >= PROGRESS_INTERVAL:
+                        last = time.monotonic()
+                        self.progress(pkg.key, "fetch", done, pkg.size or done)
+        digest, hits = check.finish()
+        return digest, hits, done
+
+    def install(self, pkg, path):
+        dest = os.path.join(self.install_dir, pkg.key)
+        tmp = f"{dest}.lian-tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            _unpack(path, tmp, pkg.file)
+            with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump({"key": pkg.key, "name": pkg.name, "version": pkg.version, "sha256": pkg.sha256,
+                           "installed": time.time()}, f)
+            shutil.rmtree(dest, ignore_errors=True)
+            os.replace(tmp, dest)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.progress(pkg.key, "installed", 1, 1)
+
+    def run(self, keys):
+        """key -> (ok, message) for keys and their dependencies."""
+        index = self.mirror.index()
+        packages = self.resolve(keys, index)
+        results, fetched = {}, {}
+        with ThreadPoolExecutor(max(self.jobs, 1)) as pool:
+            running = {}
+            for pkg in packages:
+                if self.installed(pkg):
+                    results[pkg.key] = (True, f"{pkg.name} {pkg.version} already installed")
+                    self.progress(pkg.key, "skipped", 1, 1)
+                else:
+                    running[pool.submit(self.fetch, pkg)] = ("fetch", pkg)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, pkg = running.pop(future)
+                    try:
+                        value = future.result()
+                    except PACKAGE_ERRORS as e:
+                        results[pkg.key] = (False, str(e))
+                        self.progress(pkg.key, "failed", 0, 0)
+                        continue
+                    if stage == "fetch":
+                        fetched[pkg.key] = value
+                    else:
+                        results[pkg.key] = (True, f"{pkg.name} {pkg.version} installed")
+                # start every install whose dependencies are all in
+                for pkg in packages:
+                    if pkg.key not in fetched or pkg.key in results:
+                        continue
+                    failed = [d for d in pkg.depends if d in results and not results[d][0]]
+                    if failed:
+                        results[pkg.key] = (False, f"dependency {failed[0]} failed")
+                        self.progress(pkg.key, "failed", 0, 0)
+                    elif all(d in results for d in pkg.depends):
+                        running[pool.submit(self.install, pkg, fetched.pop(pkg.key))] = ("install", pkg)
+        return results
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Install apps from a local package mirror.")
+    parser.add_argument("--repo", default=DEFAULT_REPO, help=f"directory or URL (default: ${REPO_ENV})")
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS)
+    sub = parser.add_subparsers(dest="mode", required=True)
+    sub.add_parser("list")
+    install = sub.add_parser("install")
+    install.add_argument("keys", nargs="+")
+    args = parser.parse_args(argv)
+
+    mirror = Mirror(args.repo, args.jobs)
+    try:
+        if args.mode == "list":
+            for key, pkg in sorted(mirror.index().items()):
+                deps = f"  (needs {', '.join(pkg.depends)})" if pkg.depends else ""
+                print(f"{key:<16} {pkg.name} {pkg.version}{deps}")
+            return 0
+        results = Installer(mirror, jobs=args.jobs).run(args.keys)
+    except (OSError, ValueError, KeyError, InstallError, http.client.HTTPException) as e:
+        print(f"{args.repo}: {e}")
+        return 2
+    finally:
+        mirror.close()
+    for key, (ok, message) in results.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {key}: {message}")
+    return 0 if all(ok for ok, _ in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
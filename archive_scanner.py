@@ -0,0 +1,150 @@
+import os
+import sys
+import io
+import bz2
+import gzip
+import lzma
+import zlib
+import hashlib
+import tarfile
+import zipfile
+from file_types import HEADER_SIZE, ARCHIVE_KINDS, sniff
+from byte_rules import RuleSet
+
+CHUNK_SIZE = 64 * 1024
+
+# Zip-bomb defences
+MAX_DEPTH = 3                         # archives inside archives inside archives
+MAX_MEMBERS = 10000                   # members per scanned file, all levels
+MAX_RATIO = 100                       # expanded bytes per byte on disk
+MIN_EXPANSION = 1024 * 1024           # ratio floor so tiny text archives pass
+MAX_NESTED_SIZE = 64 * 1024 * 1024    # nested archives are buffered in memory
+
+STREAM_OPENERS = {
+    "gzip": lambda f: gzip.GzipFile(fileobj=f),
+    "bzip2": bz2.BZ2File,
+    "xz": lzma.LZMAFile,
+}
+
+# zipfile raises RuntimeError for encrypted members and
+# NotImplementedError for methods it lacks (deflate64, implode)
+MEMBER_ERRORS = (RuntimeError, NotImplementedError)
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, lzma.LZMAError,
+                  zlib.error, EOFError, OSError, ValueError) + MEMBER_ERRORS
+
+
+class ArchiveLimitExceeded(Exception):
+    pass
+
+
+class _ArchiveScan:
+    def __init__(self, hashes, rules, archive_size, max_depth, max_members, max_ratio):
+        self.hashes = hashes
+        self.rules = rules
+        self.max_depth = max_depth
+        self.max_members = max_members
+        self.max_expanded = max_ratio * max(archive_size, MIN_EXPANSION)
+        self.members = 0
+        self.unscannable = 0
+        self.expanded = 0
+        self.infected = []
+
+    def add_member(self, declared_size=0):
+        self.members += 1
+        if self.members > self.max_members:
+            raise ArchiveLimitExceeded(f"more than {self.max_members} members")
+        if self.expanded + declared_size > self.max_expanded:
+            raise ArchiveLimitExceeded("declared size exceeds expansion limit")
+
+    def consume(self, n):
+        self.expanded += n
+        if self.expanded > self.max_expanded:
+            raise ArchiveLimitExceeded(f"expanded past {self.max_expanded} bytes")
+
+
+def _scan_container(fobj, kind, display, depth, ctx):
+    if kind == "zip":
+        with zipfile.ZipFile(fobj) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                ctx.add_member(info.file_size)
+                try:
+                    with zf.open(info) as member:
+                        _scan_member(member, f"{display}!{info.filename}", depth, ctx)
+                except MEMBER_ERRORS as e:
+                    # one locked member does not hide the rest
+                    print(f"Cannot scan {display}!{info.filename}: {e}", file=sys.stderr)
+                    ctx.unscannable += 1
+    elif kind == "tar":
+        # Stream mode: members are visited once, in order, without seeking
+        with tarfile.open(fileobj=fobj, mode="r|") as tf:
+            for info in tf:
+                if not info.isfile():
+                    continue
+                ctx.add_member(info.size)
+                _scan_member(tf.extractfile(info), f"{display}!{info.name}", depth, ctx)
+    else:
+        inner = os.path.splitext(os.path.basename(display.split("!")[-1]))[0]
+        with STREAM_OPENERS[kind](fobj) as stream:
+            ctx.add_member()
+            _scan_member(stream, f"{display}!{inner}", depth, ctx)
+
+
+def _scan_member(stream, display, depth, ctx):
+    # Hash and rule-match the member while it decompresses; nested
+    # archives are buffered (up to MAX_NESTED_SIZE) and scanned afterwards
+    md5 = hashlib.md5()
+    matcher = ctx.rules.matcher() if len(ctx.rules) else None
+    chunk = stream.read(CHUNK_SIZE)
+    kind = sniff(chunk[:HEADER_SIZE], display)
+    nested = io.BytesIO() if kind in ARCHIVE_KINDS and depth < ctx.max_depth else None
+    while chunk:
+        ctx.consume(len(chunk))
+        md5.update(chunk)
+        if matcher is not None:
+            matcher.feed(chunk)
+        if nested is not None:
+            if nested.tell() + len(chunk) > MAX_NESTED_SIZE:
+                nested = None
+            else:
+                nested.write(chunk)
+        chunk = stream.read(CHUNK_SIZE)
+    if (matcher is not None and matcher.finish()) or md5.hexdigest() in ctx.hashes:
+        ctx.infected.append(display)
+    if nested is not None:
+        nested.seek(0)
+        _scan_container(nested, kind, display, depth + 1, ctx)
+
+
+def scan_archive(file_path, hashes, rules=(), kind=None, stats=None,
+                 max_depth=MAX_DEPTH, max_members=MAX_MEMBERS, max_ratio=MAX_RATIO):
+    """Scan the members of a ZIP, TAR, gzip, bzip2 or xz file in memory.
+
+    rules is a byte_rules.RuleSet or a sequence of literal byte patterns.
+    Returns infected members as "archive!member" paths (nested archives
+    add one "!" per level).  Scanning stops at the first limit hit; what
+    was found until then is still returned.
+    """
+    if not isinstance(rules, RuleSet):
+        rules = RuleSet.from_literals(rules)
+    ctx = _ArchiveScan(hashes, rules, os.path.getsize(file_path),
+                       max_depth, max_members, max_ratio)
+    try:
+        with open(file_path, 'rb') as f:
+            if kind is None:
+                kind = sniff(f.read(HEADER_SIZE), file_path)
+                f.seek(0)
+            if kind in ARCHIVE_KINDS:
+                _scan_container(f, kind, file_path, 1, ctx)
+    except ArchiveLimitExceeded as e:
+        print(f"Archive limit hit in {file_path}: {e}", file=sys.stderr)
+        if stats is not None:
+            stats["archive_limits"] = stats.get("archive_limits", 0) + 1
+    except ARCHIVE_ERRORS as e:
+        print(f"Error reading archive {file_path}: {e}", file=sys.stderr)
+    if stats is not None:
+        stats["archive_members"] = stats.get("archive_members", 0) + ctx.members
+        if ctx.unscannable:
+            stats["archive_unscannable"] = stats.get("archive_unscannable", 0) + ctx.unscannable
+    return ctx.infected
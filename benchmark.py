@@ -0,0 +1,296 @@
+"""Scan-engine benchmark on reproducible synthetic corpora.
+
+    python benchmark.py [--profiles tiny,huge,...] [--scale 0.1] [--prefetch 16]
+                        [--cold] [--save results.json] [--baseline results.json]
+
+Every profile is generated from a fixed seed, scanned by the Python engine
+and by the C scanner (compiled from antivirus.c when gcc is available) in
+separate processes, and reported as JSON on stdout.  The C scanner runs
+twice: "c" maps files, "c_read" reads them (-R), so the "huge" profile
+shows what mapping is worth.  The Python engine also runs with read-ahead
+("python_prefetch"), and "prefetch_speedup" compares the two; --cold evicts
+the corpus from the page cache before each run so I/O latency shows.
+The signature file always holds one size-less entry, so the size index
+rejects nothing and every file is really hashed; p50/p99 are per-file
+scan times measured around the engine's _scan_one.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tarfile
+import zipfile
+import argparse
+import tempfile
+import hashlib
+import subprocess
+from signature_db import Signature, format_signature, signature_from_file
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+C_SOURCE = os.path.join(HERE, "antivirus.c")
+
+# Planted hits start with the MZ header the C scanner knows, and their MD5s
+# go into the corpus' signature file, so both engines can find them
+PLANT_HEADER = b"MZ\x90\x00"
+
+PROFILES = ("tiny", "huge", "deep", "archives", "hits")
+
+# A signature without a size matches no corpus file but disables the size
+# index, so every file is hashed and both engines do comparable work
+HASH_ALL = Signature(hashlib.md5(b"benchmark: hash every file").hexdigest(), None, None, None)
+
+# Metrics where a larger number is better; the rest are "lower is better"
+HIGHER_IS_BETTER = {"files_per_sec", "mb_per_sec"}
+
+
+# ---------------- Corpus generation ----------------
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _plant(rng, path, size, planted):
+    _write(path, PLANT_HEADER + rng.randbytes(max(size - len(PLANT_HEADER), 0)))
+    planted.append(signature_from_file(path))
+
+
+def generate_corpus(root, profile, scale=1.0, seed=1234):
+    """Create the profile's tree under root; return the planted signatures."""
+    rng = random.Random(f"{profile}:{seed}")
+    planted = []
+    n = lambda count: max(1, int(count * scale))
+    if profile == "tiny":
+        for i in range(n(5000)):
+            _write(os.path.join(root, f"d{i % 50}", f"f{i}.txt"), rng.randbytes(rng.randint(0, 4096)))
+    elif profile == "huge":
+        for i in range(3):
+            _write(os.path.join(root, f"huge{i}.img"), rng.randbytes(n(64 * 1024 * 1024)))
+    elif profile == "deep":
+        path = root
+        for depth in range(n(60)):
+            path = os.path.join(path, f"level{depth}")
+            for i in range(5):
+                _write(os.path.join(path, f"f{i}.dat"), rng.randbytes(rng.randint(512, 16384)))
+    elif profile == "archives":
+        os.makedirs(root, exist_ok=True)
+        for i in range(n(40)):
+            members = [(f"m{j}.bin", rng.randbytes(rng.randint(1024, 65536))) for j in range(20)]
+            if i % 2:
+                with zipfile.ZipFile(os.path.join(root, f"a{i}.zip"), "w", zipfile.ZIP_DEFLATED) as z:
+                    for name, data in members:
+                        z.writestr(name, data)
+            else:
+                tmp = os.path.join(root, f".m{i}")
+                for name, data in members:
+                    _write(os.path.join(tmp, name), data)
+                with tarfile.open(os.path.join(root, f"a{i}.tar.gz"), "w:gz") as t:
+                    t.add(tmp, arcname=f"a{i}")
+                shutil.rmtree(tmp)
+    elif profile == "hits":
+        for i in range(n(500)):
+            path = os.path.join(root, f"d{i % 20}", f"f{i}.bin")
+            if i % 25 == 0:
+                _plant(rng, path, rng.randint(1024, 200000), planted)
+            else:
+                _write(path, rng.randbytes(rng.randint(1024, 200000)))
+    else:
+        raise ValueError(f"unknown profile: {profile}")
+    return planted
+
+
+# ---------------- Runners ----------------
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def _corpus_size(root):
+    files = total = 0
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            files += 1
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return files, total
+
+
+def _run_child(cmd, cwd=None):
+    # wait4 gives the child's own peak RSS, unlike RUSAGE_CHILDREN
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    out = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return time.perf_counter() - start, out, usage.ru_maxrss
+
+
+def _evict(root):
+    # Drop the corpus from the page cache so each engine starts cold
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            try:
+                fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def _python_worker(corpus, sig_path, prefetch=0):
+    # Runs in the child: scan with the Python engine and time each file's
+    # scan (_scan_one: prefetch wait, read, hash, archive members), on
+    # whichever thread runs it
+    import antivirus_scanner
+    from signature_db import SignatureDB
+    antivirus_scanner.signature_db = SignatureDB.load(sig_path)
+    latencies = []
+    scan_one = antivirus_scanner._scan_one
+
+    def timed_scan_one(*args):
+        start = time.perf_counter()
+        try:
+            return scan_one(*args)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    antivirus_scanner._scan_one = timed_scan_one
+    infected = antivirus_scanner.scan_directory(corpus, prefetch=prefetch)
+    json.dump({"detections": len(infected), "latencies": latencies}, sys.stdout)
+
+
+def run_python(corpus, sig_path, prefetch=0):
+    seconds, out, rss = _run_child([sys.executable, os.path.abspath(__file__), "--worker", corpus, sig_path,
+                                    str(prefetch)])
+    data = json.loads(out)
+    latencies = sorted(data["latencies"])
+    return seconds, data["detections"], rss, latencies
+
+
+def build_c_scanner(workdir):
+    if not shutil.which("gcc"):
+        return None
+    binary = os.path.join(workdir, "antivirus")
+    subprocess.run(["gcc", "-O2", "-o", binary, C_SOURCE], check=True)
+    return binary
+
+
+def run_c(binary, corpus, read=False):
+    # read=True makes the scanner read files instead of mapping them
+    seconds, out, rss = _run_child([binary] + (["-R"] if read else []), cwd=corpus)
+    return seconds, out.count(b"Malware found:"), rss, []
+
+
+def _report(files, total, seconds, detections, rss, latencies):
+    ms = lambda v: None if v is None else round(v * 1000, 4)
+    return {
+        "files": files,
+        "bytes": total,
+        "seconds": round(seconds, 4),
+        "files_per_sec": round(files / seconds, 2),
+        "mb_per_sec": round(total / seconds / 1e6, 2),
+        "peak_rss_kb": rss,
+        "p50_ms": ms(_percentile(latencies, 50)),
+        "p99_ms": ms(_percentile(latencies, 99)),
+        "detections": detections,
+    }
+
+
+def run_profile(profile, workdir, scale, seed, c_binary, prefetch=0, cold=False):
+    corpus = os.path.join(workdir, profile)
+    planted = generate_corpus(corpus, profile, scale, seed)
+    sig_path = os.path.join(workdir, f"{profile}.signatures")
+    with open(sig_path, "w") as f:
+        for sig in planted + [HASH_ALL]:
+            f.write(format_signature(sig) + "\n")
+    files, total = _corpus_size(corpus)
+    runs = [("python", lambda: run_python(corpus, sig_path))]
+    if prefetch:
+        runs.append(("python_prefetch", lambda: run_python(corpus, sig_path, prefetch)))
+    if c_binary:
+        runs.append(("c", lambda: run_c(c_binary, corpus)))
+        runs.append(("c_read", lambda: run_c(c_binary, corpus, read=True)))
+    result = {"planted": len(planted)}
+    for engine, run in runs:
+        if cold:
+            _evict(corpus)
+        result[engine] = _report(files, total, *run())
+    if prefetch:
+        result["prefetch_speedup"] = round(result["python"]["seconds"] / result["python_prefetch"]["seconds"], 2)
+    return result
+
+
+# ---------------- Baseline comparison ----------------
+def compare(results, baseline, tolerance):
+    """List metrics that got worse than baseline by more than tolerance."""
+    regressions = []
+    for profile, engines in results["profiles"].items():
+        for engine, metrics in engines.items():
+            if not isinstance(metrics, dict):
+                continue
+            old = baseline.get("profiles", {}).get(profile, {}).get(engine, {})
+            for key in ("files_per_sec", "mb_per_sec", "peak_rss_kb", "p50_ms", "p99_ms"):
+                new_v, old_v = metrics.get(key), old.get(key)
+                if not new_v or not old_v:
+                    continue
+                change = (new_v - old_v) / old_v
+                worse = -change if key in HIGHER_IS_BETTER else change
+                if worse > tolerance:
+                    regressions.append({"profile": profile, "engine": engine, "metric": key,
+                                        "baseline": old_v, "current": new_v,
+                                        "change_pct": round(change * 100, 1)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scan engines on synthetic corpora.")
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--scale", type=float, default=1.0, help="shrink or grow every corpus")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--workdir", help="keep corpora here instead of a temp dir")
+    parser.add_argument("--save", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="compare against a saved results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression (fraction)")
+    parser.add_argument("--no-c", action="store_true", help="skip the C scanner")
+    parser.add_argument("--prefetch", type=int, default=16,
+                        help="also run the Python engine with this read-ahead depth (0: don't)")
+    parser.add_argument("--cold", action="store_true",
+                        help="evict the corpus from the page cache before each engine")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="av-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        c_binary = None if args.no_c else build_c_scanner(workdir)
+        results = {"scale": args.scale, "seed": args.seed, "profiles": {}}
+        for profile in args.profiles.split(","):
+            results["profiles"][profile] = run_profile(profile, workdir, args.scale, args.seed, c_binary,
+                                                       args.prefetch, args.cold)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare(results, json.load(f), args.tolerance)
+        status = 1 if results["regressions"] else 0
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return status
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        _python_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        sys.exit(main())
@@ -0,0 +1,437 @@
+"""Byte-pattern rules with wildcards, jumps, alternation and offsets.
+
+One rule per line, in the same syntax the C scanner reads:
+
+    # name        pattern                                     [@offset]
+    upx_stub:     55 50 58 21 [4-16] ( 0d 0a | 0a ) ?? 4?      @0-1024
+    dropper_url:  68 74 74 70 3a 2f 2f [1-64] 2e 65 78 65
+
+    4D      byte            ??      any byte        4? / ?D  nibble wildcard
+    [n]     n bytes         [n-m]   n to m bytes    ( a | b ) alternatives
+    @n      match starts at offset n                @n-m    starts in n..m
+            (n and m decimal, without leading zeros, or 0x hex)
+
+Rules are compiled once into a RuleSet.  The longest, least common
+literal run of each rule (its atom) goes into a prefilter that finds all
+atoms of all rules in one pass over the data; only rules whose atom
+appears are verified with their full pattern, so the cost per byte
+hardly depends on the number of rules.
+
+    rules = load_rules("rules.txt")
+    m = rules.matcher()
+    m.feed(chunk)                   # any chunk sizes, across borders
+    names = m.finish()
+"""
+import re
+import sys
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ATOM_LEN = 4
+MAX_JUMP = 64 * 1024
+# Bytes buffered before a prefilter pass
+SCAN_BLOCK = 256 * 1024
+# Atom bytes that occur everywhere in binaries make poor filters
+COMMON_BYTES = {0x00, 0x20, 0x90, 0xcc, 0xff}
+
+Rule = namedtuple("Rule", "name source regex atom before after max_len offset")
+
+
+class RuleSyntaxError(ValueError):
+    pass
+
+
+# ---------------- Parsing ----------------
+_TOKEN = re.compile(r"\s*(?:([0-9a-fA-F?]{2})|\[(\d+)(?:-(\d+))?\]|([(|)]))")
+
+
+def _parse_seq(tokens, i, depth):
+    # -> (nodes, i); nodes are ("byte", value, mask), ("jump", lo, hi)
+    # and ("alt", [seq, ...])
+    seq = []
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if kind == "byte":
+            seq.append(value)
+        elif kind == "jump":
+            seq.append(value)
+        elif value == "(":
+            alternatives = []
+            while True:
+                sub, i = _parse_seq(tokens, i + 1, depth + 1)
+                if not sub:
+                    raise RuleSyntaxError("empty alternative")
+                alternatives.append(sub)
+                if i >= len(tokens):
+                    raise RuleSyntaxError("unclosed (")
+                if tokens[i][1] == ")":
+                    break
+            seq.append(("alt", alternatives))
+        elif depth:
+            return seq, i               # "|" or ")" ends this alternative
+        else:
+            raise RuleSyntaxError(f"unexpected {value!r}")
+        i += 1
+    return seq, i
+
+
+def parse_pattern(text):
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m:
+            raise RuleSyntaxError(f"bad pattern near {text[pos:pos + 10]!r}")
+        pos = m.end()
+        hex_byte, lo, hi, punct = m.groups()
+        if hex_byte:
+            mask = (0xf0 if hex_byte[0] != "?" else 0) | (0x0f if hex_byte[1] != "?" else 0)
+            value = int(hex_byte.replace("?", "0"), 16)
+            tokens.append(("byte", ("byte", value, mask)))
+        elif lo is not None:
+            lo, hi = int(lo), int(hi if hi is not None else lo)
+            if hi < lo or hi > MAX_JUMP:
+                raise RuleSyntaxError(f"bad jump [{lo}-{hi}]")
+            tokens.append(("jump", ("jump", lo, hi)))
+        else:
+            tokens.append(("punct", punct))
+    seq, _ = _parse_seq(tokens, 0, 0)
+    if not seq:
+        raise RuleSyntaxError("empty pattern")
+    return seq
+
+
+# Offsets read the same as in the C scanner: "010" is neither 8 nor 10
+_OFFSET = re.compile(r"0[xX][0-9a-fA-F]+|0|[1-9][0-9]*")
+
+
+def parse_rules(text):
+    """[(name, pattern, offset)] from rule-file text; offset is (lo, hi) or None."""
+    rules = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        name, sep, rest = line.partition(":")
+        if not sep or not name.strip():
+            raise RuleSyntaxError(f"line {lineno}: expected 'name: pattern'")
+        pattern, at, offset = rest.partition("@")
+        if at:
+            lo, dash, hi = (part.strip() for part in offset.partition("-"))
+            if not _OFFSET.fullmatch(lo) or (dash and not _OFFSET.fullmatch(hi)):
+                raise RuleSyntaxError(f"line {lineno}: bad offset {offset.strip()!r}")
+            offset = (int(lo, 0), int(hi or lo, 0))
+            if offset[1] < offset[0]:
+                raise RuleSyntaxError(f"line {lineno}: bad offset {'-'.join(map(str, offset))!r}")
+        rules.append((name.strip(), pattern.strip(), offset or None))
+    return rules
+
+
+# ---------------- Compiling ----------------
+def _length(seq):
+    lo = hi = 0
+    for node in seq:
+        if node[0] == "byte":
+            lo, hi = lo + 1, hi + 1
+        elif node[0] == "jump":
+            lo, hi = lo + node[1], hi + node[2]
+        else:
+            lengths = [_length(sub) for sub in node[1]]
+            lo, hi = lo + min(l for l, _ in lengths), hi + max(h for _, h in lengths)
+    return lo, hi
+
+
+def _regex(seq):
+    out = []
+    for node in seq:
+        if node[0] == "byte":
+            _, value, mask = node
+            if mask == 0xff:
+                out.append(re.escape(bytes([value])))
+            elif mask == 0:
+                out.append(b".")
+            else:
+                out.append(b"[" + b"".join(re.escape(bytes([b])) for b in range(256)
+                                            if b & mask == value) + b"]")
+        elif node[0] == "jump":
+            out.append(b".{%d,%d}" % (node[1], node[2]))
+        else:
+            out.append(b"(?:" + b"|".join(_regex(sub) for sub in node[1]) + b")")
+    return b"".join(out)
+
+
+def _quality(atom):
+    return sum(1 if b in COMMON_BYTES else 2 for b in atom) + len(set(atom))
+
+
+def _pick_atom(seq):
+    # Best literal window of up to ATOM_LEN bytes among top-level runs;
+    # -> (atom, max bytes before it, max bytes after it) or None
+    best, start = None, 0
+    literal = [node[0] == "byte" and node[2] == 0xff for node in seq] + [False]
+    for i, is_literal in enumerate(literal):
+        if is_literal:
+            continue
+        run = [seq[j][1] for j in range(start, i)]
+        for k in range(max(len(run) - ATOM_LEN, 0) + 1):
+            atom = bytes(run[k:k + ATOM_LEN])
+            if len(atom) >= 2 and (best is None or (len(atom), _quality(atom)) > (len(best[0]), _quality(best[0]))):
+                best = (atom, start + k)
+        start = i + 1
+    if best is None:
+        return None
+    atom, at = best
+    return atom, _length(seq[:at])[1], _length(seq[at + len(atom):])[1]
+
+
+def compile_rule(name, pattern, offset=None):
+    seq = parse_pattern(pattern)
+    _, max_len = _length(seq)
+    atom = _pick_atom(seq) if offset is None else None
+    atom, before, after = atom or (None, 0, max_len)
+    return Rule(name, pattern, re.compile(_regex(seq), re.DOTALL), atom, before, after, max_len, offset)
+
+
+class RuleSet:
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.by_atom = {}           # atom -> rules it stands for
+        self.unanchored = []        # no usable atom: searched everywhere
+        self.fixed = []             # offset-constrained
+        for rule in self.rules:
+            if rule.offset is not None:
+                self.fixed.append(rule)
+            elif rule.atom is None:
+                self.unanchored.append(rule)
+            else:
+                self.by_atom.setdefault(rule.atom, []).append(rule)
+        anchored = [r for r in self.rules if r.offset is None]
+        # Bytes kept around a prefilter region so verification windows fit
+        self.before = max((r.before if r.atom else r.max_len for r in anchored), default=0)
+        self.after = max((r.after if r.atom else r.max_len for r in anchored), default=0)
+        self.by_prefix = {}
+        for atom in self.by_atom:
+            self.by_prefix.setdefault(atom[:2], []).append(atom)
+        if numpy is not None:
+            self.bitmap = numpy.zeros(1 << 16, dtype=bool)
+            for prefix in self.by_prefix:
+                self.bitmap[prefix[0] << 8 | prefix[1]] = True
+        else:
+            by_first = {}
+            for prefix in self.by_prefix:
+                by_first.setdefault(prefix[0], []).append(prefix[1])
+            branches = [re.escape(bytes([first])) + b"[" + b"".join(re.escape(bytes([b])) for b in seconds) + b"]"
+                        for first, seconds in sorted(by_first.items())]
+            self.prefix_regex = re.compile(b"(?=" + b"|".join(branches) + b")", re.DOTALL) if branches else None
+
+    @classmethod
+    def from_literals(cls, patterns):
+        # Plain byte strings, like virus_signatures.malware_patterns
+        return cls(compile_rule(f"pattern_{i}", " ".join(f"{b:02x}" for b in p))
+                   for i, p in enumerate(patterns) if p)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __add__(self, other):
+        return RuleSet(self.rules + other.rules)
+
+    def candidates(self, region):
+        """(position, atom) for every atom occurrence in region."""
+        if not self.by_prefix or len(region) < 2:
+            return
+        if numpy is not None:
+            data = numpy.frombuffer(region, dtype=numpy.uint8)
+            keys = (data[:-1].astype(numpy.uint16) << 8) | data[1:]
+            positions = numpy.flatnonzero(self.bitmap[keys]).tolist()
+        else:
+            positions = [m.start() for m in self.prefix_regex.finditer(region)]
+        for pos in positions:
+            for atom in self.by_prefix[region[pos:pos + 2]]:
+                if region.startswith(atom, pos):
+                    yield pos, atom
+
+    def matcher(self):
+        return RuleMatcher(self)
+
+    def match(self, data):
+        m = self.matcher()
+        m.feed(data)
+        return m.finish()
+
+
+# ---------------- Matching ----------------
+class RuleMatcher:
+    """Streaming match of a RuleSet over one file's chunks."""
+
+    def __init__(self, ruleset):
+        self.rs = ruleset
+        self.buf = bytearray()
+        self.base = 0               # file offset of buf[0]
+        self.searched = 0           # atoms starting before this were handled
+        self.pending = list(ruleset.fixed)
+        self.found = []
+        self.names = set()
+
+    def wants_more(self):
+        return len(self.names) < len(self.rs.rules)
+
+    def feed(self, chunk):
+        self.buf += chunk
+        if len(self.buf) - (self.searched - self.base) >= SCAN_BLOCK + self.rs.after + ATOM_LEN - 1:
+            self._scan(False)
+
+    def finish(self):
+        self._scan(True)
+        return self.found
+
+    def _hit(self, rule):
+        self.names.add(rule.name)
+        self.found.append(rule.name)
+
+    def _scan(self, final):
+        rs, buf, base = self.rs, self.buf, self.base
+        end = base + len(buf)
+        # An atom starting before limit must have its whole verification
+        # window, up to `after` bytes past the atom's end, in buf
+        limit = end if final else end - rs.after - (ATOM_LEN - 1)
+        if limit > self.searched:
+            region = bytes(buf[self.searched - base:min(limit + ATOM_LEN - 1, end) - base])
+            for pos, atom in rs.candidates(region):
+                at = self.searched + pos
+                if at >= limit:
+                    continue
+                for rule in rs.by_atom[atom]:
+                    if rule.name in self.names:
+                        continue
+                    lo = max(at - rule.before, base) - base
+                    hi = min(at + len(atom) + rule.after, end) - base
+                    if rule.regex.search(buf, lo, hi):
+                        self._hit(rule)
+            for rule in rs.unanchored:
+                if rule.name not in self.names:
+                    lo = max(self.searched - rule.max_len + 1, base) - base
+                    if rule.regex.search(buf, lo, min(limit + rule.max_len, end) - base):
+                        self._hit(rule)
+            self.searched = limit
+        keep = self.searched - rs.before
+        still_pending = []
+        for rule in self.pending:
+            lo, hi = rule.offset
+            if final or end >= hi + rule.max_len:
+                if base <= lo < end:
+                    m = rule.regex.search(buf, lo - base, min(hi + rule.max_len, end) - base)
+                    if m and m.start() + base <= hi and rule.name not in self.names:
+                        self._hit(rule)
+            else:
+                still_pending.append(rule)
+                keep = min(keep, lo)
+        self.pending = still_pending
+        keep = max(keep, base)
+        if keep > base:
+            del buf[:keep - base]
+            self.base = keep
+
+
+def load_rules(path):
+    with open(path, encoding="utf-8") as f:
+        return RuleSet(compile_rule(*rule) for rule in parse_rules(f.read()))
+
+
+# ---------------- Self-test ----------------
+SELFTEST_RULES = """
+literal:  01 02 03 04 aa bb cc dd
+jumpy:    de ad be ef [0-300] 0b ad f0 0d
+alt:      ( 11 22 33 44 | 55 66 77 88 ) ?? 9?
+short:    c3 3c [2] 5a
+header:   4d 5a [2-4] 50 45                  @0-64
+"""
+
+
+def _instance(name, rng):
+    # Bytes matching the SELFTEST_RULES rule of that name
+    if name == "literal":
+        return bytes.fromhex("01020304aabbccdd")
+    if name == "jumpy":
+        return bytes.fromhex("deadbeef") + rng.randbytes(rng.randint(0, 300)) + bytes.fromhex("0badf00d")
+    if name == "alt":
+        return rng.choice((b"\x11\x22\x33\x44", b"\x55\x66\x77\x88")) + rng.randbytes(1) + bytes([0x90 | rng.randint(0, 15)])
+    if name == "short":
+        return b"\xc3\x3c" + rng.randbytes(2) + b"\x5a"
+    return b"MZ" + rng.randbytes(rng.randint(2, 4)) + b"PE"
+
+
+def reference_match(ruleset, data):
+    """Rule names matching data, by plain regex search over all of it."""
+    names = set()
+    for rule in ruleset.rules:
+        if rule.offset is None:
+            hit = rule.regex.search(data)
+        else:
+            lo, hi = rule.offset
+            m = rule.regex.search(data, lo)
+            hit = m and m.start() <= hi
+        if hit:
+            names.add(rule.name)
+    return names
+
+
+def selftest(trials=500, seed=0):
+    """Streamed matching against reference_match() on random data, fed in
+    random chunks with rules planted across the chunk borders; -> failures."""
+    import random
+    rng = random.Random(seed)
+    rules = [compile_rule(*rule) for rule in parse_rules(SELFTEST_RULES)]
+    failures = 0
+    for trial in range(trials):
+        # One rule alone makes its own `after` the matcher's margin
+        ruleset = RuleSet(rules if rng.random() < 0.5 else [rng.choice(rules)])
+        data = bytearray(rng.randbytes(rng.randint(1, 3 * SCAN_BLOCK)))
+        borders = [min(n * SCAN_BLOCK + rng.randint(0, 400), len(data)) for n in (1, 2)]
+        cuts = sorted({rng.randint(1, len(data)) for _ in range(rng.randint(0, 3))} | set(borders))
+        for rule in ruleset.rules:
+            if rng.random() < 0.3:
+                continue
+            sample = _instance(rule.name, rng)
+            if rule.offset is not None:
+                at = rng.randint(0, 64)
+            elif rng.random() < 0.8:
+                at = rng.choice(borders) - rng.randint(0, len(sample))
+            else:
+                at = rng.randint(0, len(data))
+            at = max(0, min(at, len(data)))
+            data[at:at + len(sample)] = sample
+        data = bytes(data)
+        expected = reference_match(ruleset, data)
+        m, pos = ruleset.matcher(), 0
+        for cut in cuts + [len(data)]:
+            m.feed(data[pos:cut])
+            pos = max(pos, cut)
+        streamed = set(m.finish())
+        whole = set(ruleset.match(data))
+        if streamed != expected or whole != expected:
+            failures += 1
+            print(f"trial {trial}: expected {sorted(expected)}, streamed {sorted(streamed)}, "
+                  f"whole {sorted(whole)}")
+    return failures
+
+
+if __name__ == "__main__":
+    # Try rules on files: python byte_rules.py RULES FILE...
+    # or check streaming against a plain search: python byte_rules.py --selftest [TRIALS]
+    if sys.argv[1:2] == ["--selftest"]:
+        failed = selftest(int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+        print(f"{failed} failures")
+        sys.exit(int(bool(failed)))
+    if len(sys.argv) < 3:
+        print("usage: byte_rules.py RULES FILE [FILE...] | --selftest [TRIALS]")
+        sys.exit(2)
+    ruleset = load_rules(sys.argv[1])
+    for path in sys.argv[2:]:
+        with open(path, "rb") as f:
+            names = ruleset.match(f.read())
+        print(f"{path}: {', '.join(names) or 'clean'}")
@@ -0,0 +1,84 @@
+import os
+
+# Only this many bytes are read to classify a file
+HEADER_SIZE = 512
+
+# Media larger than this is not worth hashing: signature feeds target
+# executables, scripts and archives, not multi-GB videos
+MEDIA_SIZE_LIMIT = 64 * 1024 * 1024
+
+# (offset, magic, kind) - checked in order, first match wins
+MAGIC_NUMBERS = [
+    (0, b"MZ", "pe"),
+    (0, b"\x7fELF", "elf"),
+    (0, b"\xcf\xfa\xed\xfe", "macho"),
+    (0, b"\xce\xfa\xed\xfe", "macho"),
+    (0, b"PK\x03\x04", "zip"),
+    (0, b"PK\x05\x06", "zip"),
+    (0, b"\x1f\x8b", "gzip"),
+    (0, b"BZh", "bzip2"),
+    (0, b"\xfd7zXZ\x00", "xz"),
+    (257, b"ustar", "tar"),
+    (0, b"#!", "script"),
+    (0, b"%PDF", "document"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "document"),
+    (0, b"\xff\xd8\xff", "media"),
+    (0, b"\x89PNG\r\n\x1a\n", "media"),
+    (0, b"GIF8", "media"),
+    (0, b"ID3", "media"),
+    (0, b"OggS", "media"),
+    (0, b"fLaC", "media"),
+    (0, b"\x1aE\xdf\xa3", "media"),
+    (0, b"FLV", "media"),
+    (4, b"ftyp", "media"),
+]
+
+RIFF_MEDIA = (b"WAVE", b"AVI ", b"WEBP")
+
+SCRIPT_EXTENSIONS = {
+    ".sh", ".bash", ".py", ".pl", ".rb", ".js", ".vbs", ".ps1",
+    ".bat", ".cmd", ".php", ".hta", ".jse", ".wsf",
+}
+
+ARCHIVE_KINDS = {"zip", "gzip", "bzip2", "xz", "tar"}
+ARCHIVE_EXTENSIONS = {
+    ".zip", ".jar", ".apk", ".docx", ".xlsx", ".pptx", ".tar", ".gz", ".tgz",
+    ".bz2", ".tbz2", ".xz", ".txz",
+}
+EXECUTABLE_KINDS = {"pe", "elf", "macho"}
+
+
+def sniff(header, file_path=""):
+    """Classify a file from its first bytes (and its name as a fallback)."""
+    for offset, magic, kind in MAGIC_NUMBERS:
+        if header[offset:offset + len(magic)] == magic:
+            return kind
+    if header[:4] == b"RIFF" and header[8:12] in RIFF_MEDIA:
+        return "media"
+    if os.path.splitext(file_path)[1].lower() in SCRIPT_EXTENSIONS:
+        return "script"
+    if header and b"\x00" not in header:
+        return "text"
+    return "data"
+
+
+def has_archive_extension(file_path):
+    return os.path.splitext(file_path)[1].lower() in ARCHIVE_EXTENSIONS
+
+
+def sniff_file(file_path):
+    with open(file_path, 'rb') as f:
+        return sniff(f.read(HEADER_SIZE), file_path)
+
+
+def route(kind, size, media_limit=MEDIA_SIZE_LIMIT):
+    """Decide what the scanner should do with a file of the given kind.
+
+    Returns "skip" for huge media, "archive" for containers and "hash"
+    for everything else.
+    """
+    if kind == "media" and size > media_limit:
+        return "skip"
+    if kind in ARCHIVE_KINDS:
+        return "archive"
+    return "hash"
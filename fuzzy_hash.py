@@ -0,0 +1,383 @@
+"""Context-triggered piecewise hashes and a similarity index over them.
+
+    python fuzzy_hash.py hash FILE [FILE...]
+    python fuzzy_hash.py compare HASH_OR_FILE HASH_OR_FILE
+    python fuzzy_hash.py index OUT PATH [PATH...]     # reference samples
+    python fuzzy_hash.py match INDEX FILE [FILE...]
+
+A file is cut into pieces wherever a rolling hash of the last 7 bytes
+hits a trigger value, and each piece contributes one character; an
+inserted or changed region only changes the characters of the pieces it
+touches, so repacked variants keep most of the hash.  The format and the
+0-100 score follow ssdeep ("blocksize:hash:hash at double blocksize"),
+with a CRC-32 piece hash instead of FNV so the pieces can be hashed at C
+speed; the values are therefore not interchangeable with ssdeep's.
+
+FuzzyIndex answers "which reference samples look like this hash" from
+winnowed 7-grams of the hash strings kept in one sorted array, so only
+the few samples sharing a fingerprint are scored.
+"""
+import os
+import re
+import sys
+import zlib
+import bisect
+import argparse
+from array import array
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WINDOW = 7
+MIN_BLOCK = 3
+SPAM_LENGTH = 64
+B64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+# Bytes buffered between rolling-hash passes
+BLOCK_BYTES = 256 * 1024
+# Files smaller than this have too few pieces to compare
+MIN_SIZE = 4096
+THRESHOLD = 60
+# Winnowing window: a common substring of WINDOW + WINNOW - 1 characters
+# always shares an index fingerprint
+WINNOW = 4
+MAX_CANDIDATES = 64
+
+
+def block_size(size):
+    bs = MIN_BLOCK
+    while bs * SPAM_LENGTH < size:
+        bs *= 2
+    return bs
+
+
+# ---------------- Hashing ----------------
+def _roll_numpy(data):
+    # Rolling hash of the WINDOW bytes ending at each position of data[6:].
+    # uint32 arithmetic wraps like the 32-bit hash, so the running sums
+    # may overflow and their differences are still exact.
+    u32 = numpy.uint32
+    d = numpy.frombuffer(data, dtype=numpy.uint8).astype(u32)
+    n = len(d) - (WINDOW - 1)
+    pos = numpy.arange(len(d), dtype=u32)
+    zero = numpy.zeros(1, dtype=u32)
+    c1 = numpy.concatenate((zero, numpy.cumsum(d, dtype=u32)))
+    c2 = numpy.concatenate((zero, numpy.cumsum(d * pos, dtype=u32)))
+    h1 = c1[WINDOW:] - c1[:n]
+    # sum of (7 - k) * d[j - k] == sum of m * d[m] + (7 - j) * h1 over the window
+    h2 = c2[WINDOW:] - c2[:n] + (u32(WINDOW) - pos[WINDOW - 1:]) * h1
+    h3 = d[WINDOW - 1:].copy()
+    for k in range(1, WINDOW):
+        h3 ^= d[WINDOW - 1 - k:len(d) - k] << u32(5 * k)
+    return h1 + h2 + h3
+
+
+def _roll_python(data):
+    out = []
+    for j in range(WINDOW - 1, len(data)):
+        window = data[j - WINDOW + 1:j + 1]
+        h1 = sum(window)
+        h2 = sum((k + 1) * b for k, b in enumerate(window))
+        h3 = 0
+        for b in window:
+            h3 = ((h3 << 5) ^ b) & 0xffffffff
+        out.append((h1 + h2 + h3) & 0xffffffff)
+    return out
+
+
+class _Track:
+    # One hash string: pieces cut at one block size, up to `limit` chars
+    def __init__(self, bs, limit):
+        self.bs = bs
+        self.limit = limit
+        self.crc = 0
+        self.pending = False        # bytes since the last cut
+        self.chars = []
+
+    def cut(self, piece):
+        self.crc = zlib.crc32(piece, self.crc)
+        if len(self.chars) < self.limit - 1:
+            # The last character covers everything after the limit
+            self.chars.append(B64[self.crc & 63])
+            self.crc = 0
+            self.pending = False
+        else:
+            self.pending = True
+
+    def rest(self, piece):
+        if piece:
+            self.crc = zlib.crc32(piece, self.crc)
+            self.pending = True
+
+    def value(self):
+        return "".join(self.chars) + (B64[self.crc & 63] if self.pending else "")
+
+
+class FuzzyHasher:
+    """Streaming fuzzy hash; size (the file size) picks the block size.
+
+    Hashes at half, single and double block size are kept so the result
+    can fall back to the smaller one, as ssdeep does with a second pass,
+    without reading the file again.
+    """
+
+    def __init__(self, size):
+        self.bs = block_size(size)
+        self.tracks = [_Track(self.bs, SPAM_LENGTH), _Track(self.bs * 2, SPAM_LENGTH // 2)]
+        if self.bs // 2 >= MIN_BLOCK:
+            self.tracks += [_Track(self.bs // 2, SPAM_LENGTH), _Track(self.bs, SPAM_LENGTH // 2)]
+        self.tail = bytes(WINDOW - 1)
+        self.buf = bytearray()
+
+    def wants_more(self):
+        return True
+
+    def feed(self, chunk):
+        self.buf += chunk
+        if len(self.buf) >= BLOCK_BYTES:
+            self._process()
+
+    def _process(self):
+        data = self.tail + bytes(self.buf)
+        self.tail = data[-(WINDOW - 1):]
+        chunk = data[WINDOW - 1:]
+        self.buf = bytearray()
+        if not chunk:
+            return
+        # Cuts at 2 * bs are a subset of the cuts at bs: only the smallest
+        # block size is tested against every position
+        sizes = sorted({t.bs for t in self.tracks})
+        if numpy is not None:
+            rolled = _roll_numpy(data)
+            first = numpy.flatnonzero(rolled % numpy.uint32(sizes[0]) == sizes[0] - 1)
+            rolled = dict(zip(first.tolist(), rolled[first].tolist()))
+        else:
+            rolled = dict(enumerate(_roll_python(data)))
+        cuts = {}
+        for bs in sizes:
+            rolled = {i: h for i, h in rolled.items() if h % bs == bs - 1}
+            cuts[bs] = list(rolled)
+        for track in self.tracks:
+            start = 0
+            for i in cuts[track.bs]:
+                track.cut(chunk[start:i + 1])
+                start = i + 1
+            track.rest(chunk[start:])
+
+    def hexdigest(self):
+        self._process()
+        values = [t.value() for t in self.tracks]
+        if len(values) == 4 and len(values[0]) < SPAM_LENGTH // 2:
+            return f"{self.bs // 2}:{values[2]}:{values[3]}"
+        return f"{self.bs}:{values[0]}:{values[1]}"
+
+
+def fuzzy_hash(data):
+    hasher = FuzzyHasher(len(data))
+    hasher.feed(data)
+    return hasher.hexdigest()
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        hasher = FuzzyHasher(os.fstat(f.fileno()).st_size)
+        while chunk := f.read(BLOCK_BYTES):
+            hasher.feed(chunk)
+    return hasher.hexdigest()
+
+
+# ---------------- Comparing ----------------
+_RUNS = re.compile(r"(.)\1{3,}")
+
+
+def parse(fhash):
+    bs, s1, s2 = fhash.split(":", 2)
+    # Long runs of one character say little about similarity
+    return int(bs), _RUNS.sub(r"\1\1\1", s1), _RUNS.sub(r"\1\1\1", s2)
+
+
+def _lcs(a, b):
+    # Bit-parallel longest common subsequence (Allison-Dix / Hyyro)
+    masks = {}
+    for i, c in enumerate(a):
+        masks[c] = masks.get(c, 0) | 1 << i
+    full = (1 << len(a)) - 1
+    v = full
+    for c in b:
+        u = v & masks.get(c, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count("1")
+
+
+def _grams(s):
+    return {s[i:i + WINDOW] for i in range(len(s) - WINDOW + 1)}
+
+
+def _score(a, b, bs):
+    if len(a) < WINDOW or len(b) < WINDOW or not _grams(a) & _grams(b):
+        return 0
+    # Insert/delete distance, scaled as ssdeep does
+    distance = len(a) + len(b) - 2 * _lcs(a, b)
+    score = 100 - distance * SPAM_LENGTH // (len(a) + len(b)) * 100 // SPAM_LENGTH
+    if bs < (99 + WINDOW) // WINDOW * MIN_BLOCK:
+        score = min(score, bs // MIN_BLOCK * min(len(a), len(b)))
+    return score
+
+
+def _compare_parsed(x, y):
+    bs1, a1, a2 = x
+    bs2, b1, b2 = y
+    if bs1 == bs2:
+        return max(_score(a1, b1, bs1), _score(a2, b2, bs1 * 2))
+    if bs1 == bs2 * 2:
+        return _score(a1, b2, bs1)
+    if bs2 == bs1 * 2:
+        return _score(a2, b1, bs2)
+    return 0
+
+
+def compare(hash1, hash2):
+    """Similarity 0-100 of two fuzzy hashes."""
+    return _compare_parsed(parse(hash1), parse(hash2))
+
+
+# ---------------- Index ----------------
+def _fingerprints(parsed):
+    # Winnowed 7-gram keys of both hash strings, tagged with their block
+    # size.  str hashes differ between processes, which is fine: postings
+    # are rebuilt on load and never stored.
+    bs, s1, s2 = parsed
+    keys = set()
+    for part_bs, s in ((bs, s1), (bs * 2, s2)):
+        grams = [hash(s[i:i + WINDOW]) for i in range(len(s) - WINDOW + 1)]
+        if len(grams) > WINNOW:
+            grams = set(map(min, zip(*(grams[k:] for k in range(WINNOW)))))
+        elif grams:
+            grams = [min(grams)]
+        keys.update((g ^ part_bs * 0x9e3779b1) & 0xffffffff for g in grams)
+    return keys
+
+
+class FuzzyIndex:
+    """Reference fuzzy hashes with a fingerprint index for quick queries.
+
+    Postings are (key << 32 | sample) in one sorted array('Q'): 8 bytes
+    per fingerprint, looked up with bisect.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.hashes = []
+        self.parsed = []
+        self.postings = array("Q")
+        self.unindexed = 0          # samples added since the last build
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, fhash):
+        self.names.append(name)
+        self.hashes.append(fhash)
+        self.parsed.append(parse(fhash))
+        self.unindexed += 1
+
+    def build(self):
+        entries = list(self.postings)
+        for sample in range(len(self.names) - self.unindexed, len(self.names)):
+            entries.extend(key << 32 | sample for key in _fingerprints(self.parsed[sample]))
+        entries.sort()
+        self.postings = array("Q", entries)
+        self.unindexed = 0
+
+    def candidates(self, parsed):
+        if self.unindexed:
+            self.build()
+        counts = Counter()
+        postings = self.postings
+        for key in _fingerprints(parsed):
+            i = bisect.bisect_left(postings, key << 32)
+            while i < len(postings) and postings[i] >> 32 == key:
+                counts[postings[i] & 0xffffffff] += 1
+                i += 1
+        return [sample for sample, _ in counts.most_common(MAX_CANDIDATES)]
+
+    def query(self, fhash, threshold=THRESHOLD):
+        """[(score, name)] of samples at least threshold similar, best first."""
+        parsed = parse(fhash)
+        matches = []
+        for sample in self.candidates(parsed):
+            score = _compare_parsed(parsed, self.parsed[sample])
+            if score >= threshold:
+                matches.append((score, self.names[sample]))
+        return sorted(matches, reverse=True)
+
+    @classmethod
+    def load(cls, path):
+        # One "hash name" per line, as written by save()
+        index = cls()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.split(None, 1)
+                if fields and not fields[0].startswith("#"):
+                    index.add(fields[1].strip() if len(fields) > 1 else fields[0], fields[0])
+        index.build()
+        return index
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for name, fhash in zip(self.names, self.hashes):
+                f.write(f"{fhash} {name}\n")
+        os.replace(tmp, path)
+
+
+# ---------------- CLI ----------------
+def _hash_arg(value):
+    return hash_file(value) if os.path.isfile(value) else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuzzy hashes and similarity lookups.")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    h = sub.add_parser("hash")
+    h.add_argument("files", nargs="+")
+    c = sub.add_parser("compare")
+    c.add_argument("a")
+    c.add_argument("b")
+    ix = sub.add_parser("index", help="hash reference samples into an index file")
+    ix.add_argument("output")
+    ix.add_argument("paths", nargs="+")
+    m = sub.add_parser("match")
+    m.add_argument("index")
+    m.add_argument("files", nargs="+")
+    m.add_argument("--threshold", type=int, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.mode == "hash":
+        for path in args.files:
+            print(f"{hash_file(path)} {path}")
+    elif args.mode == "compare":
+        print(compare(_hash_arg(args.a), _hash_arg(args.b)))
+    elif args.mode == "index":
+        index = FuzzyIndex.load(args.output) if os.path.exists(args.output) else FuzzyIndex()
+        for top in args.paths:
+            walk = [(top, [], [""])] if os.path.isfile(top) else os.walk(top)
+            for root, _, names in walk:
+                for name in names:
+                    path = os.path.join(root, name) if name else root
+                    if os.path.getsize(path) >= MIN_SIZE:
+                        index.add(path, hash_file(path))
+        index.save(args.output)
+        print(f"{len(index)} samples in {args.output}")
+    else:
+        index = FuzzyIndex.load(args.index)
+        for path in args.files:
+            matches = index.query(hash_file(path), args.threshold)
+            print(f"{path}: " + (", ".join(f"{name} ({score}%)" for score, name in matches) or "no match"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import os
+import json
+import threading
+
+
+class HashCache:
+    """File path -> MD5, valid while the file's size and mtime are unchanged.
+
+    Only digests are cached, never verdicts, so a signature update takes
+    effect on the next scan without invalidating anything.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}           # path -> [size, mtime_ns, md5]
+        self.lock = threading.Lock()
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable hash cache {path}: {e}")
+
+    def get(self, file_path, st):
+        entry = self.entries.get(file_path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def put(self, file_path, st, md5):
+        with self.lock:
+            self.entries[file_path] = [st.st_size, st.st_mtime_ns, md5]
+            self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            self.dirty = False
+        os.replace(tmp, self.path)
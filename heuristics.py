@@ -0,0 +1,387 @@
+"""Heuristic scoring for files no signature knows about.
+
+Each rule looks at one trait - packed sections, odd PE/ELF headers,
+suspicious script snippets, double extensions - and reports findings as
+(points, reason).  A file whose points reach the engine's threshold is
+reported as a heuristic hit.
+
+Rules are compiled once per engine.  Per file, each rule hands out a
+checker that is fed the same buffers the scanner reads for hashing and
+says when it has seen enough, so a scan reads every file at most once:
+
+    check = engine.start(path, kind)
+    check.feed(chunk)           # for each buffer, while check.wants_more()
+    verdict = check.finish()
+"""
+import os
+import re
+import math
+import struct
+from collections import Counter, namedtuple
+
+from file_types import HEADER_SIZE, EXECUTABLE_KINDS, sniff
+
+# Points at which a file is reported
+THRESHOLD = 8
+CHUNK_SIZE = 64 * 1024
+
+Verdict = namedtuple("Verdict", "score reasons")
+
+
+def describe(file_path, verdict):
+    # Hit string in the form the scanners report
+    return f"{file_path} (heuristic {verdict.score}: {'; '.join(verdict.reasons)})"
+
+
+class _Done:
+    # Checker whose findings are known before any data is read
+    def __init__(self, findings):
+        self.findings = findings
+
+    def feed(self, chunk):
+        return False
+
+
+# ---------------- Names ----------------
+EXEC_EXTENSIONS = {
+    ".exe", ".scr", ".com", ".pif", ".bat", ".cmd", ".vbs", ".vbe", ".js", ".jse",
+    ".hta", ".ps1", ".msi", ".lnk", ".jar", ".cpl", ".wsf",
+}
+DECOY_EXTENSIONS = {
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".rtf", ".txt",
+    ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".mp3", ".mp4", ".avi", ".zip",
+}
+
+
+class DoubleExtensionRule:
+    name = "double_extension"
+
+    def start(self, file_path, kind):
+        name = os.path.basename(file_path).lower()
+        findings = []
+        if "\u202e" in name:
+            findings.append((10, "right-to-left override in file name"))
+        base, ext = os.path.splitext(name)
+        decoy = os.path.splitext(base.rstrip(" ."))[1]
+        if ext in EXEC_EXTENSIONS and decoy in DECOY_EXTENSIONS:
+            findings.append((8, f"double extension {decoy}{ext}"))
+            if base != base.rstrip(" "):
+                findings.append((2, "blank padding before the extension"))
+        if kind in EXECUTABLE_KINDS and ext in DECOY_EXTENSIONS:
+            findings.append((6, f"{kind.upper()} executable named {ext}"))
+        return _Done(findings)
+
+
+# ---------------- Executable headers ----------------
+# Headers and section tables are read from this much of the file
+STRUCT_BYTES = 4096
+
+PACKER_SECTIONS = {
+    "upx0", "upx1", "upx2", ".aspack", ".adata", ".petite", "mpress1", "mpress2",
+    ".nsp0", ".nsp1", ".nsp2", "pec2", ".themida", ".vmp0", ".vmp1", ".enigma1",
+}
+SCN_EXECUTE = 0x20000000
+SCN_WRITE = 0x80000000
+
+
+def parse_pe(data):
+    """Entry point and section table of a PE image, or None if malformed.
+
+    Sections are (name, virtual_address, virtual_size, raw_offset,
+    raw_size, characteristics).
+    """
+    if len(data) < 64:
+        return None
+    lfanew = struct.unpack_from("<I", data, 0x3c)[0]
+    if lfanew + 24 > len(data) or data[lfanew:lfanew + 4] != b"PE\x00\x00":
+        return None
+    count, _, _, _, opt_size = struct.unpack_from("<HIIIH", data, lfanew + 6)
+    if lfanew + 24 + 20 > len(data):
+        return None
+    entry = struct.unpack_from("<I", data, lfanew + 24 + 16)[0]
+    sections = []
+    table = lfanew + 24 + opt_size
+    for i in range(min(count, 96)):
+        at = table + i * 40
+        if at + 40 > len(data):
+            break
+        name, vsize, vaddr, raw_size, raw_offset = struct.unpack_from("<8sIIII", data, at)
+        chars = struct.unpack_from("<I", data, at + 36)[0]
+        sections.append((name.rstrip(b"\x00").decode("latin-1"), vaddr, vsize, raw_offset, raw_size, chars))
+    return {"entry": entry, "count": count, "sections": sections}
+
+
+class _HeadChecker:
+    # Buffers the first STRUCT_BYTES, then hands them to analyze()
+    def __init__(self, analyze):
+        self.analyze = analyze
+        self.head = b""
+        self.findings = None
+
+    def feed(self, chunk):
+        self.head += chunk[:STRUCT_BYTES - len(self.head)]
+        if len(self.head) < STRUCT_BYTES:
+            return True
+        self.findings = self.analyze(self.head)
+        return False
+
+    def finish(self):
+        if self.findings is None:
+            self.findings = self.analyze(self.head)
+        return self.findings
+
+
+class PEAnomalyRule:
+    name = "pe_anomaly"
+
+    def start(self, file_path, kind):
+        return _HeadChecker(self.analyze) if kind == "pe" else None
+
+    def analyze(self, head):
+        pe = parse_pe(head)
+        if pe is None:
+            # Plain DOS programs start with MZ too; only flag a broken PE
+            return [(3, "malformed PE header")] if b"PE\x00\x00" in head else []
+        findings = []
+        sections = pe["sections"]
+        if not sections or pe["count"] > 16:
+            findings.append((2, f"{pe['count']} sections"))
+        for name, _, vsize, _, raw_size, chars in sections:
+            if name.lower() in PACKER_SECTIONS:
+                findings.append((4, f"packer section {name}"))
+            if chars & SCN_EXECUTE and chars & SCN_WRITE:
+                findings.append((4, f"writable and executable section {name}"))
+            elif chars & SCN_EXECUTE and raw_size == 0 and vsize:
+                findings.append((3, f"empty executable section {name}"))
+        entry = pe["entry"]
+        holder = [s for s in sections if s[1] <= entry < s[1] + max(s[2], s[4])]
+        if entry and sections and not holder:
+            findings.append((5, "entry point outside every section"))
+        elif holder and not holder[0][5] & SCN_EXECUTE:
+            findings.append((4, f"entry point in non-executable section {holder[0][0]}"))
+        elif holder and len(sections) > 1 and holder[0] is sections[-1]:
+            findings.append((2, "entry point in the last section"))
+        return findings
+
+
+PT_LOAD = 1
+PF_X, PF_W = 1, 2
+
+
+class ELFAnomalyRule:
+    name = "elf_anomaly"
+
+    def start(self, file_path, kind):
+        return _HeadChecker(self.analyze) if kind == "elf" else None
+
+    def analyze(self, head):
+        if len(head) < 52 or head[4] not in (1, 2) or head[5] not in (1, 2):
+            return [(3, "malformed ELF header")]
+        bits64 = head[4] == 2
+        order = "<" if head[5] == 1 else ">"
+        if bits64:
+            if len(head) < 64:
+                return [(3, "malformed ELF header")]
+            entry, phoff, shoff = struct.unpack_from(order + "QQQ", head, 24)
+            phentsize, phnum, _, shnum = struct.unpack_from(order + "HHHH", head, 54)
+        else:
+            entry, phoff, shoff = struct.unpack_from(order + "III", head, 24)
+            phentsize, phnum, _, shnum = struct.unpack_from(order + "HHHH", head, 42)
+        findings = []
+        if not shoff or not shnum:
+            findings.append((3, "no section headers"))
+        loads = []
+        for i in range(phnum):
+            at = phoff + i * phentsize
+            if at + (56 if bits64 else 32) > len(head):
+                break
+            if bits64:
+                p_type, flags, _, vaddr, _, _, memsz = struct.unpack_from(order + "IIQQQQQ", head, at)
+            else:
+                p_type, _, vaddr, _, _, memsz, flags = struct.unpack_from(order + "IIIIIII", head, at)
+            if p_type == PT_LOAD:
+                loads.append((vaddr, memsz, flags))
+        if any(flags & PF_X and flags & PF_W for _, _, flags in loads):
+            findings.append((5, "writable and executable segment"))
+        if loads and entry and not any(flags & PF_X and vaddr <= entry < vaddr + memsz
+                                       for vaddr, memsz, flags in loads):
+            findings.append((4, "entry point outside executable segments"))
+        return findings
+
+
+# ---------------- Entropy ----------------
+# One SAMPLE_BYTES sample per ENTROPY_BLOCK keeps this far below hashing cost
+ENTROPY_BLOCK = 64 * 1024
+SAMPLE_BYTES = 4096
+MIN_SAMPLE = 1024
+ENTROPY_LIMIT = 16 * 1024 * 1024
+
+
+def entropy(data):
+    """Shannon entropy in bits per byte."""
+    n = len(data)
+    return -sum(c / n * math.log2(c / n) for c in Counter(data).values()) if n else 0.0
+
+
+class _EntropyChecker:
+    def __init__(self):
+        self.offset = 0
+        self.head = b""
+        self.sample = bytearray()
+        self.sample_at = 0
+        self.peak = (0.0, 0)        # (entropy, offset)
+
+    def _close_sample(self):
+        if len(self.sample) >= MIN_SAMPLE:
+            self.peak = max(self.peak, (entropy(self.sample), self.sample_at))
+        self.sample = bytearray()
+
+    def feed(self, chunk):
+        start = self.offset
+        self.offset += len(chunk)
+        if len(self.head) < STRUCT_BYTES:
+            self.head += chunk[:STRUCT_BYTES - len(self.head)]
+        pos = start
+        while pos < self.offset:
+            in_block = pos % ENTROPY_BLOCK
+            if in_block >= SAMPLE_BYTES:
+                pos += ENTROPY_BLOCK - in_block
+                continue
+            if not self.sample:
+                self.sample_at = pos
+            take = min(SAMPLE_BYTES - in_block, self.offset - pos)
+            self.sample += chunk[pos - start:pos - start + take]
+            pos += take
+            if len(self.sample) == SAMPLE_BYTES:
+                self._close_sample()
+        return self.offset < ENTROPY_LIMIT
+
+    def finish(self):
+        self._close_sample()
+        value, at = self.peak
+        if value < 7.2:
+            return []
+        where = f"at offset {at:#x}"
+        pe = parse_pe(self.head) if self.head[:2] == b"MZ" else None
+        for name, _, _, raw_offset, raw_size, _ in (pe or {}).get("sections", ()):
+            if raw_offset <= at < raw_offset + raw_size:
+                where = f"in section {name}"
+        return [(6 if value >= 7.6 else 3, f"packed or encrypted data {where} (entropy {value:.2f})")]
+
+
+class EntropyRule:
+    name = "entropy"
+
+    def start(self, file_path, kind):
+        return _EntropyChecker() if kind in EXECUTABLE_KINDS else None
+
+
+# ---------------- Scripts ----------------
+SCRIPT_LIMIT = 1024 * 1024
+SCRIPT_OVERLAP = 256
+
+# (points, reason, pattern) - matched case-insensitively
+SCRIPT_PATTERNS = [
+    (6, "encoded PowerShell command", rb"powershell[^\n]{0,80}\s-(?:e|en|enc|encodedcommand)\s"),
+    (4, "Invoke-Expression", rb"invoke-expression|\biex\s*\("),
+    (3, "downloads a payload", rb"downloadstring|downloadfile|invoke-webrequest|net\.webclient"),
+    (2, "decodes base64", rb"frombase64string|base64_decode|b64decode|\batob\s*\("),
+    (6, "evaluates decoded data", rb"\beval\s*\(\s*(?:base64_decode|gzinflate|str_rot13|atob|unescape)"),
+    (5, "pipes a download into a shell", rb"(?:curl|wget)\s[^\n|;]{0,200}\|\s*(?:ba|z)?sh\b"),
+    (5, "reverse shell", rb"/dev/tcp/\S+/\d+|\bnc(?:at)?\s[^\n]{0,40}\s-e\s"),
+    (3, "makes a temp file executable", rb"chmod\s+(?:\+x|[0-7]{3,4})\s+/(?:tmp|dev/shm)/"),
+    (3, "Windows script host shell", rb"wscript\.shell|shell\.application"),
+    (6, "deletes shadow copies", rb"vssadmin[^\n]{0,40}delete\s+shadows"),
+    (2, "persistence hook", rb"crontab\s+-\s*$|>>\s*~?/?\S*\.bashrc|/etc/rc\.local"),
+    (3, "long base64 blob", rb"[a-z0-9+/]{400,}={0,2}"),
+]
+
+
+class _ScriptChecker:
+    def __init__(self, rule):
+        self.rule = rule
+        self.tail = b""
+        self.offset = 0
+        self.found = set()
+
+    def feed(self, chunk):
+        data = self.tail + chunk
+        for m in self.rule.regex.finditer(data):
+            self.found.add(m.lastgroup)
+        self.tail = data[-SCRIPT_OVERLAP:]
+        self.offset += len(chunk)
+        return self.offset < SCRIPT_LIMIT and len(self.found) < len(SCRIPT_PATTERNS)
+
+    def finish(self):
+        return [self.rule.findings[name] for name in sorted(self.found)]
+
+
+class ScriptRule:
+    name = "script"
+
+    def __init__(self, patterns=SCRIPT_PATTERNS):
+        # One alternation: a single pass over each buffer for all patterns
+        self.findings = {f"p{i}": (points, reason) for i, (points, reason, _) in enumerate(patterns)}
+        self.regex = re.compile(b"|".join(b"(?P<p%d>%s)" % (i, pattern)
+                                          for i, (_, _, pattern) in enumerate(patterns)),
+                                re.IGNORECASE | re.MULTILINE)
+
+    def start(self, file_path, kind):
+        return _ScriptChecker(self) if kind in ("script", "text") else None
+
+
+# ---------------- Engine ----------------
+DEFAULT_RULES = (DoubleExtensionRule, PEAnomalyRule, ELFAnomalyRule, EntropyRule, ScriptRule)
+
+
+class FileCheck:
+    def __init__(self, checkers, threshold):
+        self.checkers = checkers
+        self.active = [c for c in checkers if not isinstance(c, _Done)]
+        self.threshold = threshold
+
+    def feed(self, chunk):
+        if self.active:
+            self.active = [c for c in self.active if c.feed(chunk)]
+
+    def wants_more(self):
+        return bool(self.active)
+
+    def finish(self):
+        findings = []
+        for checker in self.checkers:
+            findings.extend(checker.findings if isinstance(checker, _Done) else checker.finish())
+        findings.sort(key=lambda finding: -finding[0])
+        return Verdict(sum(points for points, _ in findings), [reason for _, reason in findings])
+
+    def hits(self, file_path):
+        # [describe(...)] if the file scores at least the threshold, else []
+        verdict = self.finish()
+        return [describe(file_path, verdict)] if verdict.score >= self.threshold else []
+
+
+class HeuristicEngine:
+    """A set of rules plus the score at which a file is reported.
+
+    `rules` are rule classes or instances; a rule has start(path, kind)
+    returning a checker (feed(chunk) -> wants more, finish() ->
+    findings) or None when the file kind does not concern it.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, threshold=THRESHOLD):
+        self.rules = [rule() if isinstance(rule, type) else rule for rule in rules]
+        self.threshold = threshold
+
+    def start(self, file_path, kind):
+        checkers = [rule.start(file_path, kind) for rule in self.rules]
+        return FileCheck([c for c in checkers if c is not None], self.threshold)
+
+    def scan_file(self, file_path):
+        """Heuristic hits for one file, reading it on its own."""
+        with open(file_path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+            check = self.start(file_path, sniff(header, file_path))
+            check.feed(header)
+            while check.wants_more() and (chunk := f.read(CHUNK_SIZE)):
+                check.feed(chunk)
+        return check.hits(file_path)
@@ -1,3 +1,4 @@
+from startup import BackgroundLoader, load_engine
 import os
 import time
 import threading
@@ -169,14 +170,14 @@ class USBMonitor(threading.Thread):
         super().__init__(daemon=True)
         self.app = app
         self._running = True
+        self.psutil = None
+
+    def run(self):
+        # psutil is imported here, off the Tk thread, so it never delays startup
         try:
             import psutil
             self.psutil = psutil
         except Exception:
-            self.psutil = None
-
-    def run(self):
-        if not self.psutil:
             return
         existing = {p.device for p in self.psutil.disk_partitions() if "removable" in p.opts}
         while self._running:
@@ -197,8 +198,9 @@ class USBMonitor(threading.Thread):
 
 # ---------------- Main App ----------------
 class AntivirusApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, loader):
         super().__init__()
+        self.loader = loader
         self.title("⚡ Lian Antivirus — Futuristic")
         self.geometry("1100x700")
         self.minsize(980, 640)
@@ -265,12 +267,14 @@ class AntivirusApp(tk.Tk):
                           relief="flat", bd=0, padx=14, command=cmd)
             b.pack(fill="x", pady=6, padx=10)
 
-        # create tab frames
+        # tab frames are created the first time each tab is shown
         self.tabs = {}
-        self._create_scan_tab()
-        self._create_installer_tab()
-        self._create_maintenance_tab()
-        self._create_settings_tab()
+        self.tab_builders = {
+            "scan": self._create_scan_tab,
+            "installer": self._create_installer_tab,
+            "maintenance And Repairment": self._create_maintenance_tab,
+            "settings": self._create_settings_tab,
+        }
 
         self.show_scan_tab()
 
@@ -409,6 +413,8 @@ class AntivirusApp(tk.Tk):
 
     # ---------------- Show Tabs ----------------
     def _show_tab(self, key):
+        if key not in self.tabs:
+            self.tab_builders[key]()
         # clear all
         for t in self.tabs.values():
             t.pack_forget()
@@ -457,30 +463,80 @@ class AntivirusApp(tk.Tk):
             except queue.Empty:
                 self.after(100, wait_collect)
                 return
-            # proceed with iterative scanning using after to remain responsive
+            # scan on a worker thread so the window stays responsive
             total = len(files)
             if total == 0:
                 messagebox.showinfo("Scan", "No files to scan.")
                 self.progress_ring.reset_to_idle()
                 return
             self.scan_log.insert(tk.END, f"Found {total} files. Starting scan...\n")
-            self._scan_iter(files, 0, total)
+            self._start_scan(files)
         wait_collect()
 
-    def _scan_iter(self, files, idx, total):
-        # simulate scanning a single file
-        if idx >= total:
-            self.scan_log.insert(tk.END, "Scan complete. No threats detected (simulation).\n")
+    def _start_scan(self, files):
+        # The engine runs on a worker thread; the Tk thread only polls the
+        # results (heuristics only if the engine failed to load)
+        results = queue.Queue()
+        engine = self.loader.get("engine")
+        if engine is not None:
+            scan_file = engine.scan_file
+        else:
+            from heuristics import HeuristicEngine
+            error = self.loader.errors.get("engine", "still loading")
+            self.scan_log.insert(tk.END, f"Signature engine unavailable ({error}); heuristics only.\n")
+            scan_file = HeuristicEngine().scan_file
+        self.scan_heuristics_only = engine is None
+
+        def work():
+            for filepath in files:
+                try:
+                    hits = list(scan_file(filepath))
+                except Exception as e:
+                    hits = []
+                    results.put(("error", filepath, e))
+                results.put(("file", filepath, hits))
+            results.put(("done", None, None))
+
+        threading.Thread(target=work, daemon=True).start()
+        self._poll_scan(results, len(files))
+
+    def _poll_scan(self, results, total, idx=0, threats=0):
+        last = None
+        try:
+            while True:
+                kind, filepath, hits = results.get_nowait()
+                if kind == "done":
+                    self._scan_finished(threats)
+                    return
+                if kind == "error":
+                    self.scan_log.insert(tk.END, f"Cannot scan {filepath}: {hits}\n")
+                    continue
+                idx += 1
+                self.scan_log.insert(tk.END, f"Scanning: {os.path.basename(filepath)}\n")
+                for hit in hits:
+                    threats += 1
+                    self.scan_log.insert(tk.END, f"⚠ Threat: {hit}\n")
+                last = filepath
+        except queue.Empty:
+            pass
+        if last is not None:
+            self.progress_ring.update_progress(idx / total * 100, os.path.basename(last))
+        self.after(100, lambda: self._poll_scan(results, total, idx, threats))
+
+    def _scan_finished(self, threats):
+        if self.scan_heuristics_only:
+            # Without signatures a clean result is not a verdict
+            self.scan_log.insert(tk.END, f"Scan complete (heuristics only). {threats} threat(s) detected.\n")
+            messagebox.showwarning("Scan Incomplete",
+                                   f"Signature engine unavailable; heuristics found {threats} threat(s).\n"
+                                   "Files without findings were not checked against signatures.")
+        elif threats:
+            self.scan_log.insert(tk.END, f"Scan complete. {threats} threat(s) detected.\n")
+            messagebox.showwarning("Scan Complete", f"⚠ {threats} threat(s) found.")
+        else:
+            self.scan_log.insert(tk.END, "Scan complete. No threats detected.\n")
             messagebox.showinfo("Scan Complete", "✨ Scan finished successfully!")
-            self.progress_ring.reset_to_idle()
-            return
-        filepath = files[idx]
-        # log step
-        self.scan_log.insert(tk.END, f"Scanning: {os.path.basename(filepath)}\n")
-        percent = (idx + 1) / total * 100
-        self.progress_ring.update_progress(percent, os.path.basename(filepath))
-        # schedule next
-        self.after(8, lambda: self._scan_iter(files, idx + 1, total))
+        self.progress_ring.reset_to_idle()
 
     def install_selected_apps(self):
         selected = [name for key, (var, name) in self.app_vars.items() if var.get()]
@@ -589,7 +645,10 @@ class AntivirusApp(tk.Tk):
         except Exception:
             pass
         # update small labels and panels: brute-force update of text widgets & buttons
-        for txt in (self.scan_log, self.installer_log, self.maintenance_log):
+        for name in ("scan_log", "installer_log", "maintenance_log"):
+            txt = getattr(self, name, None)   # unbuilt tabs have no log yet
+            if txt is None:
+                continue
             try:
                 txt.configure(bg=self.current_theme["panel"], fg=self.current_theme["fg"])
             except Exception:
@@ -611,7 +670,8 @@ class AntivirusApp(tk.Tk):
 
 # ---------------- Run ----------------
 if __name__ == "__main__":
-    app = AntivirusApp()
+    loader = BackgroundLoader({"engine": load_engine}).start()
+    app = AntivirusApp(loader)
     # Splash (simple)
     splash = tk.Toplevel(app)
     splash.overrideredirect(True)
@@ -622,6 +682,9 @@ if __name__ == "__main__":
     tk.Label(splash, text="Initializing UI...", font=("Segoe UI", 10), fg=app.current_theme["muted"],
              bg=app.current_theme["bg"]).pack(side="bottom", pady=14)
     app.withdraw()
-    app.after(9000, lambda: (splash.destroy(), app.deiconify()))
+    loader.mark_on_paint(splash, "first_paint")
+    loader.mark_on_paint(app, "main_window")
+    # close the splash as soon as the signature engine is loaded
+    loader.when_ready(app, lambda: (splash.destroy(), app.deiconify()))
     app.protocol("WM_DELETE_WINDOW", app.on_close)
     app.mainloop()
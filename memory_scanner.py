@@ -0,0 +1,226 @@
+"""Byte-rule scan of running processes through /proc/<pid>/maps and mem.
+
+    python memory_scanner.py [-r RULES] [-p PID ...] [-j N]
+
+Only the regions that can hold code which is not on disk are read:
+executable mappings and anonymous memory (heap, stack, private
+allocations).  Each region is read from /proc/<pid>/mem with large
+os.pread calls and fed to one byte_rules matcher.
+
+Executable mappings of files are verified once per sweep on disk instead
+and skipped in every process when the file was clean, keyed by device,
+inode and path from the maps line, so libc is read once rather than once
+per process.  Mappings of deleted or replaced files are always read from
+memory.  Processes that may not be read (other users, ptrace rules) are
+counted as denied and skipped.
+"""
+import os
+import re
+import sys
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from byte_rules import RuleSet, load_rules
+
+JOBS = min(8, os.cpu_count() or 2)
+# Bytes per os.pread of process memory
+READ_BATCH = 16 * 1024 * 1024
+# Only the first bytes of huge regions (reserved heaps, JIT arenas)
+MAX_REGION = 256 * 1024 * 1024
+# Pseudo-mappings that are not process data
+SKIP_NAMES = {"[vvar]", "[vvar_vclock]", "[vsyscall]"}
+
+Region = namedtuple("Region", "start end perms offset dev inode path")
+
+_MAPS_LINE = re.compile(r"([0-9a-f]+)-([0-9a-f]+) (\S{4}) ([0-9a-f]+) (\S+) (\d+)\s*(.*)")
+
+
+def parse_maps(text):
+    regions = []
+    for line in text.splitlines():
+        m = _MAPS_LINE.match(line)
+        if m:
+            start, end, perms, offset, dev, inode, path = m.groups()
+            regions.append(Region(int(start, 16), int(end, 16), perms, int(offset, 16),
+                                  dev, int(inode), path))
+    return regions
+
+
+def is_anonymous(region):
+    return region.inode == 0 and (not region.path or region.path.startswith("["))
+
+
+def wanted(region):
+    """Executable or anonymous, readable, and not a kernel pseudo-mapping."""
+    if region.perms[0] != "r" or region.path in SKIP_NAMES:
+        return False
+    return region.perms[2] == "x" or is_anonymous(region)
+
+
+def list_pids():
+    return sorted(int(name) for name in os.listdir("/proc") if name.isdigit())
+
+
+def process_name(pid):
+    try:
+        with open(f"/proc/{pid}/comm", encoding="utf-8", errors="replace") as f:
+            return f.read().strip()
+    except OSError:
+        return "?"
+
+
+class MemoryScanner:
+    """One sweep over processes with a byte_rules.RuleSet.
+
+    verify_file(path) -> list of hits decides whether a mapped file is
+    clean on disk; by default the rules are matched over the file.
+    """
+
+    def __init__(self, rules, verify_file=None, read_batch=READ_BATCH, max_region=MAX_REGION):
+        self.rules = rules
+        self.verify_file = verify_file or self._match_file
+        self.read_batch = read_batch
+        self.max_region = max_region
+        self.verified = {}          # (dev, inode, path) -> clean on disk
+        self.verifying = {}         # key -> Event while another thread checks it
+        self.lock = threading.Lock()
+        self.stats = {"processes": 0, "regions": 0, "bytes": 0, "verified_files": 0,
+                      "skipped_verified": 0, "denied": 0, "errors": 0}
+
+    def _bump(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _match_file(self, path):
+        m = self.rules.matcher()
+        with open(path, "rb") as f:
+            while m.wants_more() and (chunk := f.read(1024 * 1024)):
+                m.feed(chunk)
+        return m.finish()
+
+    def _clean_on_disk(self, region):
+        # The maps inode must still be the file at that path, or what is
+        # mapped is not what is on disk
+        if region.path.endswith(" (deleted)") or not region.path.startswith("/"):
+            return False
+        key = (region.dev, region.inode, region.path)
+        with self.lock:
+            if key in self.verified:
+                return self.verified[key]
+            event = self.verifying.get(key)
+            if event is None:
+                self.verifying[key] = threading.Event()
+        if event is not None:
+            event.wait()
+            return self.verified[key]
+        # A file that cannot be verified is read from memory instead;
+        # waiters are released whatever happens
+        clean = False
+        try:
+            clean = os.stat(region.path).st_ino == region.inode and not self.verify_file(region.path)
+        except Exception:
+            pass
+        finally:
+            with self.lock:
+                self.verified[key] = clean
+                self.stats["verified_files"] += 1
+                self.verifying.pop(key).set()
+        return clean
+
+    def _scan_region(self, fd, region):
+        m = self.rules.matcher()
+        pos = region.start
+        end = min(region.end, region.start + self.max_region)
+        while pos < end and m.wants_more():
+            try:
+                data = os.pread(fd, min(self.read_batch, end - pos), pos)
+            except OSError:
+                break           # guard pages and the like read as EIO
+            if not data:
+                break
+            m.feed(data)
+            pos += len(data)
+        self._bump("bytes", pos - region.start)
+        return m.finish()
+
+    def scan_pid(self, pid):
+        """Hit strings for one process: 'pid N (comm) start-end path: rule'."""
+        try:
+            with open(f"/proc/{pid}/maps", encoding="utf-8", errors="replace") as f:
+                regions = [r for r in parse_maps(f.read()) if wanted(r)]
+            fd = os.open(f"/proc/{pid}/mem", os.O_RDONLY)
+        except (PermissionError, ProcessLookupError):
+            self._bump("denied")
+            return []
+        except FileNotFoundError:
+            return []           # exited meanwhile
+        hits = []
+        try:
+            name = process_name(pid)
+            for region in regions:
+                if not is_anonymous(region) and self._clean_on_disk(region):
+                    self._bump("skipped_verified")
+                    continue
+                self._bump("regions")
+                for rule in self._scan_region(fd, region):
+                    hits.append(f"pid {pid} ({name}) {region.start:x}-{region.end:x} "
+                                f"{region.path or '[anon]'}: {rule}")
+        finally:
+            os.close(fd)
+        self._bump("processes")
+        return hits
+
+    def sweep(self, pids=None, jobs=JOBS, progress=None):
+        """Hits over all processes but this one; progress(done, total)
+        is called as processes finish."""
+        pids = [p for p in (pids if pids is not None else list_pids()) if p != os.getpid()]
+        hits = []
+        with ThreadPoolExecutor(max(jobs, 1)) as pool:
+            for done, found in enumerate(pool.map(self._scan_pid_safe, pids), 1):
+                hits.extend(found)
+                if progress is not None:
+                    progress(done, len(pids))
+        return hits
+
+    def _scan_pid_safe(self, pid):
+        # One process that fails does not end the sweep
+        try:
+            return self.scan_pid(pid)
+        except Exception:
+            self._bump("errors")
+            return []
+
+
+def default_rules():
+    """The scanner's rules and patterns, or just rules.txt when the
+    signature package is not installed."""
+    try:
+        import antivirus_scanner
+        return antivirus_scanner.malware_rules
+    except ImportError:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.txt")
+        return load_rules(path) if os.path.exists(path) else RuleSet()
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan process memory with byte-pattern rules.")
+    parser.add_argument("-r", "--rules", help="rule file (default: the scanner's rules)")
+    parser.add_argument("-p", "--pid", type=int, action="append", help="scan only this process")
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS)
+    args = parser.parse_args(argv)
+
+    scanner = MemoryScanner(load_rules(args.rules) if args.rules else default_rules())
+    hits = scanner.sweep(args.pid, args.jobs)
+    for hit in hits:
+        print(hit)
+    stats = scanner.stats
+    print(f"{stats['processes']} processes, {stats['regions']} regions, {stats['bytes'] / 1e6:.1f} MB read, "
+          f"{stats['skipped_verified']} mappings of {stats['verified_files']} files verified on disk, "
+          f"{stats['denied']} denied", file=sys.stderr)
+    return int(bool(hits))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,11 @@
+from startup import BackgroundLoader, load_engine, load_psutil
+from scan_checkpoint import ScanCheckpoint, checkpoint_path
+from heuristics import HeuristicEngine
 import os
 import time
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import threading
-import psutil
 import platform
 
 # ---------------- Style for ttk ----------------
@@ -17,7 +19,7 @@ def set_dark_theme():
 
 # ---------------- Splash Screen ----------------
 class SplashScreen(tk.Toplevel):
-    def __init__(self, parent, image_path, duration=5000):
+    def __init__(self, parent, image_path, duration=None):
         super().__init__(parent)
         self.overrideredirect(True)
         self.geometry("600x400+400+200")
@@ -34,17 +36,20 @@ class SplashScreen(tk.Toplevel):
         footer = tk.Label(self, text="Version 1.0", fg="orange", bg="black", font=("Arial", 10))
         footer.pack(side="left", anchor="s", padx=10, pady=5)
 
-        self.after(duration, self.destroy)
+        # Without a fixed duration the caller closes the splash once loading is done
+        if duration:
+            self.after(duration, self.destroy)
 
 # ---------------- USB Monitor ----------------
 class USBMonitor(threading.Thread):
-    def __init__(self, app):
+    def __init__(self, app, psutil):
         super().__init__(daemon=True)
         self.app = app
+        self.psutil = psutil
         self.existing_devices = self.get_connected_devices()
 
     def get_connected_devices(self):
-        return {p.device for p in psutil.disk_partitions() if "removable" in p.opts}
+        return {p.device for p in self.psutil.disk_partitions() if "removable" in p.opts}
 
     def run(self):
         while True:
@@ -64,18 +69,17 @@ class USBMonitor(threading.Thread):
 
 # ---------------- Antivirus App ----------------
 class AntivirusApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, loader):
         super().__init__()
+        self.loader = loader
         self.title("Lian the Antivirus")
         self.geometry("900x600")
         self.config(bg='black')
 
         set_dark_theme()
 
-        try:
-            self.iconphoto(False, tk.PhotoImage(file="/media/kali/reflector/lian/lian.png"))
-        except Exception:
-            pass
+        # Decoding the icon is not needed for the first frame
+        self.after_idle(self._load_icon)
 
         self.grid_rowconfigure(0, weight=1)
         self.grid_rowconfigure(1, weight=5)
@@ -123,6 +127,7 @@ class AntivirusApp(tk.Tk):
         self.tab_content = tk.Frame(self.bottom_frame, bg="black")
         self.tabs = {}
         self.tab_buttons_frame = None
+        self.tab_content_built = set()
 
         # Start updating CPU status
         self.update_cpu_status()
@@ -138,11 +143,23 @@ class AntivirusApp(tk.Tk):
         self.lian_color_index = (self.lian_color_index + 1) % len(self.lian_colors)
         self.after(800, self.animate_lian_color_slow)
 
+    def _load_icon(self):
+        try:
+            self.iconphoto(False, tk.PhotoImage(file="/media/kali/reflector/lian/lian.png"))
+        except Exception:
+            pass
+
     # CPU status updater
     def update_cpu_status(self):
-        # Update CPU percent
+        # psutil arrives from the background loader; until then show "--"
+        psutil = self.loader.get("psutil")
+        if psutil is None:
+            self.after(2000, self.update_cpu_status)
+            return
+
+        # Update CPU percent (non-blocking: measured since the previous call)
         try:
-            cpu_percent = psutil.cpu_percent(interval=0.1)
+            cpu_percent = psutil.cpu_percent(interval=None)
         except Exception:
             cpu_percent = None
 
@@ -191,7 +208,7 @@ class AntivirusApp(tk.Tk):
         self.scan_dir_label.pack(pady=10)
         self.scan_percent_label.pack(pady=5)
 
-        root_path = "C:\" if platform.system() == "Windows" else "/home"
+        root_path = "C:\\" if platform.system() == "Windows" else "/home"
         total_files = 0
         try:
             total_files = sum(len(files) for _, _, files in os.walk(root_path))
@@ -203,25 +220,43 @@ class AntivirusApp(tk.Tk):
             self.scan_percent_label.config(text="")
             return
 
-        scanned = 0
-        malware_found = False
+        # Progress is journaled, so a crash, reboot or closed window resumes
+        # from where the last run stopped instead of starting over
+        checkpoint = ScanCheckpoint(checkpoint_path("auto_scan"), root_path)
+        if checkpoint.resumed:
+            self.log_message(f"Resuming scan of {root_path}: {checkpoint.files_done} files already done")
+
+        # Signatures and heuristics in one read; heuristics alone if the
+        # signature engine failed to load
+        engine = self.loader.get("engine")
+        heuristics = HeuristicEngine()
 
-        for root, _, files in os.walk(root_path):
-            for file in files:
-                scanned += 1
-                percent = int(scanned / total_files * 100)
+        try:
+            for filepath in checkpoint.iter_files():
+                root = os.path.dirname(filepath)
+                percent = min(100, int((checkpoint.files_done + 1) / total_files * 100))
 
                 # Update UI - schedule on main thread
                 self.after(0, lambda r=root, p=percent: self._update_scan_ui(r, p))
 
-                filepath = os.path.join(root, file)
-                if "virus" in file.lower():
-                    malware_found = True
-
-                time.sleep(0.002)
-
-        if malware_found:
-            self.after(0, lambda: messagebox.showwarning("Scan Complete", "⚠ Malware found and deleted."))
+                if engine is not None:
+                    hits = engine.scan_file(filepath, heuristics=heuristics)
+                else:
+                    try:
+                        hits = heuristics.scan_file(filepath)
+                    except OSError:
+                        hits = []
+                for hit in hits:
+                    self.after(0, lambda h=hit: self.log_message(f"Threat: {h}"))
+                checkpoint.file_done(filepath, hits)
+        except BaseException:
+            checkpoint.close()
+            raise
+        threats = len(checkpoint.infected)
+        checkpoint.finish()
+
+        if threats:
+            self.after(0, lambda: messagebox.showwarning("Scan Complete", f"⚠ {threats} threat(s) found."))
         else:
             self.after(0, lambda: messagebox.showinfo("Scan Complete", "✅ No malware found."))
 
@@ -259,8 +294,12 @@ class AntivirusApp(tk.Tk):
         btn = tk.Button(self.tab_buttons_frame, text=name, width=20, bg="black", fg="lime", command=lambda n=name: self.show_tab(n))
         btn.pack(fill="x", pady=2)
 
-        frame = tk.Frame(self.tab_content, bg="black")
-        self.tabs[name] = frame
+        self.tabs[name] = tk.Frame(self.tab_content, bg="black")
+
+    def build_tab(self, name):
+        # Tab widgets are created the first time the tab is shown
+        frame = self.tabs[name]
+        self.tab_content_built.add(name)
 
         if name == "Scan":
             self.browse_button = tk.Button(frame, text="Browse & Scan", bg="black", fg="lime", command=self.browse_and_scan)
@@ -279,6 +318,8 @@ class AntivirusApp(tk.Tk):
             tk.Label(frame, text=f"{name} content coming soon!", bg="black", fg="lime", font=("Arial", 12)).pack(pady=50)
 
     def show_tab(self, name):
+        if name not in self.tab_content_built:
+            self.build_tab(name)
         for frame in self.tabs.values():
             frame.pack_forget()
         self.tabs[name].pack(expand=True, fill="both")
@@ -300,15 +341,20 @@ class AntivirusApp(tk.Tk):
 
 # ---------------- Main Run ----------------
 if __name__ == "__main__":
-    root = AntivirusApp()
-    splash = SplashScreen(root, "/media/ubuntu-studio/JOKER/I.png", 5000)
+    loader = BackgroundLoader({"psutil": load_psutil, "engine": load_engine}).start()
+    root = AntivirusApp(loader)
     root.withdraw()
-    splash.wait_window()
-    root.deiconify()
-
-    root.after(1000, root.start_auto_scan)
-
-    usb_monitor = USBMonitor(root)
-    usb_monitor.start()
-
+    splash = SplashScreen(root, "/media/ubuntu-studio/JOKER/I.png")
+    loader.mark_on_paint(splash, "first_paint")
+    loader.mark_on_paint(root, "main_window")
+
+    def on_ready():
+        # Signatures and psutil are loaded: swap the splash for the app
+        splash.destroy()
+        root.deiconify()
+        root.after(1000, root.start_auto_scan)
+        if loader.get("psutil") is not None:
+            USBMonitor(root, loader.get("psutil")).start()
+
+    loader.when_ready(root, on_ready)
     root.mainloop()
\ No newline at end of file
@@ -3,10 +3,19 @@ import time
 import threading
 import tempfile
 import math
+import hashlib
 import platform
 import queue
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+from scan_metrics import ScanMetrics
+from scan_checkpoint import ScanCheckpoint, checkpoint_path
+from heuristics import HeuristicEngine
+from memory_scanner import MemoryScanner, default_rules
+from scan_history import ScanHistory, format_time
+from temp_cleaner import TempCleaner, format_bytes
+import startup_items
+from app_installer import Installer, Mirror, DEFAULT_REPO
 
 # ---------------- Theme & Utilities ----------------
 def modern_theme():
@@ -202,6 +211,15 @@ class AntivirusApp(tk.Tk):
         self.current_theme = modern_theme()
         self.scan_mode = tk.StringVar(value="Full")
         self.ai_protect = tk.BooleanVar(value=True)
+        self.scan_metrics = None
+        self.scan_checkpoint = None
+        self.scan_stop = None          # set to stop the running scan's worker
+        self.scan_worker = None
+        self.heuristics = None         # compiled on the first scan
+        self.history = ScanHistory()
+        self.history_scan = None       # history id of the running scan
+        self.history_pages = [None]    # page cursors, newest page first
+        self.package_repo = tk.StringVar(value=DEFAULT_REPO)
 
         # build UI
         self._build_styles()
@@ -302,6 +320,33 @@ class AntivirusApp(tk.Tk):
         tk.Label(ctrl, text="Scan Mode:", bg=self.current_theme["bg"], fg=self.current_theme["muted"]).pack(pady=(12, 2))
         tk.OptionMenu(ctrl, self.scan_mode, "Quick", "Full", "Custom").pack()
 
+        # stats panel (filled from the scan metrics while a scan runs)
+        stats = tk.Frame(mid, bg=self.current_theme["bg"])
+        stats.pack(side="left", padx=8, pady=20, fill="y")
+        tk.Label(stats, text="Scan Stats", bg=self.current_theme["bg"], fg=self.current_theme["muted"],
+                 font=("Segoe UI", 11, "bold")).pack(anchor="w")
+        self.stats_label = tk.Label(stats, text="No scan yet.", justify="left", anchor="w",
+                                    bg=self.current_theme["bg"], fg=self.current_theme["fg"],
+                                    font=("Consolas", 9))
+        self.stats_label.pack(anchor="w", pady=6)
+        tk.Button(stats, text="Export Metrics", bg=self.current_theme["panel"], fg=self.current_theme["accent"],
+                  relief="flat", command=self.export_metrics).pack(anchor="w", pady=6)
+
+        # history: one page of past scans at a time
+        tk.Label(stats, text="Scan History", bg=self.current_theme["bg"], fg=self.current_theme["muted"],
+                 font=("Segoe UI", 11, "bold")).pack(anchor="w", pady=(12, 0))
+        self.history_list = tk.Listbox(stats, width=44, height=8, bg=self.current_theme["panel"],
+                                       fg=self.current_theme["fg"], bd=0, font=("Consolas", 9))
+        self.history_list.pack(anchor="w", pady=4)
+        self.history_list.bind("<<ListboxSelect>>", self._show_history_scan)
+        nav = tk.Frame(stats, bg=self.current_theme["bg"])
+        nav.pack(anchor="w")
+        for text, cmd in (("◀ Newer", self._history_newer), ("Older ▶", self._history_older),
+                          ("Detections (7d)", self._show_recent_detections)):
+            tk.Button(nav, text=text, bg=self.current_theme["panel"], fg=self.current_theme["accent"],
+                      relief="flat", command=cmd).pack(side="left", padx=(0, 4))
+        self._load_history_page()
+
     # ---------------- Tab: Safe App Installer ----------------
     def _create_installer_tab(self):
         f = tk.Frame(self.content, bg=self.current_theme["bg"])
@@ -365,7 +410,7 @@ class AntivirusApp(tk.Tk):
                   fg=self.current_theme["accent"], font=("Segoe UI", 12),
                   command=self.optimize_startup).grid(row=0, column=1, padx=12, pady=8)
 
-        tk.Button(grid, text="🔧 Repair System", bg=self.current_theme["panel"],
+        tk.Button(grid, text="🔧 Scan Memory", bg=self.current_theme["panel"],
                   fg=self.current_theme["accent"], font=("Segoe UI", 12),
                   command=self.repair_system).grid(row=1, column=0, padx=12, pady=8)
 
@@ -402,6 +447,15 @@ class AntivirusApp(tk.Tk):
         tk.Label(mode_frame, text="Default Scan Mode:", bg=self.current_theme["bg"], fg=self.current_theme["muted"]).pack(side="left", padx=6)
         tk.OptionMenu(mode_frame, self.scan_mode, "Quick", "Full", "Custom").pack(side="left")
 
+        # Package mirror for the installer: a folder or http(s) URL
+        repo_frame = tk.Frame(f, bg=self.current_theme["bg"])
+        repo_frame.pack(pady=8)
+        tk.Label(repo_frame, text="Package Mirror:", bg=self.current_theme["bg"], fg=self.current_theme["muted"]).pack(side="left", padx=6)
+        tk.Entry(repo_frame, textvariable=self.package_repo, width=44).pack(side="left")
+        tk.Button(repo_frame, text="Browse", bg=self.current_theme["panel"], fg=self.current_theme["fg"],
+                  command=lambda: self.package_repo.set(filedialog.askdirectory() or self.package_repo.get())
+                  ).pack(side="left", padx=6)
+
     # ---------------- Show Tabs ----------------
     def _show_tab(self, key):
         # clear all
@@ -428,139 +482,492 @@ class AntivirusApp(tk.Tk):
         folder = filedialog.askdirectory()
         if not folder:
             return
-        # collect files in a background thread (safe blocking)
+        # one journal per folder: an interrupted scan can be resumed later
+        self._stop_scan()
+        journal = checkpoint_path("scan-" + hashlib.md5(os.path.abspath(folder).encode()).hexdigest()[:16])
+        checkpoint = ScanCheckpoint(journal, folder)
+        if checkpoint.resumed and not messagebox.askyesno(
+                "Resume Scan", f"A previous scan of this folder stopped after {checkpoint.files_done} files.\n"
+                               "Resume it?"):
+            checkpoint.finish()
+            checkpoint = ScanCheckpoint(journal, folder)
+        self.scan_checkpoint = checkpoint
+        self.history_scan = self.history.begin_scan(folder)
+        # count files in a background thread (safe blocking)
         self.scan_log.delete("1.0", tk.END)
         self.scan_log.insert(tk.END, f"Scanning folder: {folder}\nCollecting files...\n")
+        self.scan_metrics = ScanMetrics()
+        self.scan_threats = list(checkpoint.infected)
+        try:
+            from antivirus_scanner import scan_file, refresh_signatures
+            # Each scan starts with the newest published signatures
+            refresh_signatures()
+            self.scan_file = scan_file
+        except ImportError as e:
+            self.scan_file = None
+            self.scan_log.insert(tk.END, f"Signature engine unavailable ({e}); heuristics only.\n")
+        if self.heuristics is None:
+            self.heuristics = HeuristicEngine()
         self.progress_ring.update_progress(0, "Collecting...")
         self.progress_ring.stop_radar()
 
         collect_q = queue.Queue()
 
         def collect():
-            files = []
-            for root, _, filenames in os.walk(folder):
-                for f in filenames:
-                    files.append(os.path.join(root, f))
-            collect_q.put(files)
+            collect_q.put(sum(len(filenames) for _, _, filenames in os.walk(folder)))
 
         t = threading.Thread(target=collect, daemon=True)
         t.start()
 
         def wait_collect():
             try:
-                files = collect_q.get_nowait()
+                total = collect_q.get_nowait()
             except queue.Empty:
                 self.after(100, wait_collect)
                 return
-            # proceed with iterative scanning using after to remain responsive
-            total = len(files)
+            # scan on a worker thread so the window stays responsive
             if total == 0:
+                checkpoint.finish()
+                self.scan_checkpoint = None
+                self._finish_history("done")
                 messagebox.showinfo("Scan", "No files to scan.")
                 self.progress_ring.reset_to_idle()
                 return
-            self.scan_log.insert(tk.END, f"Found {total} files. Starting scan...\n")
-            self._scan_iter(files, 0, total)
+            if checkpoint.resumed:
+                self.scan_log.insert(tk.END, f"Found {total} files. Resuming after {checkpoint.files_done}...\n")
+            else:
+                self.scan_log.insert(tk.END, f"Found {total} files. Starting scan...\n")
+            self._start_scan(checkpoint, total)
         wait_collect()
 
-    def _scan_iter(self, files, idx, total):
-        # simulate scanning a single file
-        if idx >= total:
-            self.scan_log.insert(tk.END, "Scan complete. No threats detected (simulation).\n")
+    def _stop_scan(self):
+        # The worker closes its own journal once it sees the stop flag; it
+        # is waited for, so nothing writes the journal after this returns
+        if self.scan_checkpoint is None:
+            return
+        if self.scan_stop is not None:
+            self.scan_stop.set()
+            self.scan_worker.join()
+        else:
+            self.scan_checkpoint.close()
+        self.scan_checkpoint = self.scan_stop = self.scan_worker = None
+        self._finish_history("interrupted")
+
+    def _start_scan(self, checkpoint, total):
+        # Files are scanned and recorded on a worker thread; the Tk thread
+        # only polls the results queue and updates the widgets
+        if checkpoint is not self.scan_checkpoint:
+            return      # superseded while counting
+        stop, results = threading.Event(), queue.Queue()
+        scan_id = self.history_scan
+
+        def work():
+            try:
+                for filepath in checkpoint.iter_files():
+                    if stop.is_set():
+                        checkpoint.close()
+                        return
+                    found = self._scan_one(scan_id, filepath)
+                    checkpoint.file_done(filepath, found)
+                    results.put(("file", filepath, found))
+                if stop.is_set():
+                    checkpoint.close()
+                    return
+                checkpoint.finish()
+                results.put(("done", None, None))
+            except Exception as e:     # the journal could not be written
+                results.put(("error", None, e))
+
+        self.scan_stop = stop
+        self.scan_worker = threading.Thread(target=work, daemon=True)
+        self.scan_worker.start()
+        self._poll_scan(stop, results, checkpoint, total)
+
+    def _scan_one(self, scan_id, filepath):
+        # worker thread: heuristics only when the engine could not be loaded
+        start = time.perf_counter()
+        try:
+            if self.scan_file:
+                found = self.scan_file(filepath, metrics=self.scan_metrics, heuristics=self.heuristics)
+            else:
+                found = self.heuristics.scan_file(filepath)
+        except Exception as e:
+            self.scan_metrics.error(e)
+            self.history.record_error(scan_id, filepath, e)
+            found = None
+        self.scan_metrics.file_done(filepath, time.perf_counter() - start)
+        self.scan_metrics.count("files")
+        if found is None:
+            return []
+        self.history.record(scan_id, filepath, found)
+        return found
+
+    def _poll_scan(self, stop, results, checkpoint, total):
+        if stop.is_set():
+            return      # stopped or superseded by a newer scan
+        last = None
+        try:
+            while True:
+                kind, filepath, found = results.get_nowait()
+                if kind != "file":
+                    self._scan_finished(found if kind == "error" else None)
+                    return
+                self.scan_log.insert(tk.END, f"Scanning: {os.path.basename(filepath)}\n")
+                for hit in found:
+                    self.scan_threats.append(hit)
+                    self.scan_log.insert(tk.END, f"⚠ Threat: {hit}\n")
+                last = filepath
+        except queue.Empty:
+            pass
+        if last is not None:
+            self._update_stats_panel()
+            percent = min(100, checkpoint.files_done / total * 100)
+            self.progress_ring.update_progress(percent, os.path.basename(last))
+        self.after(100, lambda: self._poll_scan(stop, results, checkpoint, total))
+
+    def _scan_finished(self, error):
+        self.scan_checkpoint = self.scan_stop = self.scan_worker = None
+        self._finish_history("failed" if error else "done")
+        self._update_stats_panel()
+        self.progress_ring.reset_to_idle()
+        if error:
+            self.scan_log.insert(tk.END, f"Scan stopped: {error}\n")
+            messagebox.showerror("Scan", f"Scan stopped: {error}")
+        elif self.scan_threats:
+            self.scan_log.insert(tk.END, f"Scan complete. {len(self.scan_threats)} threat(s) detected.\n")
+            messagebox.showwarning("Scan Complete", "⚠ Threats found:\n\n" + "\n".join(self.scan_threats[:20]))
+        else:
+            self.scan_log.insert(tk.END, "Scan complete. No threats detected.\n")
             messagebox.showinfo("Scan Complete", "✨ Scan finished successfully!")
-            self.progress_ring.reset_to_idle()
+
+    def _update_stats_panel(self):
+        snap = self.scan_metrics.snapshot()
+        counters = snap["counters"]
+        lines = [
+            f"files    {counters.get('files', 0)}",
+            f"read     {counters.get('bytes_read', 0) / 1e6:.1f} MB",
+            f"skipped  {counters.get('skipped', 0) + counters.get('rejected', 0)}",
+            f"errors   {sum(snap['errors'].values())}",
+            "",
+            "stage       total   p99",
+        ]
+        for name, st in snap["stages"].items():
+            lines.append(f"{name:<10} {st['sum']:6.2f}s {st['p99'] * 1000:6.1f}ms")
+        if snap["slowest"]:
+            lines.append("")
+            lines.append("slowest:")
+            for item in snap["slowest"][:3]:
+                lines.append(f"{item['seconds'] * 1000:7.1f}ms {os.path.basename(item['path'])[:22]}")
+        self.stats_label.config(text="\n".join(lines))
+
+    # ---------------- Scan history ----------------
+    def _finish_history(self, status):
+        if self.history_scan is None:
+            return
+        files = self.scan_metrics.snapshot()["counters"].get("files", 0) if self.scan_metrics else 0
+        self.history.finish_scan(self.history_scan, files, len(self.scan_threats), status)
+        self.history_scan = None
+        self.history_pages = [None]
+        self._load_history_page()
+
+    def _load_history_page(self):
+        self.history_rows = self.history.scans(self.history_pages[-1], limit=8)
+        self.history_list.delete(0, tk.END)
+        for _, root, started, _, status, files, threats in self.history_rows:
+            mark = "⚠" if threats else " "
+            self.history_list.insert(tk.END, f"{mark} {format_time(started)} {files:6} {status[:4]} "
+                                             f"{os.path.basename(root) or root}")
+
+    def _history_older(self):
+        if len(self.history_rows) == 8:
+            self.history_pages.append(self.history_rows[-1][0])
+            self._load_history_page()
+
+    def _history_newer(self):
+        if len(self.history_pages) > 1:
+            self.history_pages.pop()
+            self._load_history_page()
+
+    def _show_history_scan(self, _event=None):
+        picked = self.history_list.curselection()
+        if not picked:
+            return
+        scan_id, root, started, finished, status, files, threats = self.history_rows[picked[0]]
+        self.scan_log.delete("1.0", tk.END)
+        self.scan_log.insert(tk.END, f"{root}\n{format_time(started)} - {format_time(finished)} ({status})\n"
+                                     f"{files} files, {threats} threat(s)\n")
+        for _, path, _, _, detail in self.history.verdicts(scan_id, limit=50, infected_only=True):
+            self.scan_log.insert(tk.END, f"⚠ {detail}\n")
+
+    def _show_recent_detections(self):
+        self.scan_log.delete("1.0", tk.END)
+        rows = self.history.detections(time.time() - 7 * 86400, limit=50)
+        self.scan_log.insert(tk.END, f"Detections in the last 7 days{' (newest 50)' if len(rows) == 50 else ''}:\n")
+        for _, _, path, t, detail in rows:
+            self.scan_log.insert(tk.END, f"{format_time(t)} {detail}\n")
+        if not rows:
+            self.scan_log.insert(tk.END, "None.\n")
+
+    def export_metrics(self):
+        if self.scan_metrics is None:
+            messagebox.showinfo("Export Metrics", "Run a scan first.")
             return
-        filepath = files[idx]
-        # log step
-        self.scan_log.insert(tk.END, f"Scanning: {os.path.basename(filepath)}\n")
-        percent = (idx + 1) / total * 100
-        self.progress_ring.update_progress(percent, os.path.basename(filepath))
-        # schedule next
-        self.after(8, lambda: self._scan_iter(files, idx + 1, total))
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("Prometheus", "*.prom")])
+        if path:
+            self.scan_metrics.export(path)
 
     def install_selected_apps(self):
-        selected = [name for key, (var, name) in self.app_vars.items() if var.get()]
+        selected = [key for key, (var, name) in self.app_vars.items() if var.get()]
         if not selected:
             messagebox.showinfo("Installer", "No apps selected.")
             return
+        repo = self.package_repo.get().strip()
         self.installer_log.delete("1.0", tk.END)
-        self.installer_log.insert(tk.END, f"Preparing to install {len(selected)} apps...\n")
+        self.installer_log.insert(tk.END, f"Installing {len(selected)} apps from {repo}...\n")
         self.progress_ring.stop_radar()
-        # simulate sequential install using after
-        self._install_iter(selected, 0)
+        self.progress_ring.update_progress(0, "Installing")
+        events = queue.Queue()
+        share = {}                     # key -> fraction done
 
-    def _install_iter(self, apps, idx):
-        if idx >= len(apps):
-            self.installer_log.insert(tk.END, "All selected apps installed (simulated).\n")
-            messagebox.showinfo("Installer", "Installation simulation complete.")
-            self.progress_ring.reset_to_idle()
+        def run():
+            mirror = Mirror(repo)
+            try:
+                installer = Installer(mirror, progress=lambda *event: events.put(("progress", event)))
+                events.put(("done", installer.run(selected)))
+            except Exception as e:
+                events.put(("error", e))
+            finally:
+                mirror.close()
+
+        def poll():
+            try:
+                while True:
+                    kind, value = events.get_nowait()
+                    if kind == "progress":
+                        key, stage, done, total = value
+                        if stage == "fetch":
+                            share[key] = done / max(total, 1) / 2
+                        elif stage in ("cached", "verified"):
+                            share[key] = 0.5
+                            self.installer_log.insert(tk.END, f"{key}: {stage}\n")
+                        else:
+                            share[key] = 1.0
+                    else:
+                        self._installs_done(kind, value)
+                        return
+            except queue.Empty:
+                pass
+            if share:
+                self.progress_ring.update_progress(sum(share.values()) / len(share) * 100, "Installing")
+            self.after(100, poll)
+
+        threading.Thread(target=run, daemon=True).start()
+        poll()
+
+    def _installs_done(self, kind, value):
+        self.progress_ring.reset_to_idle()
+        if kind == "error":
+            self.installer_log.insert(tk.END, f"Install failed: {value}\n")
+            messagebox.showerror("Installer", f"Could not install from the package mirror:\n{value}")
             return
-        app = apps[idx]
-        self.installer_log.insert(tk.END, f"Installing {app}...\n")
-        # show progress arc for each app (fake percent)
-        steps = 50
-        def step(i=0):
-            pct = (i / steps) * 100
-            self.progress_ring.update_progress(pct, f"Installing {app}")
-            if i < steps:
-                self.after(18, lambda: step(i + 1))
-            else:
-                self.installer_log.insert(tk.END, f"{app} installed.\n")
-                self.after(300, lambda: self._install_iter(apps, idx + 1))
-        step()
+        for key, (ok, message) in value.items():
+            self.installer_log.insert(tk.END, f"{'✔' if ok else '✖'} {message}\n")
+        failed = [key for key, (ok, _) in value.items() if not ok]
+        if failed:
+            messagebox.showwarning("Installer", "Not installed: " + ", ".join(failed))
+        else:
+            messagebox.showinfo("Installer", "All selected apps installed.")
 
     def clear_temp_files(self):
-        # SAFE simulation: count files in temp dir and offer to "clear" (but we won't delete by default)
+        # Dry run first, in the background; delete only after confirmation
         tmp = tempfile.gettempdir()
-        count = 0
-        for root, _, files in os.walk(tmp):
-            count += len(files)
-        if count == 0:
-            self.maintenance_log.insert(tk.END, "No temporary files found (or none accessible).\n")
-            messagebox.showinfo("Clear Temp", "No temporary files found.")
+        self.maintenance_log.insert(tk.END, f"Looking for old files in {tmp}...\n")
+        self.progress_ring.stop_radar()
+        self._run_cleaner(TempCleaner(progress=self._cleaner_progress), tmp, self._confirm_clear)
+
+    def _run_cleaner(self, cleaner, folder, done):
+        # The cleaner reports from worker threads; only the Tk thread
+        # touches widgets, polling the queue
+        self.cleaner_q = queue.Queue()
+
+        def run():
+            try:
+                self.cleaner_q.put(("done", cleaner.run([folder])))
+            except Exception as e:
+                self.cleaner_q.put(("error", e))
+
+        threading.Thread(target=run, daemon=True).start()
+
+        def poll():
+            last = None
+            try:
+                while True:
+                    kind, report = self.cleaner_q.get_nowait()
+                    if kind == "done":
+                        done(folder, report)
+                        return
+                    if kind == "error":
+                        self.progress_ring.reset_to_idle()
+                        self.maintenance_log.insert(tk.END, f"Clear temp failed: {report}\n")
+                        messagebox.showerror("Clear Temp", f"Clear temp failed: {report}")
+                        return
+                    last = report
+            except queue.Empty:
+                pass
+            if last is not None:
+                pct = last["dirs"] / max(last["dirs_seen"], 1) * 100
+                self.progress_ring.update_progress(pct, f"{last['files']} files, {format_bytes(last['bytes'])}")
+            self.after(100, poll)
+        poll()
+
+    def _cleaner_progress(self, report):
+        self.cleaner_q.put(("progress", report))
+
+    def _confirm_clear(self, folder, report):
+        self.progress_ring.reset_to_idle()
+        if report["files"] == 0:
+            self.maintenance_log.insert(tk.END, "No old temporary files found (or none accessible).\n")
+            messagebox.showinfo("Clear Temp", "No old temporary files found.")
             return
-        if messagebox.askyesno("Clear Temp", f"Found ~{count} files in temp. Simulate deletion?"):
-            # Simulate deletion progress
-            self.maintenance_log.insert(tk.END, f"Simulating removal of {count} temp files...\n")
-            steps = min(80, count)
-            def step(i=0):
-                pct = (i / steps) * 100
-                self.progress_ring.update_progress(pct, "Clearing temp")
-                if i < steps:
-                    self.after(25, lambda: step(i + 1))
-                else:
-                    self.maintenance_log.insert(tk.END, "Temp files 'cleared' (simulation).\n")
-                    messagebox.showinfo("Clear Temp", "Temporary files cleared (simulation).")
-                    self.progress_ring.reset_to_idle()
-            step()
-        else:
+        size = format_bytes(report["bytes"])
+        self.maintenance_log.insert(tk.END, f"Found {report['files']} files ({size}) untouched for a day.\n")
+        if not messagebox.askyesno("Clear Temp", f"Delete {report['files']} temporary files ({size})?"):
             self.maintenance_log.insert(tk.END, "Clear temp cancelled by user.\n")
+            return
+        self.progress_ring.stop_radar()
+        self._run_cleaner(TempCleaner(delete=True, progress=self._cleaner_progress), folder, self._cleared)
+
+    def _cleared(self, folder, report):
+        freed = format_bytes(report["bytes"])
+        self.maintenance_log.insert(tk.END, f"Removed {report['files']} files, freed {freed}.\n")
+        if report["errors"]:
+            self.maintenance_log.insert(tk.END, f"{report['errors']} files or folders could not be removed.\n")
+        messagebox.showinfo("Clear Temp", f"Freed {freed}.")
+        self.progress_ring.reset_to_idle()
 
     def optimize_startup(self):
         self.maintenance_log.insert(tk.END, "Analyzing startup items...\n")
-        # fake analysis
         self.progress_ring.stop_radar()
-        def run_opt(i=0):
-            self.progress_ring.update_progress(i*10, "Optimizing startup")
-            if i < 10:
-                self.after(150, lambda: run_opt(i+1))
-            else:
-                self.maintenance_log.insert(tk.END, "Startup optimized (simulation).\n")
-                messagebox.showinfo("Optimize Startup", "Startup optimization complete (simulation).")
-                self.progress_ring.reset_to_idle()
-        run_opt()
+        self.progress_ring.update_progress(0, "Analyzing startup")
+        result_q = queue.Queue()
+
+        def run():
+            try:
+                result_q.put(startup_items.analyze())
+            except Exception as e:
+                result_q.put(e)
+
+        def wait_result():
+            try:
+                analysis = result_q.get_nowait()
+            except queue.Empty:
+                self.after(100, wait_result)
+                return
+            self.progress_ring.reset_to_idle()
+            if isinstance(analysis, Exception):
+                self.maintenance_log.insert(tk.END, f"Startup analysis failed: {analysis}\n")
+                return
+            self._show_startup_items(analysis)
+
+        threading.Thread(target=run, daemon=True).start()
+        wait_result()
+
+    def _show_startup_items(self, analysis):
+        items = analysis.items
+        self.maintenance_log.insert(tk.END, f"{len(items)} startup items; boot times from "
+                                            f"{analysis.timing_source}.\n")
+        for change, item in analysis.changes:
+            self.maintenance_log.insert(tk.END, f"  {change} since last run: {item.id}\n")
+        if not items:
+            return
+        win = tk.Toplevel(self)
+        win.title("Startup Items")
+        win.configure(bg=self.current_theme["bg"])
+        tk.Label(win, text="Costliest first (boot time, memory)", bg=self.current_theme["bg"],
+                 fg=self.current_theme["muted"]).pack(anchor="w", padx=10, pady=(10, 2))
+        listbox = tk.Listbox(win, width=90, height=18, selectmode="extended", bg=self.current_theme["panel"],
+                             fg=self.current_theme["fg"], font=("Consolas", 9), bd=0)
+        listbox.pack(padx=10, pady=4, fill="both", expand=True)
+        for item in items:
+            boot = f"{item.boot_ms / 1000:6.2f}s" if item.boot_ms is not None else "      -"
+            memory = f"{item.memory_kb / 1024:7.1f} MB" if item.memory_kb is not None else "        -"
+            listbox.insert(tk.END, f"{boot} {memory}  {item.kind:<9} {item.name}")
+
+        def disable_selected():
+            picked = [items[i] for i in listbox.curselection()]
+            if not picked or not messagebox.askyesno(
+                    "Optimize Startup", f"Disable {len(picked)} startup item(s)?", parent=win):
+                return
+            for item in picked:
+                ok, message = startup_items.disable(item)
+                self.maintenance_log.insert(tk.END, f"{'Disabled' if ok else 'Could not disable'} "
+                                                    f"{item.id}: {message}\n")
+            win.destroy()
+
+        tk.Button(win, text="Disable Selected", bg=self.current_theme["panel"], fg=self.current_theme["accent"],
+                  relief="flat", command=disable_selected).pack(pady=(4, 10))
 
     def repair_system(self):
-        self.maintenance_log.insert(tk.END, "Running quick repair routines...\n")
+        # Sweep running processes for code that is not on disk
+        self.maintenance_log.insert(tk.END, "Scanning process memory...\n")
         self.progress_ring.stop_radar()
-        def run_rep(i=0):
-            self.progress_ring.update_progress(i*12.5, "Repairing")
-            if i < 8:
-                self.after(180, lambda: run_rep(i+1))
+        try:
+            from antivirus_scanner import malware_rules, scan_file
+            scanner = MemoryScanner(malware_rules, verify_file=scan_file)
+        except ImportError as e:
+            self.maintenance_log.insert(tk.END, f"Signature engine unavailable ({e}); rules.txt only.\n")
+            scanner = MemoryScanner(default_rules())
+
+        # Only the Tk thread touches widgets: the sweep reports through a
+        # queue, polled like the cleaner's
+        results = queue.Queue()
+
+        def progress(done, total):
+            results.put(("progress", done / total * 100))
+
+        def run():
+            try:
+                results.put(("done", scanner.sweep(progress=progress)))
+            except Exception as e:
+                results.put(("error", e))
+
+        def poll():
+            percent = None
+            try:
+                while True:
+                    kind, value = results.get_nowait()
+                    if kind == "progress":
+                        percent = value
+                    else:
+                        finish(kind, value)
+                        return
+            except queue.Empty:
+                pass
+            if percent is not None:
+                self.progress_ring.update_progress(percent, "Memory scan")
+            self.after(100, poll)
+
+        def finish(kind, value):
+            self.progress_ring.reset_to_idle()
+            if kind == "error":
+                self.maintenance_log.insert(tk.END, f"Memory scan failed: {value}\n")
+                messagebox.showerror("Memory Scan", f"Memory scan failed: {value}")
+                return
+            hits, stats = value, scanner.stats
+            for hit in hits:
+                self.maintenance_log.insert(tk.END, f"⚠ Threat: {hit}\n")
+            self.maintenance_log.insert(
+                tk.END, f"{stats['processes']} processes, {stats['regions']} regions, "
+                        f"{stats['bytes'] / 1e6:.1f} MB read; {stats['skipped_verified']} mappings "
+                        f"verified on disk; {stats['denied']} processes not readable.\n")
+            if hits:
+                messagebox.showwarning("Memory Scan", "⚠ Threats in memory:\n\n" + "\n".join(hits[:20]))
             else:
-                self.maintenance_log.insert(tk.END, "Repair finished (simulation).\n")
-                messagebox.showinfo("Repair", "System repair complete (simulation).")
-                self.progress_ring.reset_to_idle()
-        run_rep()
+                messagebox.showinfo("Memory Scan", "No threats found in process memory.")
+
+        threading.Thread(target=run, daemon=True).start()
+        poll()
 
     def apply_theme(self, name):
         if name == "modern":
@@ -597,6 +1004,9 @@ class AntivirusApp(tk.Tk):
         print(f"[LIAN] {msg}")
 
     def on_close(self):
+        # keep an unfinished scan's journal for the next run
+        self._stop_scan()
+        self.history.close()
         # stop USB monitor
         try:
             self.usb_monitor.stop()
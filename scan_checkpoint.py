@@ -0,0 +1,171 @@
+import os
+import json
+import time
+
+# Seconds between snapshots; the append-only log covers the gap
+SNAPSHOT_INTERVAL = 30
+# Log records buffered before a write (lost records only mean re-scanning)
+FLUSH_EVERY = 64
+
+CHECKPOINT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "lian")
+
+
+def checkpoint_path(name):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    return os.path.join(CHECKPOINT_DIR, f"{name}.journal")
+
+
+class ScanCheckpoint:
+    """Resumable depth-first traversal backed by an on-disk journal.
+
+    The journal is a snapshot (<path>.snap: traversal frontier, directory
+    in progress and the names already done in it, totals, detections)
+    plus an append-only log (<path>.log) of what happened since.  Every
+    log record carries a sequence number so records older than the
+    snapshot are ignored after a crash between snapshot and truncation.
+
+    Usage:
+        cp = ScanCheckpoint(path, root)
+        for file_path in cp.iter_files():
+            cp.file_done(file_path, hits)
+        cp.finish()
+    """
+
+    def __init__(self, path, root, interval=SNAPSHOT_INTERVAL):
+        self.snap_path = f"{path}.snap"
+        self.log_path = f"{path}.log"
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.stack = [self.root]    # directories not yet started
+        self.current = None         # directory being scanned
+        self.current_done = set()   # names finished in self.current
+        self.files_done = 0
+        self.infected = []
+        self.seq = 0
+        self.resumed = self._load()
+        self.pending = []
+        self.last_snapshot = time.monotonic()
+        self.log = open(self.log_path, "a", encoding="utf-8")
+
+    # ---------------- persistence ----------------
+    def _load(self):
+        try:
+            with open(self.snap_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("root") != self.root:
+            return False
+        self.stack = state["stack"]
+        self.current = state["current"]
+        self.current_done = set(state["current_done"])
+        self.files_done = state["files_done"]
+        self.infected = state["infected"]
+        self.seq = state["seq"]
+        try:
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break           # torn final line
+                    if record["seq"] > self.seq:
+                        self._apply(record)
+        except OSError:
+            pass
+        return True
+
+    def _apply(self, record):
+        self.seq = record["seq"]
+        op = record["op"]
+        if op == "dir":
+            self.stack.pop()
+            self.current = record["path"]
+            self.current_done = set()
+        elif op == "file":
+            self.current_done.add(record["name"])
+            self.files_done += 1
+            self.infected.extend(record.get("hits", ()))
+        elif op == "done":
+            self.stack.extend(record["subdirs"])
+            self.current = None
+            self.current_done = set()
+
+    def _record(self, op, **fields):
+        record = {"seq": self.seq + 1, "op": op, **fields}
+        self._apply(record)
+        self.pending.append(json.dumps(record))
+        if len(self.pending) >= FLUSH_EVERY:
+            self.flush()
+        if time.monotonic() - self.last_snapshot >= self.interval:
+            self.snapshot()
+
+    def flush(self):
+        if self.pending:
+            self.log.write("\n".join(self.pending) + "\n")
+            self.log.flush()
+            self.pending = []
+
+    def snapshot(self):
+        self.flush()
+        state = {
+            "root": self.root,
+            "stack": self.stack,
+            "current": self.current,
+            "current_done": sorted(self.current_done),
+            "files_done": self.files_done,
+            "infected": self.infected,
+            "seq": self.seq,
+        }
+        tmp = f"{self.snap_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snap_path)
+        # The snapshot now covers every logged record
+        self.log.close()
+        self.log = open(self.log_path, "w", encoding="utf-8")
+        self.last_snapshot = time.monotonic()
+
+    def close(self):
+        # Persist progress so a later run can resume
+        self.snapshot()
+        self.log.close()
+
+    def finish(self):
+        # The scan completed: drop the journal
+        self.log.close()
+        for path in (self.snap_path, self.log_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # ---------------- traversal ----------------
+    def iter_files(self):
+        """Yield file paths not yet done; call file_done() for each one."""
+        while self.current is not None or self.stack:
+            if self.current is None:
+                self._record("dir", path=self.stack[-1])
+            files, subdirs = [], []
+            try:
+                with os.scandir(self.current) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                            elif entry.is_file() and entry.name not in self.current_done:
+                                files.append(entry.path)
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+            for file_path in files:
+                yield file_path
+            # Subdirectories join the frontier only once this one is done,
+            # so resuming a half-done directory never queues them twice
+            self._record("done", subdirs=sorted(subdirs, reverse=True))
+
+    def file_done(self, file_path, hits=()):
+        self._record("file", name=os.path.basename(file_path), hits=list(hits))
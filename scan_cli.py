@@ -0,0 +1,200 @@
+"""Headless scanner for cron, CI and servers without a display.
+
+    python scan_cli.py [-j N] [--prefetch N] [--cache FILE] [--db FILE] [--rules FILE]
+                       [--fuzzy FILE] [--trees FILE] [--heuristics]
+                       [--format text|jsonl|sarif] PATH [PATH...]
+
+Exit status: 0 clean, 1 infected files found, 2 errors and nothing found.
+"""
+import os
+import sys
+import json
+import argparse
+
+EXIT_CLEAN = 0
+EXIT_INFECTED = 1
+EXIT_ERROR = 2
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+
+class TextWriter:
+    def __init__(self, out, verbose=False):
+        self.out = out
+        self.verbose = verbose
+
+    def result(self, path, infected, error):
+        for hit in infected:
+            self.out.write(f"{hit}: INFECTED\n")
+        if error:
+            self.out.write(f"{path}: ERROR\n")
+        elif self.verbose and not infected:
+            self.out.write(f"{path}: OK\n")
+        self.out.flush()
+
+    def finish(self, summary):
+        self.out.write(f"Scanned {summary['files']} files, {summary['infected']} infected, "
+                       f"{summary['errors']} errors\n")
+
+
+class JsonLinesWriter:
+    def __init__(self, out, verbose=False):
+        self.out = out
+        self.verbose = verbose
+
+    def _line(self, record):
+        self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+
+    def result(self, path, infected, error):
+        for hit in infected:
+            self._line({"type": "detection", "path": hit})
+        if error:
+            self._line({"type": "error", "path": path})
+        elif self.verbose and not infected:
+            self._line({"type": "clean", "path": path})
+
+    def finish(self, summary):
+        self._line({"type": "summary", **summary})
+
+
+# Hit suffixes other than plain signature matches: (marker, SARIF rule, level, message)
+HIT_KINDS = (
+    (" (heuristic ", "heuristic", "warning", "Suspicious file (score {})"),
+    (" (rule ", "byte-rule", "error", "Malware byte pattern matched: {}"),
+    (" (similar ", "fuzzy-match", "warning", "Similar to known malware ({})"),
+    (" (chunk ", "infected-chunk", "error", "Known infected chunk {}"),
+)
+
+
+class SarifWriter:
+    # SARIF is one JSON document, so results are collected and written at the end
+    def __init__(self, out, verbose=False):
+        self.out = out
+        self.results = []
+
+    def result(self, path, infected, error):
+        for hit in infected:
+            for marker, rule, level, text in HIT_KINDS:
+                hit_path, found, detail = hit.partition(marker)
+                if found:
+                    text = text.format(detail[:-1])
+                    break
+            else:
+                rule, level, text = "malware-signature", "error", f"Known malware signature matched: {hit}"
+            self.results.append({
+                "ruleId": rule,
+                "level": level,
+                "message": {"text": text},
+                "locations": [{"physicalLocation": {"artifactLocation": {"uri": hit_path.split("!")[0]}}}],
+            })
+        if error:
+            self.results.append({
+                "ruleId": "scan-error",
+                "level": "warning",
+                "message": {"text": f"File could not be scanned: {path}"},
+                "locations": [{"physicalLocation": {"artifactLocation": {"uri": path}}}],
+            })
+
+    def finish(self, summary):
+        json.dump({
+            "$schema": SARIF_SCHEMA,
+            "version": "2.1.0",
+            "runs": [{
+                "tool": {"driver": {
+                    "name": "antivirus_reflector",
+                    "rules": [
+                        {"id": "malware-signature", "shortDescription": {"text": "Known malware"}},
+                        {"id": "byte-rule", "shortDescription": {"text": "Malware byte pattern"}},
+                        {"id": "infected-chunk", "shortDescription": {"text": "Known infected region of a large file"}},
+                        {"id": "fuzzy-match", "shortDescription": {"text": "Variant of a known sample"}},
+                        {"id": "heuristic", "shortDescription": {"text": "Suspicious structure or content"}},
+                        {"id": "scan-error", "shortDescription": {"text": "Unreadable file"}},
+                    ],
+                }},
+                "results": self.results,
+                "properties": summary,
+            }],
+        }, self.out, indent=2)
+        self.out.write("\n")
+
+
+WRITERS = {"text": TextWriter, "jsonl": JsonLinesWriter, "sarif": SarifWriter}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scan files and directories for known malware.")
+    parser.add_argument("paths", nargs="+", help="files or directories to scan")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="files scanned in parallel (default: CPU count)")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="N",
+                        help="opens and reads kept in flight ahead of the hashers (default: off)")
+    parser.add_argument("--cache", help="hash cache file, reused across runs")
+    parser.add_argument("--db", help="signature database file (default: signatures.db)")
+    parser.add_argument("--rules", help="byte-pattern rule file (default: rules.txt)")
+    parser.add_argument("--fuzzy", help="fuzzy hash index of reference samples (default: fuzzy.txt)")
+    parser.add_argument("--trees", help="tree-hash index for huge files (default: trees.txt)")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="text")
+    parser.add_argument("-v", "--verbose", action="store_true", help="also report clean files")
+    parser.add_argument("--metrics", help="write scan metrics here (.prom or JSON)")
+    parser.add_argument("--heuristics", action="store_true",
+                        help="also report files the heuristic rules score as suspicious")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    import antivirus_scanner
+    from hash_cache import HashCache
+    from scan_metrics import ScanMetrics, NULL_METRICS
+    from heuristics import HeuristicEngine
+
+    if args.db:
+        antivirus_scanner.use_signatures(args.db)
+    if args.rules:
+        antivirus_scanner.use_rules(args.rules)
+    if args.fuzzy:
+        antivirus_scanner.use_fuzzy(args.fuzzy)
+    if args.trees:
+        antivirus_scanner.use_trees(args.trees)
+    cache = HashCache(args.cache) if args.cache else None
+    metrics = ScanMetrics() if args.metrics else NULL_METRICS
+    heuristics = HeuristicEngine() if args.heuristics else None
+    writer = WRITERS[args.format](sys.stdout, args.verbose)
+    summary = {"files": 0, "infected": 0, "errors": 0}
+
+    try:
+        for target in args.paths:
+            if os.path.isdir(target):
+                results = antivirus_scanner.iter_scan(target, None, metrics, max(args.jobs, 1), cache,
+                                                      heuristics, args.prefetch)
+            elif os.path.exists(target):
+                stats = {}
+                results = [(target, antivirus_scanner.scan_file(target, stats, metrics, cache, heuristics),
+                            bool(stats.get("errors")))]
+            else:
+                print(f"No such file or directory: {target}", file=sys.stderr)
+                results = [(target, [], True)]
+            for path, infected, error in results:
+                summary["files"] += 1
+                summary["infected"] += len(infected)
+                summary["errors"] += error
+                writer.result(path, infected, error)
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        summary["errors"] += 1
+    finally:
+        if cache is not None:
+            cache.save()
+        if args.metrics:
+            metrics.export(args.metrics)
+
+    writer.finish(summary)
+    if summary["infected"]:
+        return EXIT_INFECTED
+    return EXIT_ERROR if summary["errors"] else EXIT_CLEAN
+
+
+if __name__ == "__main__":
+    sys.exit(main())
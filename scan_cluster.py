@@ -0,0 +1,358 @@
+"""Spread one scan over several worker processes or hosts.
+
+    python scan_cluster.py coordinator ROOT [--listen 127.0.0.1:7700]
+    python scan_cluster.py worker [--connect 127.0.0.1:7700] [-j N]
+    python scan_cluster.py local ROOT [--workers 4]
+
+The coordinator walks ROOT (stat only), cuts the files into shards of
+consecutive directories bounded by size and file count, and leases them
+to workers.  A lease that is not renewed by a heartbeat expires and the
+shard goes back to the queue, so a dead worker only costs its current
+shard.  ROOT must be mounted at the same path on every worker host.
+Addresses are "host:port" or "unix:/path/to/socket".
+
+Protocol: one JSON object per line, each request answered by one line.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import socketserver
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_ADDRESS = "127.0.0.1:7700"
+LEASE_SECONDS = 30
+SHARD_BYTES = 256 * 1024 * 1024
+SHARD_FILES = 2000
+
+
+def parse_address(address):
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+# ---------------- Coordinator ----------------
+def iter_shards(root, max_bytes=SHARD_BYTES, max_files=SHARD_FILES):
+    # Walk order keeps a directory's files together in as few shards as possible
+    from antivirus_scanner import iter_files
+    paths, size = [], 0
+    for entry in iter_files(root):
+        try:
+            size += entry.stat().st_size
+        except OSError:
+            pass
+        paths.append(entry.path)
+        if size >= max_bytes or len(paths) >= max_files:
+            yield paths, size
+            paths, size = [], 0
+    if paths:
+        yield paths, size
+
+
+class Coordinator:
+    def __init__(self, root, lease_seconds=LEASE_SECONDS, max_bytes=SHARD_BYTES, max_files=SHARD_FILES):
+        self.lock = threading.Lock()
+        self.lease_seconds = lease_seconds
+        self.shards = {}                # id -> paths
+        self.queue = deque()            # shard ids waiting for a worker
+        self.leases = {}                # id -> (worker, expiry)
+        self.done = set()
+        self.walk_finished = False
+        self.infected = []
+        self.files = 0
+        self.errors = 0
+        self.reassigned = 0
+        self.workers = set()
+        self.finished = threading.Event()
+        self.started = time.time()
+        threading.Thread(target=self._walk, args=(root, max_bytes, max_files), daemon=True).start()
+
+    def _walk(self, root, max_bytes, max_files):
+        for shard_id, (paths, _) in enumerate(iter_shards(root, max_bytes, max_files)):
+            with self.lock:
+                self.shards[shard_id] = paths
+                self.queue.append(shard_id)
+        with self.lock:
+            self.walk_finished = True
+            self._check_finished()
+
+    def _check_finished(self):
+        if self.walk_finished and len(self.done) == len(self.shards):
+            self.finished.set()
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for shard_id, (worker, expiry) in list(self.leases.items()):
+            if expiry < now:
+                self._requeue(shard_id)
+
+    def _requeue(self, shard_id):
+        del self.leases[shard_id]
+        self.queue.appendleft(shard_id)
+        self.reassigned += 1
+
+    def worker_lost(self, worker):
+        # Connection dropped: don't wait for the lease to expire
+        with self.lock:
+            for shard_id, (owner, _) in list(self.leases.items()):
+                if owner == worker:
+                    self._requeue(shard_id)
+
+    def handle(self, msg):
+        op, worker = msg.get("op"), msg.get("worker")
+        with self.lock:
+            self.workers.add(worker)
+            if op == "lease":
+                self._expire_leases()
+                if self.queue:
+                    shard_id = self.queue.popleft()
+                    self.leases[shard_id] = (worker, time.monotonic() + self.lease_seconds)
+                    return {"shard": shard_id, "paths": self.shards[shard_id], "lease": self.lease_seconds}
+                if self.finished.is_set():
+                    return {"done": True}
+                return {"wait": 0.5}
+            if op == "heartbeat":
+                shard_id = msg["shard"]
+                lease = self.leases.get(shard_id)
+                if lease is None or lease[0] != worker:
+                    return {"ok": False}        # reassigned: worker should drop it
+                self.leases[shard_id] = (worker, time.monotonic() + self.lease_seconds)
+                return {"ok": True}
+            if op == "result":
+                shard_id = msg["shard"]
+                # A late result from a worker whose lease expired still counts
+                # if nobody else finished the shard first
+                if shard_id not in self.done:
+                    self.done.add(shard_id)
+                    self.leases.pop(shard_id, None)
+                    if shard_id in self.queue:
+                        self.queue.remove(shard_id)
+                    self.infected.extend(msg["infected"])
+                    self.files += msg["files"]
+                    self.errors += msg["errors"]
+                    self._check_finished()
+                return {"ok": True}
+        return {"error": f"unknown op {op!r}"}
+
+    def summary(self):
+        with self.lock:
+            return {
+                "files": self.files,
+                "infected": sorted(self.infected),
+                "errors": self.errors,
+                "shards": len(self.shards),
+                "reassigned": self.reassigned,
+                "workers": len(self.workers - {None}),
+                "seconds": round(time.time() - self.started, 3),
+            }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        worker = None
+        try:
+            for line in self.rfile:
+                msg = json.loads(line)
+                worker = msg.get("worker", worker)
+                reply = self.server.coordinator.handle(msg)
+                self.wfile.write((json.dumps(reply) + "\n").encode())
+        except (OSError, ValueError):
+            pass
+        finally:
+            if worker is not None and not self.server.coordinator.finished.is_set():
+                self.server.coordinator.worker_lost(worker)
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(coordinator, address):
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            os.remove(addr)
+        server = _UnixServer(addr, _Handler)
+    else:
+        server = _TCPServer(addr, _Handler)
+    server.coordinator = coordinator
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_coordinator(root, address, lease_seconds=LEASE_SECONDS, grace=2.0, **shard_limits):
+    coordinator = Coordinator(root, lease_seconds, **shard_limits)
+    server = serve(coordinator, address)
+    coordinator.finished.wait()
+    time.sleep(grace)       # let idle workers hear "done"
+    server.shutdown()
+    server.server_close()
+    return coordinator.summary()
+
+
+# ---------------- Worker ----------------
+class _Connection:
+    def __init__(self, address):
+        family, addr = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(addr)
+        self.file = self.sock.makefile("rwb")
+        self.lock = threading.Lock()
+
+    def request(self, msg):
+        with self.lock:
+            self.file.write((json.dumps(msg) + "\n").encode())
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise ConnectionError("coordinator closed the connection")
+        return json.loads(line)
+
+
+def _scan_paths(paths, jobs, still_leased):
+    import antivirus_scanner
+    # Long-running workers pick up signature updates between shards
+    antivirus_scanner.refresh_signatures()
+    db = antivirus_scanner.signature_db
+
+    def scan(path):
+        # (digest, archive hits); digest is None when there is nothing to
+        # look up (skipped, or the lease was lost).  None alone means the
+        # file could not be stat'ed or read, and is counted as an error.
+        if not still_leased.is_set():
+            return None, []
+        local = {}
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if antivirus_scanner.size_skippable(path, st.st_size):
+            return None, []
+        result = antivirus_scanner.digest_file(path, db, local)
+        return None if local.get("errors") else result
+
+    with ThreadPoolExecutor(max(jobs, 1)) as pool:
+        results = list(pool.map(scan, paths))
+    errors = sum(result is None for result in results)
+    # The whole shard's digests are checked in one lookup
+    scanned = [(path, result) for path, result in zip(paths, results) if result is not None]
+    found = db.lookup_many([digest for _, (digest, _) in scanned])
+    infected = []
+    for (path, (_, archive_hits)), hit in zip(scanned, found):
+        if hit:
+            infected.append(path)
+        infected.extend(archive_hits)
+    return infected, errors
+
+
+def run_worker(address, jobs=1, name=None, retry_seconds=10):
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.monotonic() + retry_seconds
+    while True:
+        try:
+            conn = _Connection(address)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+    scanned = 0
+    while True:
+        reply = conn.request({"op": "lease", "worker": name})
+        if reply.get("done"):
+            return scanned
+        if "wait" in reply:
+            time.sleep(reply["wait"])
+            continue
+        shard_id, paths = reply["shard"], reply["paths"]
+        still_leased = threading.Event()
+        still_leased.set()
+        stop = threading.Event()
+
+        def heartbeat(interval=reply["lease"] / 3):
+            while not stop.wait(interval):
+                try:
+                    if not conn.request({"op": "heartbeat", "worker": name, "shard": shard_id}).get("ok"):
+                        still_leased.clear()
+                        return
+                except (OSError, ValueError):
+                    return
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            infected, errors = _scan_paths(paths, jobs, still_leased)
+        finally:
+            stop.set()
+            beat.join()
+        if still_leased.is_set():
+            conn.request({"op": "result", "worker": name, "shard": shard_id,
+                          "infected": infected, "files": len(paths), "errors": errors})
+            scanned += len(paths)
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed scan coordinator and worker.")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    coord = sub.add_parser("coordinator", help="shard ROOT and hand it out to workers")
+    coord.add_argument("root")
+    coord.add_argument("--listen", default=DEFAULT_ADDRESS)
+
+    worker = sub.add_parser("worker", help="scan shards leased from a coordinator")
+    worker.add_argument("--connect", default=DEFAULT_ADDRESS)
+    worker.add_argument("-j", "--jobs", type=int, default=1)
+    worker.add_argument("--name")
+
+    local = sub.add_parser("local", help="coordinator plus N worker processes on this machine")
+    local.add_argument("root")
+    local.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    local.add_argument("--listen", default=f"unix:/tmp/scan_cluster.{os.getpid()}.sock")
+
+    for p in (coord, local):
+        p.add_argument("--lease", type=float, default=LEASE_SECONDS)
+        p.add_argument("--shard-mb", type=float, default=SHARD_BYTES / 1024 / 1024)
+        p.add_argument("--shard-files", type=int, default=SHARD_FILES)
+    args = parser.parse_args(argv)
+
+    if args.mode == "worker":
+        scanned = run_worker(args.connect, args.jobs, args.name)
+        print(f"Worker done: {scanned} files", file=sys.stderr)
+        return 0
+
+    limits = {"max_bytes": int(args.shard_mb * 1024 * 1024), "max_files": args.shard_files}
+    procs = []
+    if args.mode == "local":
+        procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker",
+                                   "--connect", args.listen, "--name", f"local-{i}"])
+                 for i in range(args.workers)]
+    try:
+        summary = run_coordinator(args.root, args.listen, args.lease, **limits)
+    finally:
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if args.listen.startswith("unix:") and os.path.exists(args.listen[5:]):
+            os.remove(args.listen[5:])
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["infected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
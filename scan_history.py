@@ -0,0 +1,216 @@
+"""Scan history: per-scan summaries and per-file verdicts in SQLite.
+
+    python scan_history.py scans [--limit N]
+    python scan_history.py last-clean PATH
+    python scan_history.py detections [--days N]
+
+Verdicts are queued by the scanning thread and written by a background
+thread in one transaction per batch, so recording costs a scan no more
+than a queue.put.  Every query the app makes is served by an index and
+paged by key (newest first, continue before the last row seen), so a
+page costs the same however long the history grows.
+"""
+import os
+import sys
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from contextlib import nullcontext
+
+HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "lian", "history.db")
+# Verdicts per write transaction, and the longest a verdict waits
+BATCH = 512
+FLUSH_SECONDS = 1.0
+PAGE = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    root TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    status TEXT NOT NULL DEFAULT 'running',
+    files INTEGER NOT NULL DEFAULT 0,
+    threats INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS verdicts (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER NOT NULL REFERENCES scans(id),
+    path TEXT NOT NULL,
+    time REAL NOT NULL,
+    verdict TEXT NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS scans_started ON scans(started);
+CREATE INDEX IF NOT EXISTS verdicts_scan ON verdicts(scan_id, id);
+CREATE INDEX IF NOT EXISTS verdicts_path ON verdicts(path, verdict, time);
+CREATE INDEX IF NOT EXISTS verdicts_detected ON verdicts(time, id) WHERE verdict = 'infected';
+"""
+
+CLEAN, INFECTED, ERROR = "clean", "infected", "error"
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ScanHistory:
+    """Usage:
+        history = ScanHistory()
+        scan_id = history.begin_scan(folder)
+        history.record(scan_id, path, hits)         # from the scan loop
+        history.finish_scan(scan_id, files, threats)
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.conn = _connect(path)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()    # the query connection is shared
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    # ---------------- writing ----------------
+    def begin_scan(self, root):
+        with self.lock, self.conn:
+            return self.conn.execute("INSERT INTO scans (root, started) VALUES (?, ?)",
+                                     (os.path.abspath(root), time.time())).lastrowid
+
+    # Paths are stored absolute, as last_clean() looks them up
+    def record(self, scan_id, path, hits):
+        self.queue.put((scan_id, os.path.abspath(path), time.time(), INFECTED if hits else CLEAN,
+                        "\n".join(hits) if hits else None))
+
+    def record_error(self, scan_id, path, exc):
+        self.queue.put((scan_id, os.path.abspath(path), time.time(), ERROR, str(exc)))
+
+    def finish_scan(self, scan_id, files, threats, status="done"):
+        self.flush()
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE scans SET finished = ?, status = ?, files = ?, threats = ? WHERE id = ?",
+                              (time.time(), status, files, threats, scan_id))
+
+    def flush(self):
+        """Wait until every queued verdict is written."""
+        self.queue.join()
+
+    def _write_loop(self):
+        # Own connection: SQLite connections are not shared across
+        # threads that write
+        conn = self.conn if self.path == ":memory:" else _connect(self.path)
+        guard = self.lock if conn is self.conn else nullcontext()
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + FLUSH_SECONDS
+            while len(batch) < BATCH and batch[-1] is not None:
+                try:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            rows = [item for item in batch if item is not None]
+            try:
+                with guard, conn:
+                    conn.executemany("INSERT INTO verdicts (scan_id, path, time, verdict, detail) "
+                                     "VALUES (?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                print(f"Scan history: dropped {len(rows)} verdicts: {e}")
+            for _ in batch:
+                self.queue.task_done()
+            if batch[-1] is None:
+                if conn is not self.conn:
+                    conn.close()
+                return
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+        self.conn.close()
+
+    # ---------------- queries ----------------
+    def _query(self, sql, args):
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def scans(self, before=None, limit=PAGE):
+        """Newest scans first; pass the last id of a page as before for
+        the next one.  Rows: (id, root, started, finished, status, files, threats)."""
+        return self._query("SELECT id, root, started, finished, status, files, threats FROM scans "
+                           "WHERE id < ? ORDER BY id DESC LIMIT ?",
+                           (before if before is not None else sys.maxsize, limit))
+
+    def verdicts(self, scan_id, after=None, limit=PAGE, infected_only=False):
+        """One scan's verdicts in scan order.  Rows: (id, path, time, verdict, detail)."""
+        where = " AND verdict = 'infected'" if infected_only else ""
+        return self._query("SELECT id, path, time, verdict, detail FROM verdicts "
+                           f"WHERE scan_id = ? AND id > ?{where} ORDER BY id LIMIT ?",
+                           (scan_id, after or 0, limit))
+
+    def last_clean(self, path):
+        """Time of the last clean verdict for path, or None."""
+        row = self._query("SELECT max(time) FROM verdicts WHERE path = ? AND verdict = 'clean'",
+                          (os.path.abspath(path),))
+        return row[0][0]
+
+    def detections(self, since, before=None, limit=PAGE):
+        """Infected verdicts since a time, newest first; page with the
+        (time, id) of the last row.  Rows: (id, scan_id, path, time, detail)."""
+        before_time, before_id = before if before is not None else (float("inf"), sys.maxsize)
+        return self._query("SELECT id, scan_id, path, time, detail FROM verdicts "
+                           "WHERE verdict = 'infected' AND time >= ? AND (time, id) < (?, ?) "
+                           "ORDER BY time DESC, id DESC LIMIT ?",
+                           (since, before_time, before_id, limit))
+
+    def prune(self, before):
+        """Drop scans started before a time, with their verdicts."""
+        self.flush()
+        with self.lock, self.conn:
+            old = "SELECT id FROM scans WHERE started < ?"
+            self.conn.execute(f"DELETE FROM verdicts WHERE scan_id IN ({old})", (before,))
+            self.conn.execute("DELETE FROM scans WHERE started < ?", (before,))
+
+
+def format_time(t):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(t)) if t else "-"
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the scan history.")
+    parser.add_argument("--db", default=HISTORY_PATH)
+    sub = parser.add_subparsers(dest="mode", required=True)
+    scans = sub.add_parser("scans")
+    scans.add_argument("--limit", type=int, default=PAGE)
+    clean = sub.add_parser("last-clean")
+    clean.add_argument("path")
+    found = sub.add_parser("detections")
+    found.add_argument("--days", type=float, default=7)
+    args = parser.parse_args(argv)
+
+    history = ScanHistory(args.db)
+    try:
+        if args.mode == "scans":
+            for id_, root, started, _, status, files, threats in history.scans(limit=args.limit):
+                print(f"{id_:5} {format_time(started)} {status:<11} {files:7} files {threats:4} threats  {root}")
+        elif args.mode == "last-clean":
+            print(format_time(history.last_clean(args.path)))
+        else:
+            since, page = time.time() - args.days * 86400, None
+            while rows := history.detections(since, page, 500):
+                for id_, scan_id, path, t, detail in rows:
+                    print(f"{format_time(t)} scan {scan_id}  {path}: {detail}")
+                page = (rows[-1][3], rows[-1][0])
+    finally:
+        history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
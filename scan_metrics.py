@@ -0,0 +1,178 @@
+import os
+import time
+import json
+import heapq
+import errno
+import bisect
+import threading
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.n += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.n:
+            return 0.0
+        rank, seen = q * self.n, 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class ScanMetrics:
+    """Per-stage timings, counters, errors by errno and the slowest files.
+
+    Stages are timed with `with metrics.stage("hash"): ...`.  Pass
+    NULL_METRICS instead when nothing should be recorded.
+    """
+    enabled = True
+
+    def __init__(self, slowest=10):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.errors = {}
+        self.slowest_n = slowest
+        self.slowest = []           # min-heap of (seconds, path)
+        self.started = time.time()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def error(self, exc):
+        code = errno.errorcode.get(getattr(exc, "errno", None) or 0, type(exc).__name__)
+        with self.lock:
+            self.errors[code] = self.errors.get(code, 0) + 1
+
+    def file_done(self, path, seconds):
+        with self.lock:
+            item = (seconds, path)
+            if len(self.slowest) < self.slowest_n:
+                heapq.heappush(self.slowest, item)
+            elif item > self.slowest[0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "elapsed": round(time.time() - self.started, 3),
+                "counters": dict(self.counters),
+                "errors": dict(self.errors),
+                "stages": {
+                    name: {
+                        "count": h.n,
+                        "sum": round(h.total, 6),
+                        "p50": h.quantile(0.5),
+                        "p99": h.quantile(0.99),
+                        "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], h.counts)),
+                    }
+                    for name, h in self.histograms.items()
+                },
+                "slowest": [{"path": p, "seconds": round(s, 6)} for s, p in sorted(self.slowest, reverse=True)],
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            lines.append("# TYPE antivirus_stage_seconds histogram")
+            for name, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip([str(b) for b in BUCKETS] + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(f'antivirus_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'antivirus_stage_seconds_sum{{stage="{name}"}} {h.total}')
+                lines.append(f'antivirus_stage_seconds_count{{stage="{name}"}} {h.n}')
+            lines.append("# TYPE antivirus_scan_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'antivirus_scan_total{{counter="{name}"}} {value}')
+            lines.append("# TYPE antivirus_scan_errors_total counter")
+            for code, value in sorted(self.errors.items()):
+                lines.append(f'antivirus_scan_errors_total{{errno="{code}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        # .prom files for the node_exporter textfile collector, JSON otherwise;
+        # written to a temp file first so collectors never see half a file
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullMetrics:
+    """Drop-in ScanMetrics that records nothing."""
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def observe(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def error(self, exc):
+        pass
+
+    def file_done(self, path, seconds):
+        pass
+
+
+NULL_METRICS = NullMetrics()
@@ -0,0 +1,422 @@
+import os
+import sys
+import hashlib
+from array import array
+from itertools import accumulate, groupby
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Bytes hashed at each end of a file for the partial digests
+PARTIAL_SIZE = 64 * 1024
+
+# size, head and tail are None for signatures that only know the full MD5
+Signature = namedtuple("Signature", "md5 size head tail")
+
+
+def partial_digests(f, size, n=PARTIAL_SIZE):
+    """MD5 of the first and last n bytes of an open binary file."""
+    f.seek(0)
+    head = hashlib.md5(f.read(n)).hexdigest()
+    f.seek(max(size - n, 0))
+    tail = hashlib.md5(f.read(n)).hexdigest()
+    return head, tail
+
+
+def signature_from_file(file_path):
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        full = hashlib.md5()
+        while chunk := f.read(1024 * 1024):
+            full.update(chunk)
+        head, tail = partial_digests(f, size)
+    return Signature(full.hexdigest(), size, head, tail)
+
+
+def format_signature(sig):
+    return " ".join("-" if v is None else str(v) for v in sig)
+
+
+def parse_signature(line):
+    """Parse one DB line, "md5 [size [head tail]]" with "-" for unknown.
+
+    Returns None for blank lines and "#" comments.
+    """
+    fields = line.split()
+    if not fields or fields[0].startswith("#"):
+        return None
+    fields += ["-"] * (4 - len(fields))
+    md5, size, head, tail = (None if v == "-" else v for v in fields[:4])
+    return Signature(md5.lower(), None if size is None else int(size), head, tail)
+
+
+def parse_version(line):
+    # DB files may start with "# version N"
+    fields = line.split()
+    if len(fields) == 3 and fields[:2] == ["#", "version"]:
+        return int(fields[2])
+    return None
+
+
+def read_version(path):
+    """Version of a DB file without loading it (0 if it has no header)."""
+    with open(path, encoding="utf-8") as f:
+        return parse_version(f.readline()) or 0
+
+
+def raw_digest(md5):
+    """16-byte form of a hex MD5, or None if md5 is not one."""
+    try:
+        raw = bytes.fromhex(md5)
+    except (TypeError, ValueError):
+        return None
+    return raw if len(raw) == 16 else None
+
+
+class DigestTable:
+    """Sorted raw 16-byte digests packed into one immutable bytes object.
+
+    16 bytes per digest, against roughly 130 for a hex string in a set.
+    `starts` records where each 2-byte prefix begins, so a lookup only
+    searches the few entries sharing the prefix, with bytes.find().
+    With numpy, lookup_many() searches a whole batch of digests at once.
+    """
+
+    PREFIXES = 1 << 16
+
+    def __init__(self, digests=()):
+        digests = [raw for raw, _ in groupby(sorted(digests))]
+        self.data = b"".join(digests)
+        self.starts = None
+        # A view of data, not a copy
+        self.array = numpy.frombuffer(self.data, dtype="S16") if numpy is not None and digests else None
+        if digests:
+            counts = array("I", [0]) * (self.PREFIXES + 1)
+            for raw in digests:
+                counts[(raw[0] << 8 | raw[1]) + 1] += 1
+            self.starts = array("I", accumulate(counts))
+
+    @classmethod
+    def from_buffer(cls, buf, exclude=()):
+        """Table of the raw digests packed in buf, less those in exclude,
+        without a bytes object per digest when numpy is there."""
+        if numpy is None:
+            drop, buf = set(exclude), bytes(buf)
+            return cls(raw for raw in (buf[i:i + 16] for i in range(0, len(buf), 16)) if raw not in drop)
+        digests = numpy.unique(numpy.frombuffer(buf, dtype="S16"))
+        if exclude:
+            digests = digests[~numpy.isin(digests, numpy.array(list(exclude), dtype="S16"))]
+        table = cls()
+        if len(digests):
+            table.data = digests.tobytes()
+            table.array = numpy.frombuffer(table.data, dtype="S16")
+            counts = numpy.bincount(numpy.frombuffer(table.data, dtype=">u2")[::8], minlength=cls.PREFIXES)
+            table.starts = array("I", [0])
+            table.starts.frombytes(numpy.cumsum(counts, dtype=numpy.uint32).tobytes())
+        return table
+
+    def __len__(self):
+        return len(self.data) // 16
+
+    def __iter__(self):
+        for i in range(0, len(self.data), 16):
+            yield self.data[i:i + 16]
+
+    def __contains__(self, raw):
+        if raw is None or self.starts is None:
+            return False
+        prefix = raw[0] << 8 | raw[1]
+        end = self.starts[prefix + 1] * 16
+        pos = self.data.find(raw, self.starts[prefix] * 16, end)
+        # A match straddling two entries is not a match
+        while pos > 0 and pos % 16:
+            pos = self.data.find(raw, pos + 1, end)
+        return pos >= 0
+
+    def lookup_many(self, digests):
+        """[raw_digest(d) in self for d in digests] for hex digests."""
+        if self.array is None:
+            return [raw_digest(digest) in self for digest in digests]
+        valid = None
+        try:
+            raw = bytes.fromhex("".join(digests))
+        except (TypeError, ValueError):
+            raw = b""
+        if len(raw) != 16 * len(digests):
+            # Some are not MD5s: zeros stand in for them and are masked out
+            raws = [raw_digest(digest) for digest in digests]
+            valid = numpy.array([r is not None for r in raws])
+            raw = b"".join(r or bytes(16) for r in raws)
+        queries = numpy.frombuffer(raw, dtype="S16")
+        # Binary search of every query at once, each within its prefix's
+        # entries: a few steps over neighbouring cache lines
+        prefixes = numpy.frombuffer(raw, dtype=">u2")[::8].astype(numpy.intp)
+        starts = numpy.frombuffer(self.starts, dtype=numpy.uint32)
+        lo = starts[prefixes].astype(numpy.intp)
+        hi = starts[prefixes + 1].astype(numpy.intp)
+        last = len(self.array) - 1
+        while (searching := lo < hi).any():
+            mid = (lo + hi) >> 1
+            below = self.array[numpy.minimum(mid, last)] < queries
+            lo = numpy.where(searching & below, mid + 1, lo)
+            hi = numpy.where(searching & ~below, mid, hi)
+        hits = self.array[numpy.minimum(lo, last)] == queries
+        if valid is not None:
+            hits &= valid
+        return hits.tolist()
+
+
+class SignatureDB:
+    """Known-malware digests plus enough metadata to reject files early.
+
+    `md5 in db` works like the old `malware_hashes` set.  might_match()
+    answers "could this file be malware?" from its size and, for large
+    files, a digest of its first and last PARTIAL_SIZE bytes.
+
+    Plain MD5s - the bulk of a feed - are not kept as hex strings with a
+    Signature each but as raw digests in a DigestTable, a fraction of the
+    memory (see signature_profile.py).  Digests added after the last
+    pack() sit in the `bare` set until the next one.
+    """
+
+    def __init__(self, signatures=(), version=0):
+        self.entries = {}           # md5 -> Signature, for sized signatures
+        self.by_size = {}           # size -> set of candidate md5s
+        self.packed = DigestTable()  # raw digests of size-less signatures
+        self.bare = set()            # ... added since the last pack()
+        self.dropped = set()         # ... removed from packed since then
+        self.unsized = 0             # size-less signatures, wherever kept
+        self.version = version
+        for sig in signatures:
+            self.add(sig)
+        self.pack()
+
+    def pack(self):
+        """Fold recent additions and removals into the packed table."""
+        if self.bare or self.dropped:
+            kept = [raw for raw in self.packed if raw not in self.dropped]
+            self.packed = DigestTable(kept + list(self.bare))
+            self.bare, self.dropped = set(), set()
+
+    def add_plain(self, buf):
+        """Add size-less signatures given as one buffer of raw digests,
+        the bulk of a feed, straight into the packed table."""
+        self.pack()
+        sized = {raw_digest(md5) for md5 in self.entries} - {None}
+        self.packed = DigestTable.from_buffer(self.packed.data + buf if len(self.packed) else buf, sized)
+        self.unsized = len(self.packed) + sum(sig.size is None for sig in self.entries.values())
+
+    def _has_raw(self, raw):
+        return raw in self.bare or (raw in self.packed and raw not in self.dropped)
+
+    def add(self, sig):
+        if sig.md5 in self:
+            if sig.size is None:
+                return
+            self.remove(sig.md5)
+        if sig.size is None:
+            self.unsized += 1
+            raw = raw_digest(sig.md5)
+            if raw in self.dropped:
+                self.dropped.discard(raw)
+                return
+            if raw is not None:
+                self.bare.add(raw)
+                return
+        else:
+            self.by_size.setdefault(sig.size, set()).add(sig.md5)
+        self.entries[sig.md5] = sig
+
+    def remove(self, md5):
+        sig = self.entries.pop(md5, None)
+        if sig is None:
+            raw = raw_digest(md5)
+            if raw in self.bare:
+                self.bare.discard(raw)
+                self.unsized -= 1
+            elif self._has_raw(raw):
+                self.dropped.add(raw)
+                self.unsized -= 1
+            return
+        if sig.size is None:
+            self.unsized -= 1
+        else:
+            candidates = self.by_size[sig.size]
+            candidates.discard(md5)
+            if not candidates:
+                del self.by_size[sig.size]
+
+    def get(self, md5):
+        sig = self.entries.get(md5)
+        if sig is None and self._has_raw(raw_digest(md5)):
+            sig = Signature(md5, None, None, None)
+        return sig
+
+    def candidates(self, size):
+        return self.by_size.get(size, ())
+
+    def signatures(self):
+        yield from self.entries.values()
+        for raw in self.bare:
+            yield Signature(raw.hex(), None, None, None)
+        for raw in self.packed:
+            if raw not in self.dropped:
+                yield Signature(raw.hex(), None, None, None)
+
+    def __contains__(self, md5):
+        return md5 in self.entries or self._has_raw(raw_digest(md5))
+
+    def __len__(self):
+        return len(self.entries) + len(self.bare) + len(self.packed) - len(self.dropped)
+
+    def lookup_many(self, digests):
+        """[digest in self for digest in digests], one call per batch."""
+        if self.entries.keys().isdisjoint(digests) and not self.bare and not self.dropped:
+            # Common case: only the packed table needs checking
+            return self.packed.lookup_many(digests)
+        return list(map(self.__contains__, digests))
+
+    def size_rejects(self, size):
+        """True if no signature can match a file of this size."""
+        return not self.unsized and not self.candidates(size)
+
+    def might_match(self, size, f=None):
+        # Entries without a size could be any file, so nothing is rejected
+        if self.unsized:
+            return True
+        candidates = self.candidates(size)
+        if not candidates:
+            return False
+        if f is None or size <= PARTIAL_SIZE:
+            return True
+        sigs = [self.get(md5) for md5 in candidates]
+        if any(sig.head is None for sig in sigs):
+            return True
+        head, tail = partial_digests(f, size)
+        return any(sig.head == head and sig.tail == tail for sig in sigs)
+
+    def with_delta(self, added, removed, version):
+        """New DB with a delta applied; self is left untouched.
+
+        Costs O(len(delta)), not O(len(self)): the result is an overlay
+        that shares this DB's tables.
+        """
+        return LayeredSignatureDB(self, added, removed, version)
+
+    @classmethod
+    def from_hashes(cls, hashes):
+        return cls(Signature(md5, None, None, None) for md5 in hashes)
+
+    @classmethod
+    def load(cls, path):
+        db = cls()
+        plain = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                # Fast path for bare MD5 lines, the bulk of a large feed
+                if len(line) <= 34 and (raw := raw_digest(line.strip())) is not None:
+                    plain.append(raw)
+                    continue
+                sig = parse_signature(line)
+                if sig is not None:
+                    db.add(sig)
+                elif (version := parse_version(line)) is not None:
+                    db.version = version
+        # Sized entries win over plain lines for the same digest
+        sized = {raw_digest(md5) for md5 in db.entries}
+        db.packed = DigestTable([raw for raw in plain if raw not in sized] + list(db.bare))
+        db.bare = set()
+        db.unsized = len(db.packed) + sum(sig.size is None for sig in db.entries.values())
+        return db
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# version {self.version}\n")
+            for sig in self.signatures():
+                f.write(format_signature(sig) + "\n")
+
+
+class LayeredSignatureDB(SignatureDB):
+    """Copy-on-write view: a shared base DB plus added and removed entries.
+
+    Readers of the base are never disturbed, so a running scan can keep
+    using the old DB while new scans pick up this one.  compact() folds
+    the layers into a plain SignatureDB when the overlay grows.
+    """
+
+    def __init__(self, base, added, removed, version):
+        if isinstance(base, LayeredSignatureDB):
+            # Merge into the existing overlay instead of stacking layers
+            merged_removed = (base.removed - {sig.md5 for sig in added}) | set(removed)
+            merged_added = [sig for sig in base.added.signatures() if sig.md5 not in removed]
+            merged_added += added
+            base, added, removed = base.base, merged_added, merged_removed
+        super().__init__(version=version)
+        self.base = base
+        self.added = SignatureDB(added)
+        # Removing and re-adding a digest replaces it
+        self.removed = {md5 for md5 in removed if md5 in base} | {
+            sig.md5 for sig in self.added.signatures() if sig.md5 in base}
+        self.unsized = (base.unsized + self.added.unsized
+                        - sum(1 for md5 in self.removed if base.get(md5).size is None))
+        self.count = len(base) - len(self.removed) + len(self.added)
+        del self.entries, self.by_size, self.packed, self.bare, self.dropped
+
+    def add(self, sig):
+        raise TypeError("LayeredSignatureDB is read-only; use with_delta()")
+
+    remove = add
+
+    def get(self, md5):
+        sig = self.added.get(md5)
+        if sig is None and md5 not in self.removed:
+            sig = self.base.get(md5)
+        return sig
+
+    def candidates(self, size):
+        base = self.base.candidates(size)
+        if self.removed:
+            base = [md5 for md5 in base if md5 not in self.removed]
+        added = self.added.candidates(size)
+        return [*base, *added] if added else base
+
+    def signatures(self):
+        for sig in self.base.signatures():
+            if sig.md5 not in self.removed:
+                yield sig
+        yield from self.added.signatures()
+
+    def __contains__(self, md5):
+        return md5 in self.added or (md5 not in self.removed and md5 in self.base)
+
+    def __len__(self):
+        return self.count
+
+    def lookup_many(self, digests):
+        # Only the overlay is checked per digest
+        found = self.base.lookup_many(digests)
+        if not self.added and not self.removed:
+            return found
+        return [digest in self.added or (hit and digest not in self.removed)
+                for digest, hit in zip(digests, found)]
+
+    def overlay_size(self):
+        return len(self.added) + len(self.removed)
+
+    def compact(self):
+        return SignatureDB(self.signatures(), self.version)
+
+
+if __name__ == "__main__":
+    # Append signatures for sample files: python signature_db.py DB sample...
+    if len(sys.argv) < 3:
+        print("usage: signature_db.py DB sample [sample...]")
+        sys.exit(2)
+    with open(sys.argv[1], "a", encoding="utf-8") as out:
+        for sample in sys.argv[2:]:
+            sig = signature_from_file(sample)
+            out.write(format_signature(sig) + "\n")
+            print(f"{sig.md5}  {sample}")
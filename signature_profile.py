@@ -0,0 +1,218 @@
+"""Load time, memory and lookup cost of the ways signatures can be held.
+
+    python signature_profile.py [--count 1000000] [--backends a,b,...]
+
+For a synthetic feed of --count MD5s, each backend is loaded in its own
+process and reported as JSON: load (import) seconds, resident memory
+added, memory per million signatures, and the cost of one `in` test and
+of one digest in a lookup_many() batch.
+
+Backends:
+    module           `malware_hashes = {...}` imported like virus_signatures
+    module_cached    the same import once its .pyc exists
+    hex_set          set of 32-char hex strings read from a text file
+    bytes_frozenset  frozenset of raw 16-byte digests
+    sorted_array     sorted raw digests in one bytes object, binary search
+    mmap             the same sorted file mapped instead of read
+    signature_db     SignatureDB, the scanner's default (raw digests)
+    engine           antivirus_scanner.load_signatures() with the feed as
+                     virus_signatures; the scanner itself is imported over an
+                     empty feed first, so its code is not counted
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import bisect
+import random
+import shutil
+import argparse
+import tempfile
+import importlib.machinery
+import py_compile
+import subprocess
+import types
+
+from signature_db import SignatureDB, raw_digest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BACKENDS = ("module", "module_cached", "hex_set", "bytes_frozenset", "sorted_array", "mmap",
+            "signature_db", "engine")
+QUERIES = 20000
+BATCH = 4096
+
+
+class SortedDigests:
+    """Sorted raw 16-byte digests in one buffer (bytes or mmap)."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.count = len(buf) // 16
+        self.array = numpy.frombuffer(buf, dtype="S16") if numpy is not None else None
+
+    def _at(self, i):
+        return self.buf[i * 16:i * 16 + 16]
+
+    def __contains__(self, md5):
+        raw = raw_digest(md5)
+        i = bisect.bisect_left(range(self.count), raw, key=self._at)
+        return i < self.count and self._at(i) == raw
+
+    def __len__(self):
+        return self.count
+
+    def lookup_many(self, digests):
+        if self.array is None or not self.count:
+            return [digest in self for digest in digests]
+        queries = numpy.array([raw_digest(digest) or b"" for digest in digests], dtype="S16")
+        found = self.array.searchsorted(queries)
+        found[found == self.count] = 0
+        return (self.array[found] == queries).tolist()
+
+
+# ---------------- Test data ----------------
+def generate(workdir, count, seed):
+    rng = random.Random(seed)
+    digests = [rng.randbytes(16) for _ in range(count)]
+    with open(os.path.join(workdir, "hashes.txt"), "w") as f:
+        f.writelines(raw.hex() + "\n" for raw in digests)
+    with open(os.path.join(workdir, "feed_module.py"), "w") as f:
+        f.write("malware_hashes = {\n")
+        f.writelines(f'    "{raw.hex()}",\n' for raw in digests)
+        f.write("}\n")
+    # What the engine backend imports in place of the installed feed
+    shutil.copy(os.path.join(workdir, "feed_module.py"), os.path.join(workdir, "virus_signatures.py"))
+    with open(os.path.join(workdir, "digests.bin"), "wb") as f:
+        f.write(b"".join(sorted(digests)))
+    # Half hits, half misses
+    queries = [raw.hex() for raw in rng.sample(digests, min(QUERIES // 2, count))]
+    queries += [rng.randbytes(16).hex() for _ in range(QUERIES - len(queries))]
+    rng.shuffle(queries)
+    with open(os.path.join(workdir, "queries.txt"), "w") as f:
+        f.writelines(q + "\n" for q in queries)
+
+
+# ---------------- Child: one backend ----------------
+def _rss():
+    # Current resident set; ru_maxrss (peak) where /proc is missing
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _load(backend, workdir):
+    hashes = os.path.join(workdir, "hashes.txt")
+    if backend in ("module", "module_cached"):
+        sys.path.insert(0, workdir)
+        import feed_module
+        return feed_module.malware_hashes
+    if backend == "hex_set":
+        with open(hashes) as f:
+            return {line.strip() for line in f}
+    if backend == "bytes_frozenset":
+        with open(hashes) as f:
+            return frozenset(bytes.fromhex(line.strip()) for line in f)
+    if backend == "sorted_array":
+        with open(os.path.join(workdir, "digests.bin"), "rb") as f:
+            return SortedDigests(f.read())
+    if backend == "mmap":
+        with open(os.path.join(workdir, "digests.bin"), "rb") as f:
+            return SortedDigests(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    if backend == "signature_db":
+        return SignatureDB.load(hashes)
+    if backend == "engine":
+        import antivirus_scanner
+        sys.path.insert(0, workdir)
+        return antivirus_scanner.load_signatures()
+    raise ValueError(f"unknown backend {backend!r}")
+
+
+def _child(backend, workdir):
+    with open(os.path.join(workdir, "queries.txt")) as f:
+        queries = [line.strip() for line in f]
+    if backend == "bytes_frozenset":
+        queries = [bytes.fromhex(q) for q in queries]
+    if backend == "engine":
+        empty = types.ModuleType("virus_signatures")
+        empty.__spec__ = importlib.machinery.ModuleSpec("virus_signatures", None)
+        empty.malware_hashes = set()
+        sys.modules["virus_signatures"] = empty
+        import antivirus_scanner
+    before = _rss()
+    start = time.perf_counter()
+    signatures = _load(backend, workdir)
+    load_seconds = time.perf_counter() - start
+    rss = _rss() - before
+
+    start = time.perf_counter()
+    hits = sum(q in signatures for q in queries)
+    lookup = (time.perf_counter() - start) / len(queries)
+
+    lookup_many = getattr(signatures, "lookup_many", None)
+    if lookup_many is None:
+        lookup_many = lambda batch: [q in signatures for q in batch]
+    start = time.perf_counter()
+    for i in range(0, len(queries), BATCH):
+        lookup_many(queries[i:i + BATCH])
+    batch = (time.perf_counter() - start) / len(queries)
+
+    json.dump({"count": len(signatures), "load_seconds": round(load_seconds, 4),
+               "rss_mb": round(rss / 2**20, 1), "hits": hits,
+               "lookup_ns": round(lookup * 1e9), "batch_ns_per_digest": round(batch * 1e9)},
+              sys.stdout)
+
+
+# ---------------- Parent ----------------
+def run_backend(backend, workdir):
+    # "module" times compiling the source, "module_cached" loading the .pyc
+    module = os.path.join(workdir, "feed_module.py")
+    if backend == "module":
+        shutil.rmtree(os.path.join(workdir, "__pycache__"), ignore_errors=True)
+    elif backend == "module_cached":
+        py_compile.compile(module)
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", backend, workdir],
+                          capture_output=True, text=True)
+    if proc.returncode:
+        return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    result = json.loads(proc.stdout)
+    if result["count"]:
+        result["mb_per_million"] = round(result["rss_mb"] * 1e6 / result["count"], 1)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile signature loading and lookup backends.")
+    parser.add_argument("--count", type=int, default=1000000, help="synthetic signatures")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--workdir", help="keep the generated feed here instead of a temp dir")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="av-sigprof-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        generate(workdir, args.count, args.seed)
+        results = {"count": args.count, "numpy": numpy is not None, "backends": {}}
+        for backend in args.backends.split(","):
+            results["backends"][backend] = run_backend(backend, workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        _child(sys.argv[2], sys.argv[3])
+    else:
+        sys.exit(main())
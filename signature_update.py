@@ -0,0 +1,267 @@
+"""Signature updates as delta files, with hot reload for running scanners.
+
+    python signature_update.py diff OLD_DB NEW_DB -o DELTA
+    python signature_update.py apply DB DELTA [DELTA...]
+    python signature_update.py status DB
+
+A delta moves a DB from one version to the next:
+
+    # signature delta
+    version 41 42
+    + <md5> <size> <head> <tail>
+    - <md5>
+
+apply rewrites the DB next to the old one and renames it into place, so
+readers see either the old or the new file.  Each applied delta is also
+kept in <DB>.d/<from-version>.delta; a running SignatureStore follows
+that chain and layers the changes over the DB it already has in memory
+instead of reloading millions of entries.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import threading
+from collections import namedtuple
+
+from signature_db import (SignatureDB, format_signature, parse_signature, parse_version,
+                          read_version)
+
+# Published deltas kept for scanners that are a few versions behind
+DELTA_HISTORY = 20
+# Overlay entries above which a running store folds the layers back
+# into a plain SignatureDB (in the background)
+COMPACT_ENTRIES = 100000
+WATCH_INTERVAL = 30
+
+Delta = namedtuple("Delta", "base version added removed")
+
+
+class SignatureUpdateError(Exception):
+    pass
+
+
+# ---------------- Delta files ----------------
+def read_delta(path):
+    base = version = None
+    added, removed = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            if fields[0] == "version" and len(fields) == 3:
+                base, version = int(fields[1]), int(fields[2])
+            elif fields[0] == "+":
+                added.append(parse_signature(line[1:]))
+            elif fields[0] == "-" and len(fields) == 2:
+                removed.add(fields[1].lower())
+            else:
+                raise SignatureUpdateError(f"{path}: bad delta line: {line.strip()!r}")
+    if version is None:
+        raise SignatureUpdateError(f"{path}: missing version line")
+    return Delta(base, version, added, removed)
+
+
+def write_delta(path, delta):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# signature delta\n")
+        f.write(f"version {delta.base} {delta.version}\n")
+        for md5 in sorted(delta.removed):
+            f.write(f"- {md5}\n")
+        for sig in delta.added:
+            f.write(f"+ {format_signature(sig)}\n")
+
+
+def diff_databases(old_path, new_path):
+    old, new = SignatureDB.load(old_path), SignatureDB.load(new_path)
+    version = new.version if new.version > old.version else old.version + 1
+    added = [sig for sig in new.signatures() if old.get(sig.md5) != sig]
+    removed = {sig.md5 for sig in old.signatures() if sig.md5 not in new}
+    return Delta(old.version, version, added, removed)
+
+
+# ---------------- Applying to the DB file ----------------
+def delta_dir(db_path):
+    return f"{db_path}.d"
+
+
+def _publish(db_path, delta_path, delta, keep):
+    directory = delta_dir(db_path)
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, f"{delta.base}.delta")
+    shutil.copyfile(delta_path, f"{target}.tmp")
+    os.replace(f"{target}.tmp", target)
+    published = sorted((entry for entry in os.scandir(directory) if entry.name.endswith(".delta")),
+                       key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in published[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def apply_delta(db_path, delta_path, keep=DELTA_HISTORY):
+    """Apply a delta file to the DB at db_path and publish it; returns the Delta."""
+    delta = read_delta(delta_path)
+    current = read_version(db_path) if os.path.exists(db_path) else 0
+    if delta.base != current:
+        raise SignatureUpdateError(
+            f"{delta_path} updates version {delta.base} but {db_path} is at version {current}")
+    replaced = delta.removed | {sig.md5 for sig in delta.added}
+    tmp = f"{db_path}.tmp"
+    # Stream the old file so the update never holds the whole DB in memory
+    with open(tmp, "w", encoding="utf-8") as out:
+        out.write(f"# version {delta.version}\n")
+        if os.path.exists(db_path):
+            with open(db_path, encoding="utf-8") as src:
+                for line in src:
+                    sig = parse_signature(line)
+                    if sig is None:
+                        if parse_version(line) is None:
+                            out.write(line)
+                    elif sig.md5 not in replaced:
+                        out.write(line)
+        for sig in delta.added:
+            out.write(format_signature(sig) + "\n")
+        out.flush()
+        os.fsync(out.fileno())
+    # Publish before the rename: a store that sees the new version must
+    # find the delta that leads to it
+    _publish(db_path, delta_path, delta, keep)
+    os.replace(tmp, db_path)
+    return delta
+
+
+# ---------------- Hot reload ----------------
+class SignatureStore:
+    """Holds the current SignatureDB and swaps in updates as they appear.
+
+    refresh() checks the DB file's version.  When the published deltas
+    lead from the loaded version to the new one they are layered over
+    the loaded DB (copy-on-write, O(delta)); otherwise the file is
+    reloaded in a background thread.  Either way `db` is replaced in a
+    single assignment, so a scan holding the old DB finishes with it
+    while new scans use the new one.
+    """
+
+    def __init__(self, path, load=SignatureDB.load, on_swap=None):
+        self.path = path
+        self.load = load
+        self.on_swap = on_swap
+        self.lock = threading.Lock()
+        self.busy = False           # background reload or compaction running
+        self.db = load(path)
+
+    def _swap(self, db):
+        self.db = db
+        if self.on_swap is not None:
+            self.on_swap(db)
+
+    def _delta_chain(self, base, version):
+        chain = []
+        while base != version:
+            try:
+                delta = read_delta(os.path.join(delta_dir(self.path), f"{base}.delta"))
+            except (OSError, SignatureUpdateError):
+                return None
+            if delta.base != base or delta.version <= base or len(chain) > DELTA_HISTORY:
+                return None
+            chain.append(delta)
+            base = delta.version
+        return chain
+
+    def refresh(self):
+        """Returns True if a newer DB was swapped in by this call."""
+        try:
+            version = read_version(self.path)
+        except OSError:
+            return False
+        with self.lock:
+            db = self.db
+            if version == db.version or self.busy:
+                return False
+            chain = self._delta_chain(db.version, version)
+            if chain is None:
+                self._background(self._reload)
+                return False
+            for delta in chain:
+                db = db.with_delta(delta.added, delta.removed, delta.version)
+            self._swap(db)
+            if db.overlay_size() > COMPACT_ENTRIES:
+                self._background(self._compact, db)
+            return True
+
+    def _background(self, target, *args):
+        self.busy = True
+        threading.Thread(target=self._run, args=(target,) + args, daemon=True).start()
+
+    def _run(self, target, *args):
+        try:
+            target(*args)
+        except Exception as e:
+            print(f"Signature reload failed: {e}", file=sys.stderr)
+        finally:
+            with self.lock:
+                self.busy = False
+
+    def _reload(self):
+        db = self.load(self.path)
+        with self.lock:
+            self._swap(db)
+
+    def _compact(self, layered):
+        db = layered.compact()
+        with self.lock:
+            # Drop the result if another update went in meanwhile
+            if self.db is layered:
+                self._swap(db)
+
+    def watch(self, interval=WATCH_INTERVAL):
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+        threading.Thread(target=loop, daemon=True).start()
+        return self
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and apply signature delta updates.")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    diff = sub.add_parser("diff", help="write the delta that turns OLD into NEW")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("-o", "--output", required=True)
+    apply = sub.add_parser("apply", help="apply deltas to DB in order")
+    apply.add_argument("db")
+    apply.add_argument("deltas", nargs="+")
+    status = sub.add_parser("status", help="print the DB version and published deltas")
+    status.add_argument("db")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.mode == "diff":
+            delta = diff_databases(args.old, args.new)
+            write_delta(args.output, delta)
+            print(f"version {delta.base} -> {delta.version}: "
+                  f"+{len(delta.added)} -{len(delta.removed)}")
+        elif args.mode == "apply":
+            for path in args.deltas:
+                delta = apply_delta(args.db, path)
+                print(f"{path}: version {delta.base} -> {delta.version}")
+        else:
+            print(f"version {read_version(args.db)}")
+            if os.path.isdir(delta_dir(args.db)):
+                for name in sorted(os.listdir(delta_dir(args.db))):
+                    print(f"  {name}")
+    except (OSError, SignatureUpdateError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import threading
+
+# Import this module first so T0 is as close to process start as possible
+T0 = time.perf_counter()
+
+# When set, apps print their startup marks as JSON and quit once ready
+REPORT_ENV = "AV_STARTUP_REPORT"
+
+
+def load_engine():
+    # Importing the scanner loads virus_signatures and the signature DB;
+    # the watcher swaps in signature updates while the app runs
+    import antivirus_scanner
+    antivirus_scanner.signature_store.watch()
+    return antivirus_scanner
+
+
+def load_psutil():
+    import psutil
+    psutil.cpu_percent(interval=None)   # prime the counter for later calls
+    return psutil
+
+
+class BackgroundLoader:
+    """Run slow imports off the Tk thread and record startup milestones.
+
+    Tk is not thread-safe, so the UI learns about completion by polling
+    from its own event loop (when_ready) rather than from the thread.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = tasks              # name -> callable
+        self.results = {}
+        self.errors = {}
+        self.marks = {}
+        self.paint_marks = set()
+        self.done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        for name, task in self.tasks.items():
+            try:
+                self.results[name] = task()
+            except Exception as e:
+                self.errors[name] = e
+            self.mark(f"loaded_{name}")
+        self.done.set()
+
+    def get(self, name):
+        return self.results.get(name)
+
+    def mark(self, name):
+        self.marks.setdefault(name, round(time.perf_counter() - T0, 4))
+
+    def mark_on_paint(self, widget, name):
+        # The first <Map> plus an idle pass means the window has been drawn
+        def mapped(_event):
+            widget.after_idle(lambda: self.mark(name))
+        self.paint_marks.add(name)
+        widget.bind("<Map>", mapped, add="+")
+
+    def when_ready(self, widget, callback, interval=50):
+        if not self.done.is_set():
+            widget.after(interval, lambda: self.when_ready(widget, callback, interval))
+            return
+        self.mark("scan_ready")
+        callback()
+        if os.environ.get(REPORT_ENV):
+            widget.after_idle(lambda: self._report_and_quit(widget))
+
+    def _report_and_quit(self, widget, tries=80):
+        # Give windows shown by the ready callback a chance to be drawn
+        if tries and not self.paint_marks <= self.marks.keys():
+            widget.after(25, lambda: self._report_and_quit(widget, tries - 1))
+            return
+        report = dict(self.marks)
+        report["errors"] = {name: str(e) for name, e in self.errors.items()}
+        print(json.dumps(report))
+        sys.stdout.flush()
+        widget.winfo_toplevel().destroy()
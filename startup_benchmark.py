@@ -0,0 +1,58 @@
+"""Measure Tk front-end startup: time to first paint and to scan-ready.
+
+    python startup_benchmark.py [--runs 5] [reflector.py lian.py ...]
+
+Each app is started with AV_STARTUP_REPORT=1, prints its startup marks
+(seconds since startup.py was imported) and quits.  Needs a display.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+from startup import REPORT_ENV
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_APPS = ("reflector.py", "lian.py")
+
+
+def run_once(app, timeout):
+    env = dict(os.environ, **{REPORT_ENV: "1"})
+    proc = subprocess.run([sys.executable, os.path.join(HERE, app)], env=env, cwd=HERE,
+                          capture_output=True, text=True, timeout=timeout)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"{app} exited with {proc.returncode} without a report: {proc.stderr.strip()[-300:]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Tk front-end startup.")
+    parser.add_argument("apps", nargs="*", default=DEFAULT_APPS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for app in args.apps:
+        try:
+            runs = [run_once(app, args.timeout) for _ in range(args.runs)]
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            results[app] = {"error": str(e)}
+            continue
+        marks = sorted({k for run in runs for k, v in run.items() if isinstance(v, (int, float))})
+        results[app] = {
+            mark: {"median": round(statistics.median(r[mark] for r in runs if mark in r), 4),
+                   "max": max(r[mark] for r in runs if mark in r)}
+            for mark in marks
+        }
+        results[app]["runs"] = len(runs)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return 1 if any("error" in r for r in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,450 @@
+"""What runs at boot and login on Linux, and what it costs.
+
+    python startup_items.py [--top N] [--refresh]
+    python startup_items.py disable ID
+
+Items come from enabled systemd units (system and user *.wants
+directories), XDG autostart entries, @reboot cron lines and programs
+that shell rc files or rc.local start in the background.
+
+Boot cost comes from `systemd-analyze blame`; without a systemd bus the
+journal's job start/finish messages of this boot give the same per-unit
+times.  Memory is the unit's cgroup usage, or for the other kinds the
+resident memory of running processes with the item's program name.
+Timings are cached per boot id, so later runs in one boot do not call
+systemd again, and every run is diffed against the previous one.
+
+Disabling uses the mechanism each source provides: systemctl disable, a
+Hidden=true override in ~/.config/autostart, or commenting out the line
+with a DISABLED_MARK prefix so it can be restored by hand.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import shlex
+import argparse
+import subprocess
+from collections import namedtuple
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "lian", "startup.json")
+DISABLED_MARK = "#lian-disabled# "
+# Ranking weighs a MB of resident memory like this many ms of boot time
+MS_PER_MB = 5
+# Cost changes smaller than this are not reported between runs
+CHANGE_RATIO = 0.2
+COMMAND_TIMEOUT = 20
+
+SYSTEM_UNIT_DIRS = ["/etc/systemd/system"]
+USER_UNIT_DIRS = [os.path.expanduser("~/.config/systemd/user")]
+AUTOSTART_DIRS = ["/etc/xdg/autostart", os.path.expanduser("~/.config/autostart")]
+CRON_FILES = ["/etc/crontab"] + sorted(glob.glob("/etc/cron.d/*"))
+RC_FILES = ["/etc/rc.local"] + [os.path.expanduser(f"~/{name}") for name in
+                                (".profile", ".bash_profile", ".bashrc", ".zshrc", ".xprofile", ".xinitrc")]
+
+# kind: systemd, autostart, cron or rc; line is 1-based for cron and rc
+StartupItem = namedtuple("StartupItem", "id kind name scope source line command boot_ms memory_kb")
+Analysis = namedtuple("Analysis", "items changes timing_source")
+
+
+# ---------------- Enumeration ----------------
+def systemd_units():
+    """(name, scope, wants symlink) for every enabled unit."""
+    units = {}
+    for scope, dirs in (("system", SYSTEM_UNIT_DIRS), ("user", USER_UNIT_DIRS)):
+        for base in dirs:
+            for link in sorted(glob.glob(os.path.join(base, "*.wants", "*"))):
+                name = os.path.basename(link)
+                if name.endswith((".service", ".socket", ".timer", ".mount", ".path")):
+                    units.setdefault((name, scope), link)
+    return [(name, scope, link) for (name, scope), link in units.items()]
+
+
+def _desktop_entry(path):
+    entry = {}
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            section = None
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    section = line
+                elif section == "[Desktop Entry]" and "=" in line and not line.startswith("#"):
+                    key, _, value = line.partition("=")
+                    entry.setdefault(key.strip(), value.strip())
+    except OSError:
+        pass
+    return entry
+
+
+def autostart_entries():
+    """(file name, path, Exec) of the active entries; a user entry of the
+    same name overrides the system one."""
+    active = {}
+    for base in AUTOSTART_DIRS:
+        for path in sorted(glob.glob(os.path.join(base, "*.desktop"))):
+            active[os.path.basename(path)] = (path, _desktop_entry(path))
+    entries = []
+    for name, (path, entry) in sorted(active.items()):
+        if entry.get("Hidden", "").lower() == "true":
+            continue
+        if entry.get("X-GNOME-Autostart-enabled", "true").lower() == "false":
+            continue
+        entries.append((name, path, entry.get("Exec", "")))
+    return entries
+
+
+def _user_crontabs():
+    # Debian keeps them in crontabs/, Red Hat directly in /var/spool/cron
+    paths = glob.glob("/var/spool/cron/crontabs/*") + glob.glob("/var/spool/cron/*")
+    return sorted(p for p in paths if os.path.isfile(p))
+
+
+def cron_reboot_lines():
+    """(path, line number, command) of @reboot jobs."""
+    found = []
+    for path in CRON_FILES + _user_crontabs():
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        system = path in CRON_FILES     # these have a user field
+        for i, line in enumerate(lines, 1):
+            fields = line.split(None, 2 if system else 1)
+            if fields and fields[0] == "@reboot" and len(fields) > 1:
+                found.append((path, i, fields[-1]))
+    return found
+
+
+# A command sent to the background: "prog args &", nohup/setsid prog ...
+_BACKGROUND = re.compile(r"^\s*(?:(?:nohup|setsid|exec)\s+\S|.*[^&]&\s*(?:disown\s*)?$)")
+
+
+def rc_hooks():
+    """(path, line number, command) of programs rc files start in the
+    background, and every command of an executable rc.local."""
+    found = []
+    for path in RC_FILES:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        whole = path == "/etc/rc.local" and os.access(path, os.X_OK)
+        for i, line in enumerate(lines, 1):
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#") or stripped in ("exit 0", "fi", "done"):
+                continue
+            if whole or _BACKGROUND.match(line):
+                found.append((path, i, stripped))
+    return found
+
+
+def program_name(command):
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        words = command.split()
+    for word in words:
+        # skip env assignments and wrappers in front of the program
+        if "=" in word.split("/")[0] or word in ("env", "nohup", "setsid", "exec", "sh", "bash", "-c"):
+            continue
+        return os.path.basename(word)
+    return ""
+
+
+# ---------------- Costs ----------------
+def boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+_BLAME_UNITS = {"h": 3600000, "min": 60000, "s": 1000, "ms": 1, "us": 0.001, "µs": 0.001}
+_BLAME_PART = re.compile(r"([\d.]+)(h|min|ms|us|µs|s)$")
+
+
+def parse_blame(text):
+    """unit -> ms from `systemd-analyze blame` output."""
+    times = {}
+    for line in text.splitlines():
+        words = line.split()
+        ms, i = 0.0, 0
+        while i < len(words) - 1 and (m := _BLAME_PART.match(words[i])):
+            ms += float(m.group(1)) * _BLAME_UNITS[m.group(2)]
+            i += 1
+        if i and i == len(words) - 1:
+            times[words[-1]] = ms
+    return times
+
+
+# systemd's "Starting ..." and "Started ..." job messages
+_JOB_STARTING = "7d4958e842da4a758f6c1cdc7b36dcc5"
+_JOB_DONE = "39f53479d3a045ac8e11786248231fbf"
+
+
+def parse_journal(text):
+    """unit -> ms from `journalctl -o json` job messages of systemd."""
+    starting, times = {}, {}
+    for line in text.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        unit = record.get("UNIT") or record.get("USER_UNIT")
+        stamp = record.get("__MONOTONIC_TIMESTAMP")
+        if not unit or not stamp:
+            continue
+        if record.get("MESSAGE_ID") == _JOB_STARTING:
+            starting[unit] = int(stamp)
+        elif record.get("MESSAGE_ID") == _JOB_DONE and unit in starting:
+            times[unit] = (int(stamp) - starting.pop(unit)) / 1000
+    return times
+
+
+def _run(argv):
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=COMMAND_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def boot_timings():
+    """(unit -> ms, source name); empty when neither source is usable."""
+    text = _run(["systemd-analyze", "blame", "--no-pager"])
+    if text and (times := parse_blame(text)):
+        return times, "systemd-analyze"
+    text = _run(["journalctl", "-b", "-o", "json", "--no-pager",
+                 "--output-fields=UNIT,USER_UNIT,MESSAGE_ID", f"MESSAGE_ID={_JOB_STARTING}",
+                 f"MESSAGE_ID={_JOB_DONE}"])
+    if text and (times := parse_journal(text)):
+        return times, "journal"
+    return {}, "none"
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def unit_memory_kb(name, scope):
+    if scope == "system":
+        paths = [f"/sys/fs/cgroup/system.slice/{name}/memory.current",
+                 f"/sys/fs/cgroup/memory/system.slice/{name}/memory.usage_in_bytes"]
+    else:
+        paths = glob.glob(f"/sys/fs/cgroup/user.slice/user-{os.getuid()}.slice/*/*.slice/{name}/memory.current")
+    for path in paths:
+        if (value := _read_int(path)) is not None:
+            return value // 1024
+    return None
+
+
+def process_memory():
+    """program name -> resident KB summed over its running processes."""
+    rss = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        if "VmRSS" not in fields:
+            continue            # kernel thread
+        kb = int(fields["VmRSS"].split()[0])
+        name = fields["Name"].strip()
+        rss[name] = rss.get(name, 0) + kb
+    return rss
+
+
+# ---------------- Analysis ----------------
+def score(item):
+    return (item.boot_ms or 0) + (item.memory_kb or 0) / 1024 * MS_PER_MB
+
+
+def collect(timings):
+    items = []
+    procs = process_memory()
+    for name, scope, link in systemd_units():
+        items.append(StartupItem(f"systemd:{scope}:{name}", "systemd", name, scope, link, None, "",
+                                 timings.get(name), unit_memory_kb(name, scope)))
+    for name, path, command in autostart_entries():
+        program = program_name(command)
+        items.append(StartupItem(f"autostart:{name}", "autostart", name, "user", path, None, command,
+                                 None, procs.get(program[:15])))
+    for kind, found in (("cron", cron_reboot_lines()), ("rc", rc_hooks())):
+        for path, line, command in found:
+            program = program_name(command)
+            items.append(StartupItem(f"{kind}:{path}:{line}", kind, program or command[:40],
+                                     "user" if path.startswith(os.path.expanduser("~")) else "system",
+                                     path, line, command, None, procs.get(program[:15])))
+    items.sort(key=score, reverse=True)
+    return items
+
+
+def diff(old, new):
+    """[(change, item)] with change 'added', 'removed' or 'costlier'/'cheaper'
+    when the score moved by more than CHANGE_RATIO."""
+    changes = []
+    for item_id, item in new.items():
+        before = old.get(item_id)
+        if before is None:
+            changes.append(("added", item))
+            continue
+        a, b = score(before), score(item)
+        if max(a, b) and abs(b - a) / max(a, b) > CHANGE_RATIO:
+            changes.append(("costlier" if b > a else "cheaper", item))
+    changes += [("removed", item) for item_id, item in old.items() if item_id not in new]
+    return changes
+
+
+def _load_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def analyze(cache_path=CACHE_PATH, refresh=False):
+    """Analysis of the current startup items, ranked by score; boot
+    timings are reused from the cache within one boot unless refresh."""
+    cache = _load_cache(cache_path)
+    boot = boot_id()
+    if not refresh and cache.get("boot_id") == boot and "timings" in cache:
+        timings, source = cache["timings"], cache.get("timing_source", "cache")
+    else:
+        timings, source = boot_timings()
+    items = collect(timings)
+    # Items cached by a version with other fields are not compared
+    fields = set(StartupItem._fields)
+    old = {i["id"]: StartupItem(**i) for i in cache.get("items", [])
+           if isinstance(i, dict) and i.keys() == fields}
+    changes = diff(old, {item.id: item for item in items})
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp = f"{cache_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"boot_id": boot, "timings": timings, "timing_source": source,
+                   "saved": time.time(), "items": [item._asdict() for item in items]}, f)
+    os.replace(tmp, cache_path)
+    return Analysis(items, changes, source)
+
+
+# ---------------- Disabling ----------------
+def _comment_out(path, line):
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines(keepends=True)
+    if lines[line - 1].startswith(DISABLED_MARK):
+        return
+    lines[line - 1] = DISABLED_MARK + lines[line - 1]
+    tmp = f"{path}.lian-tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.chmod(tmp, os.stat(path).st_mode)
+    os.replace(tmp, path)
+
+
+def _hidden(text):
+    # text with Hidden=true in its [Desktop Entry] section, set or
+    # replaced, or None if it has no such section
+    lines = text.splitlines(keepends=True)
+    section, header, found = None, None, False
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith("["):
+            section = stripped
+            if section == "[Desktop Entry]" and header is None:
+                header = i
+        elif section == "[Desktop Entry]" and "=" in stripped and not stripped.startswith("#"):
+            if stripped.partition("=")[0].strip() == "Hidden":
+                lines[i] = "Hidden=true" + line[len(line.rstrip("\r\n")):]
+                found = True
+    if header is None:
+        return None
+    if not found:
+        end = lines[header][len(lines[header].rstrip("\r\n")):]
+        if not end:
+            lines[header] += "\n"
+        lines.insert(header + 1, "Hidden=true" + (end or "\n"))
+    return "".join(lines)
+
+
+def disable(item):
+    """Turn the item off for the next boot or login; -> (ok, message)."""
+    if item.kind == "systemd":
+        argv = ["systemctl"] + (["--user"] if item.scope == "user" else []) + ["disable", item.name]
+        try:
+            result = subprocess.run(argv, capture_output=True, text=True, timeout=COMMAND_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return False, str(e)
+        return result.returncode == 0, (result.stderr or result.stdout).strip() or f"disabled {item.name}"
+    try:
+        if item.kind == "autostart":
+            # the XDG way: a user entry of the same name with Hidden=true
+            user_dir = AUTOSTART_DIRS[-1]
+            target = os.path.join(user_dir, item.name)
+            if os.path.dirname(item.source) == user_dir:
+                with open(target, encoding="utf-8", newline="") as f:
+                    text = _hidden(f.read())
+                if text is None:
+                    return False, f"{target} has no [Desktop Entry] section"
+            else:
+                os.makedirs(user_dir, exist_ok=True)
+                text = "[Desktop Entry]\nType=Application\nHidden=true\n"
+            with open(target, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            return True, f"hid {item.name} in {user_dir}"
+        if item.kind == "cron" and item.source in _user_crontabs():
+            return False, "edit user crontabs with crontab -e"
+        _comment_out(item.source, item.line)
+        return True, f"commented out {item.source}:{item.line}"
+    except OSError as e:
+        return False, str(e)
+
+
+# ---------------- CLI ----------------
+def _cost(item):
+    boot = f"{item.boot_ms:8.0f}ms" if item.boot_ms is not None else "         -"
+    memory = f"{item.memory_kb / 1024:7.1f}MB" if item.memory_kb is not None else "        -"
+    return f"{boot} {memory}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank and disable boot and login items.")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--refresh", action="store_true", help="re-read boot timings")
+    parser.add_argument("--cache", default=CACHE_PATH)
+    sub = parser.add_subparsers(dest="mode")
+    off = sub.add_parser("disable")
+    off.add_argument("id")
+    args = parser.parse_args(argv)
+
+    analysis = analyze(args.cache, args.refresh)
+    if args.mode == "disable":
+        item = next((i for i in analysis.items if i.id == args.id), None)
+        if item is None:
+            print(f"no startup item {args.id}")
+            return 2
+        ok, message = disable(item)
+        print(message)
+        return 0 if ok else 1
+    print(f"{len(analysis.items)} items, boot times from {analysis.timing_source}")
+    for item in analysis.items[:args.top]:
+        print(f"{_cost(item)}  {item.id}")
+    for change, item in analysis.changes:
+        print(f"{change:>8}: {item.id}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
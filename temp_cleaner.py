@@ -0,0 +1,219 @@
+"""Temp-file cleaner: rule-based, parallel across directories.
+
+    python temp_cleaner.py [DIR...] [--min-age HOURS] [--min-size KB] [--delete]
+
+Each directory is one task on a thread pool: it is opened once, listed
+with os.scandir on the directory fd and its files removed with
+os.unlink(name, dir_fd=fd), an unlinkat that never resolves the full
+path again.  Subdirectories become new tasks that open their directory
+by name relative to the parent's fd, with O_NOFOLLOW, so no path is
+resolved from the root again and a directory swapped for a symlink
+after the listing is not followed.  Each opened directory is checked
+with fstat to be on the filesystem the walk started on.
+
+A file goes when it is a regular file, old enough by both mtime and
+atime, inside the size bounds, matches an include pattern and no
+exclude pattern.  Without delete=True nothing is removed and the report
+lists what would be.  Progress goes to a callback at most every
+PROGRESS_INTERVAL seconds, from whichever worker thread is due.
+"""
+import os
+import sys
+import time
+import fnmatch
+import argparse
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+JOBS = min(8, (os.cpu_count() or 2) * 2)
+PROGRESS_INTERVAL = 0.1
+# Sockets, locks and per-service dirs that running programs still use
+EXCLUDE = (".X*-lock", ".X11-unix", ".ICE-unix", ".XIM-unix", ".font-unix", ".Test-unix",
+           "systemd-private-*", "snap-private-tmp", "*.lock", "*.pid", "*.sock")
+
+CleanRules = namedtuple("CleanRules", "min_age min_size max_size include exclude")
+# Files untouched for a day, any size, except the above
+DEFAULT_RULES = CleanRules(24 * 3600, 0, None, ("*",), EXCLUDE)
+
+
+def _matches(name, patterns):
+    return any(fnmatch.fnmatch(name, p) for p in patterns)
+
+
+class _Parent:
+    """A directory fd kept open until each subdirectory task has opened
+    its own directory relative to it."""
+
+    def __init__(self, fd, users):
+        self.fd = fd
+        self.users = users
+        self.lock = threading.Lock()
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            last = self.users == 0
+        if last:
+            os.close(self.fd)
+
+
+class TempCleaner:
+    """Usage:
+        cleaner = TempCleaner(delete=True, progress=print)
+        report = cleaner.run([tempfile.gettempdir()])
+    The report is a dict of counters; "paths" lists what was (or in a
+    dry run would be) removed.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, delete=False, jobs=JOBS, progress=None,
+                 interval=PROGRESS_INTERVAL):
+        self.rules = rules
+        self.delete = delete
+        self.jobs = jobs
+        self.progress = progress
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last_progress = 0.0
+        self.cancelled = threading.Event()
+        self.uid = os.getuid() if hasattr(os, "getuid") else None
+        self.report = {"dirs": 0, "dirs_seen": 0, "files": 0, "bytes": 0, "kept": 0,
+                       "errors": 0, "paths": []}
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _wanted(self, entry, st, now):
+        rules = self.rules
+        if self.uid is not None and st.st_uid != self.uid:
+            return False
+        if now - max(st.st_mtime, st.st_atime) < rules.min_age:
+            return False
+        if st.st_size < rules.min_size or (rules.max_size is not None and st.st_size > rules.max_size):
+            return False
+        return _matches(entry.name, rules.include) and not _matches(entry.name, rules.exclude)
+
+    def _open_dir(self, parent, name, path):
+        flags = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0)
+        if parent is None:
+            return os.open(path, flags)     # a root may itself be a symlink, like /tmp on macOS
+        try:
+            return os.open(name, flags | getattr(os, "O_NOFOLLOW", 0), dir_fd=parent.fd)
+        finally:
+            parent.release()
+
+    def _clean_dir(self, parent, name, path, dev):
+        # -> (_Parent or None, [(name, path, dev)] of subdirectories to walk next)
+        subdirs, removed, freed, kept, errors = [], [], 0, 0, 0
+        now = time.time()
+        try:
+            fd = self._open_dir(parent, name, path)
+        except OSError:
+            self._add(errors=1, dirs=1)
+            return None, []
+        try:
+            st = os.fstat(fd)
+            # mount points have the mounted filesystem's st_dev
+            if dev is None:
+                dev = st.st_dev
+            elif st.st_dev != dev:
+                os.close(fd)
+                self._add(dirs=1)
+                return None, []
+            with os.scandir(fd) as it:
+                for entry in it:
+                    if self.cancelled.is_set():
+                        break
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not _matches(entry.name, self.rules.exclude):
+                                subdirs.append((entry.name, os.path.join(path, entry.name)))
+                            continue
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                        if st.st_dev != dev or not self._wanted(entry, st, now):
+                            kept += 1
+                            continue
+                        if self.delete:
+                            os.unlink(entry.name, dir_fd=fd)
+                        removed.append(os.path.join(path, entry.name))
+                        freed += st.st_blocks * 512 if hasattr(st, "st_blocks") else st.st_size
+                    except OSError:
+                        errors += 1     # vanished, busy or not ours
+        except OSError:
+            errors += 1
+        self._add(dirs=1, dirs_seen=len(subdirs), files=len(removed), bytes=freed,
+                  kept=kept, errors=errors, paths=removed)
+        if not subdirs:
+            os.close(fd)
+            return None, []
+        return _Parent(fd, len(subdirs)), [(sub, subpath, dev) for sub, subpath in subdirs]
+
+    def _add(self, **counts):
+        with self.lock:
+            for key, n in counts.items():
+                self.report[key] += n
+            now = time.monotonic()
+            due = self.progress is not None and now - self.last_progress >= self.interval
+            if due:
+                self.last_progress = now
+                snapshot = {k: v for k, v in self.report.items() if k != "paths"}
+        if due:
+            self.progress(snapshot)
+
+    def run(self, roots):
+        roots = [os.path.abspath(r) for r in roots]
+        self.report["dirs_seen"] += len(roots)
+        with ThreadPoolExecutor(max(self.jobs, 1)) as pool:
+            pending = {pool.submit(self._clean_dir, None, None, root, None) for root in roots}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    parent, subdirs = future.result()
+                    for name, path, dev in subdirs:
+                        if self.cancelled.is_set():
+                            parent.release()
+                        else:
+                            pending.add(pool.submit(self._clean_dir, parent, name, path, dev))
+        if self.progress is not None:
+            self.progress({k: v for k, v in self.report.items() if k != "paths"})
+        return self.report
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove old temporary files (dry run by default).")
+    parser.add_argument("dirs", nargs="*", default=[tempfile.gettempdir()])
+    parser.add_argument("--min-age", type=float, default=DEFAULT_RULES.min_age / 3600, help="hours")
+    parser.add_argument("--min-size", type=int, default=0, help="KB")
+    parser.add_argument("--max-size", type=int, help="KB")
+    parser.add_argument("--include", action="append", help="name pattern (default: all)")
+    parser.add_argument("--exclude", action="append", default=[], help="extra name pattern to keep")
+    parser.add_argument("--delete", action="store_true", help="really remove the files")
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS)
+    parser.add_argument("-v", "--verbose", action="store_true", help="list the files")
+    args = parser.parse_args(argv)
+
+    rules = CleanRules(args.min_age * 3600, args.min_size * 1024,
+                       args.max_size * 1024 if args.max_size is not None else None,
+                       tuple(args.include or ("*",)), EXCLUDE + tuple(args.exclude))
+    report = TempCleaner(rules, args.delete, args.jobs).run(args.dirs)
+    if args.verbose:
+        print("\n".join(report["paths"]))
+    verb = "removed" if args.delete else "would remove"
+    print(f"{verb} {report['files']} files, {format_bytes(report['bytes'])} in {report['dirs']} dirs; "
+          f"kept {report['kept']}, {report['errors']} errors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
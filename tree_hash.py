@@ -0,0 +1,188 @@
+"""Chunked tree hashes for huge files (disk images, VM disks, dumps).
+
+    python tree_hash.py hash FILE [-j N]
+    python tree_hash.py add INDEX FILE [--name NAME] [--root-only]
+    python tree_hash.py match INDEX FILE [FILE...]
+
+A file is cut into fixed-size chunks that worker threads read with
+os.pread and hash with MD5 concurrently (hashlib releases the GIL), so
+one file is hashed on every core at disk bandwidth.  The root digest is
+the MD5 of the chunk digests in order.  When the classic MD5 is needed
+too, the same buffers are fed to it in order as the chunks come in, so
+the file is still read once.
+
+A TreeIndex file lists known roots, each next to its classic MD5, and
+fingerprints of single infected chunks:
+
+    # chunk size 8388608
+    root <root> <md5 or -> [name]
+    chunk <chunk md5> [name]
+"""
+import os
+import sys
+import hashlib
+import argparse
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 8 * 1024 * 1024
+JOBS = os.cpu_count() or 2
+# Files from this size up are tree-hashed by the scanner
+MIN_SIZE = 256 * 1024 * 1024
+
+TreeHash = namedtuple("TreeHash", "root chunk_size chunks")
+
+
+def _pread_full(fd, n, offset):
+    # pread may return less than asked even on regular files
+    parts = []
+    while n:
+        data = os.pread(fd, n, offset)
+        if not data:
+            break
+        parts.append(data)
+        n -= len(data)
+        offset += len(data)
+    return parts[0] if len(parts) == 1 else b"".join(parts)
+
+
+def hash_tree(fd, size, chunk_size=CHUNK_SIZE, jobs=JOBS, consume=None):
+    """TreeHash of the first size bytes of an open file descriptor.
+
+    consume, if given, is called with every chunk's bytes in file order.
+    At most jobs + 1 chunks are in memory at once.
+    """
+    def work(i):
+        data = _pread_full(fd, chunk_size, i * chunk_size)
+        return hashlib.md5(data).digest(), data if consume is not None else None
+
+    count = max(1, -(-size // chunk_size))
+    digests = []
+    with ThreadPoolExecutor(max(jobs, 1)) as pool:
+        pending = deque()
+        submitted = 0
+        while submitted < count or pending:
+            while submitted < count and len(pending) <= jobs:
+                pending.append(pool.submit(work, submitted))
+                submitted += 1
+            digest, data = pending.popleft().result()
+            digests.append(digest)
+            if consume is not None:
+                consume(data)
+    return TreeHash(hashlib.md5(b"".join(digests)).hexdigest(), chunk_size,
+                    [digest.hex() for digest in digests])
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE, jobs=JOBS, classic=False):
+    """(TreeHash, classic MD5 or None) of the file at path."""
+    md5 = hashlib.md5() if classic else None
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        tree = hash_tree(fd, os.fstat(fd).st_size, chunk_size, jobs, md5.update if classic else None)
+    finally:
+        os.close(fd)
+    return tree, md5.hexdigest() if classic else None
+
+
+class TreeIndex:
+    """Known tree roots and infected-chunk fingerprints for one chunk size."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.roots = {}             # root -> (classic md5 or None, name)
+        self.chunks = {}            # chunk md5 -> name
+
+    def __len__(self):
+        return len(self.roots) + len(self.chunks)
+
+    def add(self, tree, md5=None, name="", chunks=True):
+        if tree.chunk_size != self.chunk_size:
+            raise ValueError(f"tree uses {tree.chunk_size}-byte chunks, index {self.chunk_size}")
+        self.roots[tree.root] = (md5, name)
+        if chunks:
+            for digest in tree.chunks:
+                self.chunks.setdefault(digest, name)
+
+    def hits(self, file_path, tree):
+        """Hit strings: the path itself for a known root, else one per
+        infected chunk with its offset."""
+        if tree.root in self.roots:
+            return [file_path]
+        return [f"{file_path} (chunk {i} at {i * tree.chunk_size}: {self.chunks[digest] or digest})"
+                for i, digest in enumerate(tree.chunks) if digest in self.chunks]
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.split(None, 3)
+                if fields[:3] == ["#", "chunk", "size"]:
+                    index.chunk_size = int(fields[3])
+                elif not fields or fields[0].startswith("#"):
+                    continue
+                elif fields[0] == "root" and len(fields) >= 3:
+                    md5 = None if fields[2] == "-" else fields[2].lower()
+                    index.roots[fields[1].lower()] = (md5, fields[3].strip() if len(fields) > 3 else "")
+                elif fields[0] == "chunk" and len(fields) >= 2:
+                    name = line.split(None, 2)[2].strip() if len(fields) > 2 else ""
+                    index.chunks[fields[1].lower()] = name
+                else:
+                    raise ValueError(f"{path}: bad line: {line.strip()!r}")
+        return index
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"# chunk size {self.chunk_size}\n")
+            for root, (md5, name) in self.roots.items():
+                f.write(f"root {root} {md5 or '-'} {name}".rstrip() + "\n")
+            for digest, name in self.chunks.items():
+                f.write(f"chunk {digest} {name}".rstrip() + "\n")
+        os.replace(tmp, path)
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel chunked hashing of huge files.")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    h = sub.add_parser("hash", help="print the classic MD5, tree root and chunk digests")
+    h.add_argument("file")
+    h.add_argument("--chunk-mb", type=int, default=CHUNK_SIZE // 2**20)
+    add = sub.add_parser("add", help="add a sample's root and chunk fingerprints to an index")
+    add.add_argument("index")
+    add.add_argument("file")
+    add.add_argument("--name")
+    add.add_argument("--root-only", action="store_true", help="don't index the single chunks")
+    match = sub.add_parser("match")
+    match.add_argument("index")
+    match.add_argument("files", nargs="+")
+    for p in (h, add, match):
+        p.add_argument("-j", "--jobs", type=int, default=JOBS)
+    args = parser.parse_args(argv)
+
+    if args.mode == "hash":
+        tree, md5 = hash_file(args.file, args.chunk_mb * 2**20, args.jobs, classic=True)
+        print(f"md5  {md5}\nroot {tree.root}\nchunks {len(tree.chunks)} x {tree.chunk_size}")
+        for i, digest in enumerate(tree.chunks):
+            print(f"  {i} {digest}")
+    elif args.mode == "add":
+        index = TreeIndex.load(args.index) if os.path.exists(args.index) else TreeIndex()
+        tree, md5 = hash_file(args.file, index.chunk_size, args.jobs, classic=True)
+        index.add(tree, md5, args.name or os.path.basename(args.file), chunks=not args.root_only)
+        index.save(args.index)
+        print(f"{args.file}: root {tree.root}, {len(tree.chunks)} chunks")
+    else:
+        index = TreeIndex.load(args.index)
+        status = 0
+        for path in args.files:
+            tree, _ = hash_file(path, index.chunk_size, args.jobs)
+            hits = index.hits(path, tree)
+            status = status or bool(hits)
+            print("\n".join(hits) if hits else f"{path}: clean")
+        return int(status)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())